@@ -137,4 +137,117 @@
       setTheme(getPreferredTheme());
     }
   });
-})();
\ No newline at end of file
+})();
+
+// Search suggestions
+// See words_app/templates/words_app/partials/_search.html
+(() => {
+  'use strict';
+
+  const searchForm = document.getElementById('basic-search-form');
+  if (!searchForm) {
+    return;
+  }
+
+  const searchInput = searchForm.querySelector('.search-input');
+  const suggestionsList = document.getElementById('search-suggestions');
+  // Wait until the user stops typing before fetching suggestions
+  const debounceDelay = 150;
+  let debounceTimer;
+  let controller;
+
+  const showSuggestions = suggestions => {
+    suggestionsList.replaceChildren(...suggestions.map(suggestion => {
+      const option = document.createElement('option');
+      option.value = suggestion;
+      return option;
+    }));
+  };
+
+  searchInput.addEventListener('input', () => {
+    clearTimeout(debounceTimer);
+    const query = searchInput.value.trim();
+    if (!query) {
+      showSuggestions([]);
+      return;
+    }
+
+    debounceTimer = setTimeout(() => {
+      // Cancel the previous request if it is still running
+      if (controller) {
+        controller.abort();
+      }
+      controller = new AbortController();
+
+      fetch(`${searchForm.dataset.suggestUrl}?q=${encodeURIComponent(query)}`,
+            { signal: controller.signal })
+        .then(response => response.ok ? response.json() : { suggestions: [] })
+        .then(data => showSuggestions(data.suggestions))
+        .catch(() => {});
+    }, debounceDelay);
+  });
+})();
+
+// Advanced search word counts
+// See words_app/templates/words_app/index.html
+(() => {
+  'use strict';
+
+  const advancedSearchForm = document.getElementById('advanced-search-form');
+  if (!advancedSearchForm) {
+    return;
+  }
+
+  const facetsContainer = document.getElementById('search-facets');
+  // Wait until the user stops typing before fetching the counts
+  const debounceDelay = 250;
+  let debounceTimer;
+  let controller;
+
+  const facetLine = (label, counts) => {
+    const line = document.createElement('p');
+    line.className = 'mb-1';
+    line.textContent = `${label}: ${counts.join(' · ') || 'none'}`;
+    return line;
+  };
+
+  const showFacets = facets => {
+    const total = document.createElement('p');
+    total.className = 'mb-1 fw-bold';
+    total.textContent = `About ${facets.total.toLocaleString()} matching words`;
+    if (!facets.pattern_applied) {
+      total.textContent += ' (letter pattern not counted)';
+    }
+
+    facetsContainer.replaceChildren(
+      total,
+      facetLine('Letters', Object.entries(facets.letters)
+        .map(([letters, count]) => `${letters}: ${count}`)),
+      facetLine('Syllables', Object.entries(facets.syllables)
+        .map(([syllables, count]) => `${syllables}: ${count}`)),
+      facetLine('Frequency', facets.frequency
+        .filter(bucket => bucket.count)
+        .map(bucket => `${bucket.min}-${bucket.max}: ${bucket.count}`)),
+    );
+  };
+
+  const fetchFacets = () => {
+    // Cancel the previous request if it is still running
+    if (controller) {
+      controller.abort();
+    }
+    controller = new AbortController();
+
+    const params = new URLSearchParams(new FormData(advancedSearchForm));
+    fetch(`${advancedSearchForm.dataset.facetsUrl}?${params}`,
+          { signal: controller.signal })
+      .then(response => response.ok ? response.json() : null)
+      .then(facets => facets && showFacets(facets))
+      .catch(() => {});
+  };
+
+  advancedSearchForm.addEventListener('input', () => {
+    clearTimeout(debounceTimer);
+    debounceTimer = setTimeout(fetchFacets, debounceDelay);
+  });
+})();
@@ -1,5 +1,13 @@
 from django.contrib import admin
-from .models import FavouriteWord
+from .models import FavouriteWord, Job, WordOfDay
 
 # Register your models here.
 admin.site.register(FavouriteWord)
+admin.site.register(WordOfDay)
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    """Shows the background jobs, their status and how long they took"""
+    list_display = ('name', 'status', 'run_at', 'attempts', 'duration')
+    list_filter = ('status', 'name')
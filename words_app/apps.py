@@ -1,6 +1,16 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
 
 
 class WordsAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'words_app'
+
+    def ready(self) -> None:
+        """
+        Applies the SQLite PRAGMAs to every new connection and registers
+        the background jobs
+        """
+        from .database import set_sqlite_pragmas
+        from . import tasks  # noqa: F401
+        connection_created.connect(set_sqlite_pragmas)
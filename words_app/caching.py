@@ -0,0 +1,185 @@
+"""
+Contains the stale-while-revalidate cache used for WordsAPI data
+
+Each entry has a soft and a hard expiry time. Until the soft expiry the
+cached value is fresh and simply returned. Between the soft and the
+hard expiry the value is stale: it is still returned straight away, and
+one background thread, or a background job queued with 'refresh_later',
+fetches a new value. Only once the hard expiry has passed does a
+request wait for WordsAPI
+
+If a background refresh fails, the stale value is kept for longer
+instead of being dropped, so a WordsAPI outage does not empty the pages
+"""
+# words_app/caching.py
+
+import logging
+import threading
+import time
+from typing import Any, Callable
+from django.core.cache import cache
+from django.db import connections
+from . import constants
+
+logger = logging.getLogger(__name__)
+
+
+def _store(key: str, value: Any, fresh_for: float, stale_for: float) -> None:
+    """
+    Caches a value with its soft and hard expiry times
+
+    Parameters
+    ----------
+    key: str
+        The cache key
+    value: Any
+        The value to cache
+    fresh_for: float
+        The number of seconds until the value goes stale
+    stale_for: float
+        The number of seconds the stale value is kept after that
+    """
+
+    now = time.time()
+    entry = {
+        'value': value,
+        'fresh_until': now + fresh_for,
+        'stale_until': now + fresh_for + stale_for,
+        }
+    cache.set(key, entry, timeout=int(fresh_for + stale_for) + 1)
+
+
+def _refresh(key: str,
+             fetch: Callable[[], Any],
+             is_valid: Callable[[Any], bool],
+             fresh_for: float,
+             stale_for: float,
+             entry: dict) -> None:
+    """
+    Fetches a new value for a stale entry. Run in a background thread
+
+    On failure the stale value is kept for another
+    'constants.STALE_CACHE_EXTENSION' seconds and the refresh lock is
+    left to expire, so WordsAPI is not retried on every request
+    """
+
+    lock_key = f'{key}_refreshing'
+    try:
+        try:
+            value = fetch()
+        except Exception:
+            logger.exception('Refreshing %s failed', key)
+            value = None
+
+        if value is not None and is_valid(value):
+            _store(key, value, fresh_for, stale_for)
+            cache.delete(lock_key)
+            return
+
+        logger.warning('Keeping stale %s after a failed refresh', key)
+        entry['stale_until'] = max(
+            entry['stale_until'],
+            time.time() + constants.STALE_CACHE_EXTENSION
+            )
+        cache.set(key,
+                  entry,
+                  timeout=int(entry['stale_until'] - time.time()) + 1)
+    finally:
+        # Threads get their own database connections, which Django
+        # only closes at the end of a request
+        connections.close_all()
+
+
+def cached_fetch(key: str,
+                 fetch: Callable[[], Any],
+                 fresh_for: float,
+                 stale_for: float,
+                 is_valid: Callable[[Any], bool] = bool,
+                 refresh_later: Callable[[], Any] | None = None) -> Any:
+    """
+    Returns the cached value for a key, fetching it with 'fetch' when
+    it is missing or past its hard expiry. A stale value is returned
+    straight away while one background thread refreshes it, or
+    'refresh_later' queues its refresh
+
+    Parameters
+    ----------
+    key: str
+        The cache key
+    fetch: Callable[[], Any]
+        Fetches a new value, e.g., from WordsAPI
+    fresh_for: float
+        The number of seconds a new value is fresh for
+    stale_for: float
+        The number of seconds a value may be served stale after that
+    is_valid: Callable[[Any], bool]
+        Checks that a fetched value should be cached. Defaults to
+        checking that it is not empty
+    refresh_later: Callable[[], Any] | None
+        Queues the refresh of a stale value, e.g., as a background job
+        that calls 'refresh_cached'. A thread refreshes it if None
+
+    Returns
+    ----------
+    The cached or fetched value
+    """
+
+    entry = cache.get(key)
+    now = time.time()
+
+    # Anything else was cached before entries had expiry times
+    if isinstance(entry, dict) and 'fresh_until' in entry:
+        if now < entry['fresh_until']:
+            return entry['value']
+
+        if now < entry['stale_until']:
+            # cache.add only succeeds for one request, so only one
+            # refresh runs at a time across all the server processes
+            if cache.add(f'{key}_refreshing',
+                         True,
+                         timeout=constants.CACHE_REFRESH_LOCK_TIMEOUT):
+                if refresh_later is not None:
+                    refresh_later()
+                    return entry['value']
+                threading.Thread(
+                    target=_refresh,
+                    args=(key, fetch, is_valid, fresh_for, stale_for, entry),
+                    daemon=True
+                    ).start()
+            return entry['value']
+
+    return refresh_cached(key, fetch, fresh_for, stale_for, is_valid)
+
+
+def refresh_cached(key: str,
+                   fetch: Callable[[], Any],
+                   fresh_for: float,
+                   stale_for: float,
+                   is_valid: Callable[[Any], bool] = bool) -> Any:
+    """
+    Fetches a new value for a key and caches it if it is valid, whether
+    or not the cached value is still fresh. Used to warm the cache
+
+    Parameters
+    ----------
+    key: str
+        The cache key
+    fetch: Callable[[], Any]
+        Fetches a new value, e.g., from WordsAPI
+    fresh_for: float
+        The number of seconds a new value is fresh for
+    stale_for: float
+        The number of seconds a value may be served stale after that
+    is_valid: Callable[[Any], bool]
+        Checks that a fetched value should be cached
+
+    Returns
+    ----------
+    The fetched value
+    """
+
+    value = fetch()
+    if is_valid(value):
+        _store(key, value, fresh_for, stale_for)
+
+    return value
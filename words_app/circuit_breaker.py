@@ -0,0 +1,208 @@
+"""
+Contains the circuit breaker used around WordsAPI calls
+
+When WordsAPI is failing or slow, every call to it holds a worker for
+up to the request timeout, which stalls the whole site. The circuit
+breaker watches the outcome of recent calls and, once too many of them
+failed or were slow, opens: calls then fail straight away, so the views
+fall back to cached or partial data. After a while the breaker half
+opens and lets one probe call through. If the probe succeeds the
+breaker closes again, otherwise it stays open
+
+The breaker state is kept per server process
+"""
+# words_app/circuit_breaker.py
+
+import threading
+import time
+from collections import deque
+from .metrics import metrics
+
+
+class CircuitOpenError(Exception):
+    """Raised when a call is refused because the breaker is open"""
+
+
+class CircuitBreaker:
+    """
+    Tracks the recent calls to a service and refuses new calls while
+    the service is unhealthy
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self,
+                 name: str,
+                 failure_threshold: int = 5,
+                 slow_call_seconds: float = 3,
+                 window: int = 20,
+                 reset_timeout: float = 30) -> None:
+        """
+        Parameters
+        ----------
+        name: str
+            The name of the service, used in the metrics
+        failure_threshold: int
+            The number of failed or slow calls among the recent calls
+            that opens the breaker
+        slow_call_seconds: float
+            Calls that take longer than this count as failed
+        window: int
+            The number of recent calls looked at
+        reset_timeout: float
+            The number of seconds the breaker stays open before a probe
+            call is let through
+        """
+
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.slow_call_seconds = slow_call_seconds
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        # True for each recent call that failed or was slow
+        self._outcomes = deque(maxlen=window)
+        self._state = self.CLOSED
+        self._opened_at = 0.0
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        """
+        Returns the state of the breaker, moving from open to half open
+        once the reset timeout has passed
+        """
+
+        with self._lock:
+            if (self._state == self.OPEN
+                    and time.monotonic() - self._opened_at
+                    >= self.reset_timeout):
+                self._state = self.HALF_OPEN
+            return self._state
+
+    def allow_request(self) -> bool:
+        """
+        Returns whether a call may be made now. While half open, only
+        one probe call is allowed at a time
+        """
+        return self._admit() is not None
+
+    def _admit(self) -> str | None:
+        """
+        Returns the state a call is allowed in, or None if it is refused
+        """
+
+        state = self.state
+        with self._lock:
+            if state == self.CLOSED:
+                return state
+            if state == self.HALF_OPEN and not self._probing:
+                self._probing = True
+                return state
+
+        metrics.add('circuit_breaker', self.name, rejected_calls=1)
+        return None
+
+    def record(self, succeeded: bool, seconds: float) -> None:
+        """
+        Records the outcome of a call and opens or closes the breaker
+
+        Parameters
+        ----------
+        succeeded: bool
+            Whether the call returned a valid response
+        seconds: float
+            How long the call took
+        """
+
+        slow = seconds > self.slow_call_seconds
+        failed = not succeeded or slow
+        metrics.add('circuit_breaker',
+                    self.name,
+                    calls=1,
+                    failed_calls=int(not succeeded),
+                    slow_calls=int(slow),
+                    seconds=seconds)
+
+        with self._lock:
+            if self._probing:
+                self._probing = False
+                self._outcomes.clear()
+                if failed:
+                    self._open()
+                else:
+                    self._state = self.CLOSED
+                return
+
+            self._outcomes.append(failed)
+            if (self._state == self.CLOSED
+                    and sum(self._outcomes) >= self.failure_threshold):
+                self._open()
+
+    def _open(self) -> None:
+        """Opens the breaker. Called with the lock held"""
+
+        self._state = self.OPEN
+        self._opened_at = time.monotonic()
+        metrics.add('circuit_breaker', self.name, times_opened=1)
+
+    def call(self, function, *args, is_success=None, ignore=(), **kwargs):
+        """
+        Calls a function through the breaker
+
+        Parameters
+        ----------
+        function: Callable
+            The function making the call to the service
+        args, kwargs
+            Passed to the function
+        is_success: Callable | None
+            Checks the value returned. Any value counts as a success if
+            None. Exceptions count as failures, except those in 'ignore'
+        ignore: tuple
+            The exception types raised by the function before it calls
+            the service, e.g., when the user is throttled. They are not
+            recorded, and a probe call raising one lets another probe
+            through
+
+        Returns
+        ----------
+        What the function returns
+
+        Raises
+        ----------
+        CircuitOpenError
+            If the breaker is open
+        """
+
+        state = self._admit()
+        if state is None:
+            raise CircuitOpenError(f'{self.name} is unavailable')
+
+        start = time.monotonic()
+        try:
+            result = function(*args, **kwargs)
+        except ignore:
+            if state == self.HALF_OPEN:
+                with self._lock:
+                    self._probing = False
+            raise
+        except Exception:
+            self.record(False, time.monotonic() - start)
+            raise
+
+        self.record(is_success is None or is_success(result),
+                    time.monotonic() - start)
+        return result
+
+    def status(self) -> dict:
+        """Returns the state and settings of the breaker"""
+
+        return {
+            'state': self.state,
+            'recent_failures': sum(self._outcomes),
+            'failure_threshold': self.failure_threshold,
+            'slow_call_seconds': self.slow_call_seconds,
+            'reset_timeout': self.reset_timeout,
+            }
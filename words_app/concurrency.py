@@ -0,0 +1,197 @@
+"""
+Contains the adaptive concurrency limit used around WordsAPI calls
+
+When many requests call WordsAPI at the same time, each call gets
+slower, so the worker threads stay blocked for longer and even more
+calls pile up. The limiter caps the number of calls in flight and
+adjusts the cap to the latency it observes (AIMD, as in TCP congestion
+control):
+
+- the lowest latency of the calls of the last 'latency_window' seconds
+  is taken as what a call costs when WordsAPI is not overloaded. It is
+  taken over a time rather than a number of calls, so a long run of
+  slow calls cannot raise it
+- a call that completes within 'latency_tolerance' times that floor
+  while the limit was being used raises the limit by 1 / limit, i.e.,
+  by about 1 for each round of calls
+- a slower call lowers the limit by 'backoff_ratio'. Only calls started
+  after the last decrease can lower it again, so a burst of slow calls
+  counts once
+
+Calls over the limit wait for a free slot until a deadline and are then
+shed, so the views fall back to cached or local data instead of holding
+a worker thread. The limit is kept per server process
+"""
+# words_app/concurrency.py
+
+import threading
+import time
+from collections import deque
+from .metrics import metrics
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    Limits the number of calls in flight to a service, adapting the
+    limit to the observed latency
+    """
+
+    # Number of parts the latency window is split into
+    latency_buckets = 6
+
+    def __init__(self,
+                 name: str,
+                 initial_limit: int = 8,
+                 min_limit: int = 1,
+                 max_limit: int = 32,
+                 latency_tolerance: float = 2,
+                 backoff_ratio: float = 0.9,
+                 latency_window: float = 60,
+                 queue_timeout: float = 2) -> None:
+        """
+        Parameters
+        ----------
+        name: str
+            The name of the service, used in the metrics
+        initial_limit: int
+            The number of calls allowed in flight at the start
+        min_limit: int
+            The lowest the limit can go
+        max_limit: int
+            The highest the limit can go
+        latency_tolerance: float
+            Calls taking more than this many times the latency floor
+            count as a sign of overload
+        backoff_ratio: float
+            What the limit is multiplied by on overload
+        latency_window: float
+            The number of seconds the latency floor is taken over
+        queue_timeout: float
+            The number of seconds a call waits for a free slot before
+            it is shed
+        """
+
+        self.name = name
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_tolerance = latency_tolerance
+        self.backoff_ratio = backoff_ratio
+        self.latency_window = latency_window
+        self.queue_timeout = queue_timeout
+        self._condition = threading.Condition()
+        self._limit = float(initial_limit)
+        self._in_flight = 0
+        # (start time, lowest latency) of each part of the latency window
+        self._floor_buckets = deque()
+        self._last_decrease = 0.0
+
+    @property
+    def limit(self) -> int:
+        """Returns the number of calls currently allowed in flight"""
+        return max(self.min_limit, int(self._limit))
+
+    def acquire(self, timeout: float | None = None) -> bool:
+        """
+        Takes a slot for a call, waiting for one to be free until the
+        deadline
+
+        Parameters
+        ----------
+        timeout: float | None
+            The number of seconds to wait. Defaults to 'queue_timeout'
+
+        Returns
+        ----------
+        True if a slot was taken and must be given back with 'release',
+        False if the call should be shed
+        """
+
+        start = time.monotonic()
+        deadline = start + (self.queue_timeout if timeout is None
+                            else timeout)
+
+        with self._condition:
+            while self._in_flight >= self.limit:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    metrics.add('concurrency_limiter', self.name,
+                                shed_calls=1)
+                    return False
+                self._condition.wait(remaining)
+            self._in_flight += 1
+
+        metrics.add('concurrency_limiter',
+                    self.name,
+                    calls=1,
+                    queued_seconds=time.monotonic() - start)
+        return True
+
+    def release(self, seconds: float | None) -> None:
+        """
+        Gives back the slot of a finished call and adjusts the limit
+
+        Parameters
+        ----------
+        seconds: float | None
+            How long the call took, or None if it never reached the
+            service, e.g., because the circuit breaker was open. Such
+            calls do not change the limit
+        """
+
+        with self._condition:
+            if seconds is not None:
+                self._adjust(seconds)
+            self._in_flight -= 1
+            self._condition.notify_all()
+
+    def _adjust(self, seconds: float) -> None:
+        """Adjusts the limit to a call's latency. Called with the lock"""
+
+        now = time.monotonic()
+        floor = self._record_latency(seconds, now)
+
+        if seconds > floor * self.latency_tolerance:
+            if now - seconds >= self._last_decrease:
+                self._limit = max(self.min_limit,
+                                  self._limit * self.backoff_ratio)
+                self._last_decrease = now
+                metrics.add('concurrency_limiter', self.name, decreases=1)
+        # Only raise the limit if it is being used, or it would grow
+        # without bound while traffic is light
+        elif self._in_flight >= self._limit / 2:
+            self._limit = min(self.max_limit, self._limit + 1 / self._limit)
+
+    def _record_latency(self, seconds: float, now: float) -> float:
+        """
+        Records a call's latency and returns the latency floor. The
+        window is split into 'latency_buckets' parts, of which only the
+        lowest latency is kept. Called with the lock held
+        """
+
+        bucket_seconds = self.latency_window / self.latency_buckets
+        if (not self._floor_buckets
+                or now - self._floor_buckets[-1][0] >= bucket_seconds):
+            self._floor_buckets.append((now, seconds))
+        else:
+            start, lowest = self._floor_buckets[-1]
+            self._floor_buckets[-1] = (start, min(lowest, seconds))
+
+        while now - self._floor_buckets[0][0] > self.latency_window:
+            self._floor_buckets.popleft()
+
+        return min(lowest for _, lowest in self._floor_buckets)
+
+    def status(self) -> dict:
+        """Returns the limit, the calls in flight and the latency floor"""
+
+        with self._condition:
+            return {
+                'limit': self.limit,
+                'in_flight': self._in_flight,
+                'latency_floor_seconds': min(
+                    (lowest for _, lowest in self._floor_buckets),
+                    default=None
+                    ),
+                'min_limit': self.min_limit,
+                'max_limit': self.max_limit,
+                }
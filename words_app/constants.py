@@ -5,3 +5,127 @@ Defines constant values used throughout the app
 
 NUM_OF_PRO_RESULTS = "2000"
 NUM_OF_PLUS_RESULTS = "200"
+
+# Number of favourite words read from or written to the database at a
+# time when exporting or importing a user's favourites
+FAVOURITE_WORDS_BATCH_SIZE = 500
+
+# Number of words suggested while typing in the search box
+NUM_OF_SUGGESTIONS = 8
+
+# Maximum number of letter edits between a misspelled word and the
+# words suggested for it
+SPELLING_MAX_DISTANCE = 2
+
+# Maximum number of synonym links followed to find related words
+THESAURUS_MAX_HOPS = 2
+
+# Number of related words shown for a word
+NUM_OF_RELATED_WORDS = 30
+
+# Number of seconds before the thesaurus graph is reloaded from the
+# database to pick up newly recorded words
+THESAURUS_GRAPH_MAX_AGE = 300
+
+# Number of words a process remembers queuing for the thesaurus, so a
+# word looked up again is not queued again before the graph is reloaded
+THESAURUS_QUEUED_WORDS = 10000
+
+# Number of rhymes shown on the games page
+NUM_OF_RHYMES = 50
+
+# Number of seconds the results of an advanced search are fresh for
+SEARCH_RESULTS_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Number of seconds stale search results are still shown, while they
+# are refreshed in the background, after they stop being fresh
+SEARCH_RESULTS_STALE_TIMEOUT = 60 * 60 * 24 * 6
+
+# Number of seconds yesterday's word of the day is still shown after
+# midnight, while the new one is fetched in the background
+WORD_OF_DAY_STALE_TIMEOUT = 60 * 60
+
+# Number of seconds a stale cache entry is kept for when refreshing it
+# fails, e.g., because WordsAPI is down
+STALE_CACHE_EXTENSION = 60 * 10
+
+# Number of seconds before a failed cache refresh can be retried
+CACHE_REFRESH_LOCK_TIMEOUT = 60
+
+# Number of seconds between runs of the job deleting orphaned favourite
+# words
+CLEAN_FAVOURITE_WORDS_INTERVAL = 60 * 60 * 24
+
+# Number of seconds a running job's worker may go without a heartbeat
+# before the job is considered stuck and queued again
+JOB_TIMEOUT = 60 * 2
+
+# Number of seconds between runs of the job deleting finished jobs
+CLEAN_JOBS_INTERVAL = 60 * 60 * 24
+
+# Number of seconds between the heartbeats of a running job
+JOB_HEARTBEAT_INTERVAL = 30
+
+# Number of seconds finished and failed jobs are kept for, e.g., for the
+# job statistics in the metrics view
+JOB_RETENTION = 60 * 60 * 24 * 7
+
+# Number of seconds a worker waits before checking for due jobs again
+JOB_POLL_INTERVAL = 5
+
+# Number of days ahead the word of the day calendar is filled in for
+WORD_OF_DAY_CALENDAR_DAYS = 28
+
+# Number of random words fetched for a day of the calendar before
+# giving up, e.g., when the words fetched have no definitions
+WORD_OF_DAY_FETCH_ATTEMPTS = 5
+
+# Number of seconds between checks for a new lexicon snapshot file
+SNAPSHOT_CHECK_INTERVAL = 5
+
+# Number of word records saved at a time by the 'ingest_lexicon'
+# command
+INGEST_BATCH_SIZE = 1000
+
+# Edges of the frequency score buckets counted for the advanced search
+# form, from 1.5 to 8.5 in steps of 0.5. WordsAPI scores range from
+# about 1.74 to 8.03
+FACET_FREQUENCY_BINS = tuple(edge / 2 for edge in range(3, 18))
+
+# Number of WordsAPI calls a user of each group may cause in any
+# 'THROTTLE_WINDOW' seconds. Pages served from the cache are not counted
+THROTTLE_RATES = {
+    'Starter': 20,
+    'Plus': 60,
+    'Pro': 120,
+    }
+
+# Number of seconds of the sliding window the calls are counted over
+THROTTLE_WINDOW = 60
+
+# Number of seconds between deletions of the throttle counts of past
+# windows
+CLEAN_THROTTLE_WINDOWS_INTERVAL = 60 * 60
+
+# Maximum number of spans recorded for a traced request. Later spans
+# are counted but dropped
+TRACE_MAX_SPANS = 500
+
+# Number of characters of the SQL of a query kept in its span
+TRACE_MAX_SQL_LENGTH = 1000
+
+# Number of traces waiting to be posted to the OTLP collector before
+# new traces are dropped
+TRACE_EXPORT_QUEUE_SIZE = 100
+
+# Number of seconds to wait for the OTLP collector
+TRACE_EXPORT_TIMEOUT = 2
+
+# Number of functions listed in the report of a profiled request
+PROFILE_TOP_FUNCTIONS = 40
+
+# Number of words shown on the most favourited words page and API
+NUM_OF_MOST_FAVOURITED = 50
+
+# Number of seconds the most favourited words are cached for
+MOST_FAVOURITED_CACHE_TIMEOUT = 300
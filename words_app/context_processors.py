@@ -0,0 +1,32 @@
+"""
+Defines the context processors for the words app
+
+They add variables to the context of every template
+"""
+# words_app/context_processors.py
+
+from django.http import HttpRequest
+from .circuit_breaker import CircuitBreaker
+from .utils import words_api_breaker
+
+
+def words_api_status(request: HttpRequest) -> dict:
+    """
+    Adds whether WordsAPI is unavailable, in which case the pages are
+    shown with cached or partial data
+
+    Parameters
+    ----------
+    request: HttpRequest
+        Contains metadata about the request
+
+    Returns
+    ----------
+    Dictionary
+    """
+
+    return {
+        'words_api_degraded': (
+            words_api_breaker.state != CircuitBreaker.CLOSED
+            ),
+    }
@@ -0,0 +1,70 @@
+"""
+Contains the database set up used by the production database profile
+
+It includes a signal receiver that applies the SQLite PRAGMAs listed in
+each database's 'PRAGMAS' setting when a connection is opened, and a
+router that sends read queries to the read-only 'replica' connection
+and writes to the 'default' connection
+"""
+# words_app/database.py
+
+from django.db import connections
+from django.db.backends.base.base import BaseDatabaseWrapper
+
+
+def set_sqlite_pragmas(sender,
+                       connection: BaseDatabaseWrapper,
+                       **kwargs) -> None:
+    """
+    Runs the PRAGMA statements in the 'PRAGMAS' setting of a SQLite
+    database when a new connection to it is opened. Connected to the
+    'connection_created' signal in 'WordsAppConfig.ready'
+
+    Parameters
+    ----------
+    sender: type
+        The database wrapper class
+    connection: BaseDatabaseWrapper
+        The new database connection
+
+    Returns
+    ----------
+    None
+    """
+
+    if connection.vendor != 'sqlite':
+        return
+
+    pragmas = connection.settings_dict.get('PRAGMAS', {})
+    with connection.cursor() as cursor:
+        for pragma, value in pragmas.items():
+            cursor.execute(f'PRAGMA {pragma} = {value}')
+
+
+class ReadReplicaRouter:
+    """
+    Routes read queries to the 'replica' database and everything else
+    to the 'default' database
+
+    Reads inside a transaction on the 'default' database stay on it, so
+    they see the rows written earlier in the same transaction
+    """
+
+    def db_for_read(self, model, **hints) -> str:
+        """Returns the database to read a model from"""
+
+        if connections['default'].in_atomic_block:
+            return 'default'
+        return 'replica'
+
+    def db_for_write(self, model, **hints) -> str:
+        """Returns the database to write a model to"""
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints) -> bool:
+        """Both databases hold the same data, so any relation is allowed"""
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints) -> bool:
+        """Only runs migrations on the 'default' database"""
+        return db == 'default'
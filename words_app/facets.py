@@ -0,0 +1,307 @@
+"""
+Contains the facet counts shown by the advanced search form
+
+While the user fills in the advanced search form, the form shows how
+many lexicon words have each number of letters, each number of
+syllables and a frequency score in each bucket, for the search as it
+is so far. The counts come from the local lexicon, so they are an
+estimate of what WordsAPI will return, but they need no WordsAPI call
+
+The lexicon is kept as NumPy columns. When there is a lexicon snapshot
+(see words_app/snapshot.py), the columns are read straight from the
+mapped file, so no copy of them is made. Each filter of the search is a
+boolean mask over the columns and each facet is counted with
+'np.bincount' or 'np.histogram' over the words left by the masks
+
+A facet is counted without its own filters, e.g., the letter counts
+ignore 'lettersMin' and 'lettersMax', so the form shows what changing
+them would give
+"""
+# words_app/facets.py
+
+import re
+from bisect import bisect_left
+from functools import lru_cache
+from typing import Callable, Iterable
+import numpy as np
+from .lexicon import LexiconEntry, get_lexicon
+from .snapshot import LexiconSnapshot, get_lexicon_snapshot
+from . import constants
+
+# A letter pattern starting with letters that every match begins with,
+# in any case as the lexicon words are lowercase
+LITERAL_PREFIX = re.compile(r"\^([a-z' -]+)(?![*+?{|])", re.IGNORECASE)
+# A quantified group, e.g., '(a+)+', which can make a regular expression
+# take exponential time
+NESTED_QUANTIFIER = re.compile(r'\)[*+?{]')
+
+
+def parse_number(value, number_type: type) -> int | float | None:
+    """
+    Returns a search parameter as a number, or None if it is empty or
+    not a number
+    """
+
+    try:
+        return number_type(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def range_mask(column: np.ndarray,
+               minimum: float | None,
+               maximum: float | None) -> np.ndarray | None:
+    """
+    Returns the mask of the values in a column between a minimum and a
+    maximum, both included, or None if neither is set
+    """
+
+    mask = None
+    if minimum is not None:
+        mask = column >= minimum
+    if maximum is not None:
+        below = column <= maximum
+        mask = below if mask is None else mask & below
+    return mask
+
+
+def combine_masks(*masks: np.ndarray | None) -> np.ndarray | None:
+    """Returns the intersection of the masks that are set"""
+
+    combined = None
+    for mask in masks:
+        if mask is not None:
+            combined = mask if combined is None else combined & mask
+    return combined
+
+
+class FacetIndex:
+    """
+    Counts the lexicon words matching a partial advanced search by
+    number of letters, number of syllables and frequency bucket
+
+    The words are in alphabetical order, so the words matching a
+    pattern such as '^pre' are found with two binary searches and only
+    the rest of the pattern is matched word by word
+    """
+
+    def __init__(self,
+                 word: Callable[[int], str],
+                 letters: np.ndarray,
+                 syllables: np.ndarray,
+                 frequencies: np.ndarray) -> None:
+        """
+        Parameters
+        ----------
+        word: Callable[[int], str]
+            Returns the word at an index, in alphabetical order
+        letters: np.ndarray
+            The number of letters of each word
+        syllables: np.ndarray
+            The number of syllables of each word, 0 if unknown
+        frequencies: np.ndarray
+            The WordsAPI frequency score of each word, 0 if unknown
+        """
+
+        self._word = word
+        self.letters = letters
+        self.syllables = syllables
+        self.frequencies = frequencies
+
+    @classmethod
+    def from_snapshot(cls, snapshot: LexiconSnapshot) -> 'FacetIndex':
+        """Returns an index whose columns are views of a snapshot file"""
+
+        def column(name: str, dtype: str) -> np.ndarray:
+            return np.frombuffer(snapshot.buffer,
+                                 dtype=dtype,
+                                 count=len(snapshot),
+                                 offset=snapshot.offsets[name])
+
+        return cls(snapshot.word,
+                   column('letters', 'u1'),
+                   column('syllables', 'u1'),
+                   column('frequencies', '<f4'))
+
+    @classmethod
+    def from_entries(cls, entries: Iterable[LexiconEntry]) -> 'FacetIndex':
+        """Returns an index holding the lexicon entries in memory"""
+
+        entries = sorted(entries, key=lambda entry: entry.word)
+        words = [entry.word for entry in entries]
+        return cls(words.__getitem__,
+                   np.array([min(len(word), 255) for word in words],
+                            dtype='u1'),
+                   np.array([min(max(entry.syllables, 0), 255)
+                             for entry in entries], dtype='u1'),
+                   np.array([entry.frequency for entry in entries],
+                            dtype='<f4'))
+
+    def __len__(self) -> int:
+        """Returns the number of words in the index"""
+        return len(self.letters)
+
+    def _pattern_matches(self,
+                         pattern: str) -> tuple[slice, np.ndarray | None]:
+        """
+        Returns the positions of the words that may match a letter
+        pattern and, unless all of them do, the mask of those that do
+
+        Raises
+        ----------
+        re.error
+            If the pattern is not a valid regular expression, or could
+            take too long to match
+        """
+
+        if NESTED_QUANTIFIER.search(pattern):
+            raise re.error('Quantified groups are not supported')
+        # The pattern is not lowercased, as '\D' would become '\d'
+        regex = re.compile(pattern, re.IGNORECASE)
+
+        positions = slice(0, len(self))
+        # The prefix does not hold for every match of an alternation,
+        # e.g., '^ab|cd', so patterns with a '|' are searched in full
+        prefix_match = '|' not in pattern and LITERAL_PREFIX.match(pattern)
+        if prefix_match:
+            prefix = prefix_match.group(1).lower()
+            # The search for the end may start where the words begin
+            start = bisect_left(range(len(self)), prefix, key=self._word)
+            end = bisect_left(range(start, len(self)), prefix + '\U0010ffff',
+                              key=self._word) + start
+            positions = slice(start, end)
+            if prefix_match.end() == len(pattern):
+                return positions, None
+
+        matches = np.fromiter(
+            (regex.search(self._word(index)) is not None
+             for index in range(positions.start, positions.stop)),
+            dtype=bool,
+            count=positions.stop - positions.start
+            )
+        return positions, matches
+
+    def counts(self, query: dict) -> dict:
+        """
+        Counts the words matching a partial advanced search
+
+        Parameters
+        ----------
+        query: dict
+            The WordsAPI search parameters, as in 'CanonicalQuery'.
+            Parameters that are missing or not valid are ignored
+
+        Returns
+        ----------
+        Dictionary with the number of matching words ('total'), the
+        counts by number of letters ('letters') and of syllables
+        ('syllables') and the counts by frequency bucket ('frequency').
+        'pattern_applied' is False if the letter pattern could not be
+        used
+        """
+
+        pattern = (query.get('letterPattern') or '').strip()
+        positions = slice(0, len(self))
+        pattern_mask = None
+        pattern_applied = True
+        if pattern:
+            try:
+                positions, pattern_mask = self._pattern_matches(pattern)
+            except re.error:
+                pattern_applied = False
+
+        letters = self.letters[positions]
+        syllables = self.syllables[positions]
+        frequencies = self.frequencies[positions]
+
+        exact_letters = parse_number(query.get('letters'), int)
+        letters_mask = range_mask(
+            letters,
+            (exact_letters if exact_letters is not None
+             else parse_number(query.get('lettersmin'), int)),
+            (exact_letters if exact_letters is not None
+             else parse_number(query.get('lettersMax'), int))
+            )
+
+        exact_syllables = parse_number(query.get('syllables'), int)
+        syllables_mask = range_mask(
+            syllables,
+            (exact_syllables if exact_syllables is not None
+             else parse_number(query.get('syllablesMin'), int)),
+            (exact_syllables if exact_syllables is not None
+             else parse_number(query.get('syllablesMax'), int))
+            )
+        # Words of unknown length in syllables never match a filter on it
+        if syllables_mask is not None:
+            syllables_mask &= syllables > 0
+
+        frequency_mask = range_mask(
+            frequencies,
+            parse_number(query.get('frequencymin'), float),
+            parse_number(query.get('frequencymax'), float)
+            )
+        if frequency_mask is not None:
+            frequency_mask &= frequencies > 0
+
+        def select(column: np.ndarray, *masks) -> np.ndarray:
+            """Returns the values of a column left by the masks"""
+            mask = combine_masks(pattern_mask, *masks)
+            return column if mask is None else column[mask]
+
+        letter_counts = np.bincount(
+            select(letters, syllables_mask, frequency_mask)
+            )
+        syllable_counts = np.bincount(
+            select(syllables, letters_mask, frequency_mask)
+            )
+        frequency_counts, edges = np.histogram(
+            select(frequencies, letters_mask, syllables_mask),
+            bins=constants.FACET_FREQUENCY_BINS
+            )
+        total_mask = combine_masks(pattern_mask, letters_mask,
+                                   syllables_mask, frequency_mask)
+        total = (len(letters) if total_mask is None
+                 else int(np.count_nonzero(total_mask)))
+
+        return {
+            'total': total,
+            'letters': {int(value): int(count)
+                        for value, count in enumerate(letter_counts)
+                        if value and count},
+            # Words of unknown length in syllables are left out
+            'syllables': {int(value): int(count)
+                          for value, count in enumerate(syllable_counts)
+                          if value and count},
+            'frequency': [{'min': round(float(low), 2),
+                           'max': round(float(high), 2),
+                           'count': int(count)}
+                          for low, high, count in zip(edges, edges[1:],
+                                                      frequency_counts)],
+            'pattern_applied': pattern_applied,
+            }
+
+
+@lru_cache(maxsize=1)
+def _build_facet_index(snapshot: LexiconSnapshot | None) -> FacetIndex:
+    """Builds the facet index for a snapshot, or from the lexicon file"""
+
+    if snapshot is not None:
+        return FacetIndex.from_snapshot(snapshot)
+    return FacetIndex.from_entries(get_lexicon())
+
+
+def get_facet_index() -> FacetIndex:
+    """
+    Returns the facet index of the current lexicon snapshot, building
+    it again when the snapshot file is replaced
+
+    Parameters
+    ----------
+    None
+
+    Returns
+    ----------
+    FacetIndex
+    """
+
+    return _build_facet_index(get_lexicon_snapshot())
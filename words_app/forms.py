@@ -3,12 +3,17 @@ Defines the forms used for searching words within the website
 
 The 'BasicSearchForm' class encapsulates a single field for entering
 search queries. The 'AdvancedSearchForm' class
-provides additional fields for more specific search parameters.
+provides additional fields for more specific search parameters. The
+'ImportFavouriteWordsForm' class accepts a file of favourite words and
+the anagram and rhyme forms are used by the games page
 """
 # words_app/forms.py
 
 from django import forms
 from django.core.exceptions import ValidationError
+from django.core.validators import (FileExtensionValidator,
+                                    RegexValidator
+                                    )
 
 
 def validate_frequency(value) -> None:
@@ -65,12 +70,17 @@ class BasicSearchForm(forms.Form):
     entering a search query
     """
 
+    max_search_length = 60
+
     search = forms.CharField(
-        max_length=60,
+        max_length=max_search_length,
         widget=forms.TextInput(
             attrs={
                 'class': 'form-control search-input',
-                'placeholder': 'Search a word...'
+                'placeholder': 'Search a word...',
+                # Suggestions are added to this datalist by index.js
+                'list': 'search-suggestions',
+                'autocomplete': 'off'
                 }
             )
         )
@@ -202,3 +212,85 @@ class AdvancedSearchForm(forms.Form):
                 }
             )
     )
+
+
+class ImportFavouriteWordsForm(forms.Form):
+    """
+    Inherits from Django's Form class. It contains a single field for
+    uploading a CSV or JSON Lines file of favourite words
+    """
+
+    favourite_words_file = forms.FileField(
+        label="Import favourite words",
+        validators=[
+            FileExtensionValidator(allowed_extensions=['csv', 'json',
+                                                       'jsonl'])
+            ],
+        help_text="A CSV or JSON file exported from Word Wizards.",
+        widget=forms.ClearableFileInput(
+            attrs={
+                'class': 'form-control',
+                }
+            )
+        )
+
+
+class AnagramSolverForm(forms.Form):
+    """
+    Inherits from Django's Form class. It contains a single field for
+    entering a rack of letters to unscramble
+    """
+
+    letters = forms.CharField(
+        min_length=3,
+        max_length=15,
+        validators=[
+            RegexValidator(r'^[A-Za-z]+$', 'Enter letters only')
+            ],
+        help_text="Find every word that can be made from these letters.",
+        widget=forms.TextInput(
+            attrs={
+                'class': 'form-control',
+                'placeholder': 'Type letters here'
+                }
+            )
+        )
+
+
+class AnagramGuessForm(forms.Form):
+    """
+    Inherits from Django's Form class. It contains a single field for
+    guessing a word in the current anagram puzzle
+    """
+
+    guess = forms.CharField(
+        max_length=15,
+        widget=forms.TextInput(
+            attrs={
+                'class': 'form-control',
+                'placeholder': 'Type a word here'
+                }
+            )
+        )
+
+
+class RhymeForm(forms.Form):
+    """
+    Inherits from Django's Form class. It contains a single field for
+    entering a word to find rhymes for
+    """
+
+    rhyme = forms.CharField(
+        label="Word",
+        max_length=60,
+        validators=[
+            RegexValidator(r'^[A-Za-z]+$', 'Enter letters only')
+            ],
+        help_text="Find words that rhyme with this word.",
+        widget=forms.TextInput(
+            attrs={
+                'class': 'form-control',
+                'placeholder': 'Type a word here'
+                }
+            )
+        )
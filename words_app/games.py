@@ -0,0 +1,223 @@
+"""
+Contains the word game engines for the games page
+
+It includes an anagram index that solves anagram and unscramble
+(sub-anagram) queries for a rack of letters and generates new puzzles
+from the local lexicon
+"""
+# words_app/games.py
+
+import random
+import threading
+from collections import Counter, defaultdict
+from typing import Iterable
+from .lexicon import LexiconEntry
+from .snapshot import BackgroundIndex
+
+
+def letter_signature(letters: str) -> str:
+    """
+    Returns the letters sorted alphabetically. Words that are anagrams
+    of each other share the same signature
+
+    Parameters
+    ----------
+    letters: str
+        A word or a rack of letters
+
+    Returns
+    ----------
+    String
+    """
+
+    return ''.join(sorted(letters.lower()))
+
+
+def can_spell(word: str, letters: str) -> bool:
+    """
+    Checks if a word can be spelled using each letter of a rack at most
+    once, by comparing their letter counts
+
+    Parameters
+    ----------
+    word: str
+        The word to check
+    letters: str
+        The rack of letters
+
+    Returns
+    ----------
+    Boolean
+    """
+
+    return not Counter(word.lower()) - Counter(letters.lower())
+
+
+class AnagramIndex:
+    """
+    Maps each letter signature (sorted letters) to the words spelled
+    with exactly those letters, most frequent word first
+
+    Sub-anagrams of a rack are found by walking every distinct
+    combination of letter counts the rack allows (at most 2^10 for a
+    10 letter rack) and looking each signature up in the index. This
+    does not depend on the size of the lexicon
+    """
+
+    def __init__(self, entries: Iterable[LexiconEntry]) -> None:
+        """
+        Builds the index from the lexicon entries. Only words made up
+        entirely of letters are indexed
+
+        Parameters
+        ----------
+        entries: Iterable[LexiconEntry]
+            The lexicon entries to index
+        """
+
+        signatures = defaultdict(list)
+        for entry in entries:
+            if entry.word.isalpha():
+                signatures[letter_signature(entry.word)].append(entry)
+
+        self._signatures = {
+            signature: tuple(
+                entry.word for entry in
+                sorted(words, key=lambda entry: -entry.frequency)
+                )
+            for signature, words in signatures.items()
+            }
+        # Signatures grouped by length, used to pick puzzle words
+        self._lengths = defaultdict(list)
+        for signature in self._signatures:
+            self._lengths[len(signature)].append(signature)
+
+    def __len__(self) -> int:
+        """Returns the number of signatures in the index"""
+        return len(self._signatures)
+
+    def anagrams(self, letters: str) -> tuple[str, ...]:
+        """
+        Returns the words that use all of the letters exactly once
+
+        Parameters
+        ----------
+        letters: str
+            The rack of letters
+
+        Returns
+        ----------
+        Tuple of strings
+        """
+
+        return self._signatures.get(letter_signature(letters), ())
+
+    def sub_anagrams(self, letters: str, min_length: int = 3) -> list[str]:
+        """
+        Returns the words that can be spelled with some or all of the
+        letters, longest words first
+
+        Parameters
+        ----------
+        letters: str
+            The rack of letters
+        min_length: int
+            The minimum number of letters a word must have
+
+        Returns
+        ----------
+        List of strings
+        """
+
+        # Build every signature the rack allows by choosing how many of
+        # each distinct letter to use, keeping the letters sorted
+        candidates = ['']
+        for letter, count in sorted(Counter(letters.lower()).items()):
+            repeats = [letter * used for used in range(count + 1)]
+            candidates = [candidate + repeat
+                          for candidate in candidates
+                          for repeat in repeats]
+
+        signatures = self._signatures
+        found = [signatures[candidate] for candidate in candidates
+                 if len(candidate) >= min_length and candidate in signatures]
+
+        found.sort(key=lambda words: -len(words[0]))
+        return [word for words in found for word in words]
+
+    def generate_puzzle(self,
+                        length: int = 7,
+                        min_solutions: int = 5,
+                        attempts: int = 50) -> tuple[str, list[str]] | None:
+        """
+        Picks a random word with the given number of letters and
+        scrambles it into a new puzzle
+
+        Parameters
+        ----------
+        length: int
+            The number of letters in the puzzle
+        min_solutions: int
+            The minimum number of words the puzzle must have
+        attempts: int
+            How many random words to try before giving up
+
+        Returns
+        ----------
+        Tuple of the scrambled letters and the solutions, or None if no
+        suitable puzzle was found
+        """
+
+        seeds = self._lengths.get(length)
+        if not seeds:
+            return None
+
+        for signature in random.sample(seeds, min(attempts, len(seeds))):
+            solutions = self.sub_anagrams(signature)
+            if len(solutions) >= min_solutions:
+                letters = list(signature)
+                random.shuffle(letters)
+                return ''.join(letters), solutions
+
+        return None
+
+
+# The anagram index of this process
+_anagram_index = BackgroundIndex('anagram', AnagramIndex)
+
+
+def warm_anagram_index() -> threading.Thread:
+    """
+    Starts building the anagram index of the current lexicon snapshot in
+    a background thread, unless it is built or being built
+
+    Parameters
+    ----------
+    None
+
+    Returns
+    ----------
+    threading.Thread
+        The thread building the index
+    """
+
+    return _anagram_index.warm()
+
+
+def get_anagram_index() -> AnagramIndex | None:
+    """
+    Returns the anagram index if it has been built. Otherwise starts
+    building it in the background and returns None, so no request waits
+    for it. When the snapshot file is replaced, the old index is
+    returned until the new one is built
+
+    Parameters
+    ----------
+    None
+
+    Returns
+    ----------
+    AnagramIndex | None
+    """
+
+    return _anagram_index.get()
@@ -0,0 +1,227 @@
+"""
+Contains the readers and validation used to ingest WordsAPI dumps
+
+A dump is either a JSON array of word records or a JSON Lines file with
+one record per line. The records have the same shape as the WordsAPI
+word data used by 'process_word_data'. Both kinds of file are read one
+record at a time, so memory use does not grow with the size of the dump
+"""
+# words_app/ingest.py
+
+import json
+from typing import Iterator, TextIO
+from .models import LexiconWord
+
+# Number of characters read from a JSON array dump at a time
+READ_CHUNK_SIZE = 64 * 1024
+# Number of characters of a JSON array item read before it is treated
+# as invalid, so a broken item does not make the rest of the dump be
+# read into memory
+MAX_ITEM_SIZE = 1024 * 1024
+# The characters that may follow an item in a JSON array
+ITEM_DELIMITERS = frozenset(' \t\r\n,]')
+
+
+def iter_json_array(dump: TextIO) -> Iterator:
+    """
+    Yields the items of a JSON array one at a time, without loading
+    the whole array
+
+    Parameters
+    ----------
+    dump: TextIO
+        A file holding a JSON array
+
+    Returns
+    ----------
+    Iterator of the decoded items
+
+    Raises
+    ----------
+    ValueError
+        If the file does not hold a JSON array or an item is invalid or
+        longer than 'MAX_ITEM_SIZE' characters
+    """
+
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    end_of_file = False
+    started = False
+    # Whether a ',' or ']' must come next, i.e., after an item
+    after_item = False
+
+    while True:
+        # Skip the whitespace between items
+        while True:
+            while position < len(buffer) and buffer[position] in ' \t\r\n':
+                position += 1
+            if position < len(buffer) or end_of_file:
+                break
+            buffer = dump.read(READ_CHUNK_SIZE)
+            position = 0
+            end_of_file = not buffer
+
+        if position == len(buffer):
+            raise ValueError('The JSON array is not closed')
+        character = buffer[position]
+
+        if not started:
+            if character != '[':
+                raise ValueError('The dump is not a JSON array')
+            started = True
+            position += 1
+            continue
+
+        if character == ']':
+            return
+        if after_item:
+            if character != ',':
+                raise ValueError(f'Expected "," near character {position}')
+            after_item = False
+            position += 1
+            continue
+
+        try:
+            item, end = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            item, end = None, None
+        # An item may have been cut off by the end of the buffer, e.g.,
+        # '3.5' read as '3', so it is only trusted if it is followed by
+        # a delimiter or the end of the file
+        if end is None or (end == len(buffer) and not end_of_file) or (
+                end < len(buffer) and buffer[end] not in ITEM_DELIMITERS):
+            if end_of_file or len(buffer) - position > MAX_ITEM_SIZE:
+                raise ValueError(f'Invalid JSON near character {position}')
+            chunk = dump.read(READ_CHUNK_SIZE)
+            end_of_file = not chunk
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+
+        yield item
+        position = end
+        after_item = True
+
+
+def iter_json_lines(dump: TextIO) -> Iterator:
+    """
+    Yields the items of a JSON Lines file. Lines that are not valid
+    JSON are yielded as None, so they can be counted as invalid
+
+    Parameters
+    ----------
+    dump: TextIO
+        A file with one JSON value per line
+
+    Returns
+    ----------
+    Iterator of the decoded items
+    """
+
+    for line in dump:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError:
+            yield None
+
+
+def iter_dump_records(dump: TextIO) -> Iterator:
+    """
+    Yields the records of a dump, telling a JSON array from JSON Lines
+    by its first character
+
+    Parameters
+    ----------
+    dump: TextIO
+        A JSON array or JSON Lines file
+
+    Returns
+    ----------
+    Iterator of the decoded records
+    """
+
+    first_character = ''
+    while not first_character.strip():
+        first_character = dump.read(1)
+        if not first_character:
+            return
+    dump.seek(0)
+
+    if first_character == '[':
+        yield from iter_json_array(dump)
+    else:
+        yield from iter_json_lines(dump)
+
+
+def normalise_word_record(record) -> LexiconWord | None:
+    """
+    Checks a WordsAPI word record and converts it to a LexiconWord
+
+    The word is stripped and lowercased. The frequency may be a number
+    or a WordsAPI frequency object ({'zipf': ...}), and the pronunciation
+    a string or a WordsAPI pronunciation object ({'all': ...}). Results
+    that are not objects are dropped
+
+    Parameters
+    ----------
+    record: Any
+        A decoded record from a dump
+
+    Returns
+    ----------
+    LexiconWord (not saved) or None if the record is not valid
+    """
+
+    if not isinstance(record, dict) or not isinstance(record.get('word'),
+                                                      str):
+        return None
+
+    word = ' '.join(record['word'].split()).lower()
+    if not word or len(word) > LexiconWord._meta.get_field(
+            'word').max_length:
+        return None
+
+    frequency = record.get('frequency')
+    if isinstance(frequency, dict):
+        frequency = frequency.get('zipf')
+    if isinstance(frequency, bool) or not isinstance(frequency,
+                                                     (int, float)):
+        frequency = None
+
+    syllables = record.get('syllables')
+    syllable_count = (syllables.get('count')
+                      if isinstance(syllables, dict) else None)
+    if (isinstance(syllable_count, bool)
+            or not isinstance(syllable_count, int) or syllable_count < 0):
+        syllable_count = None
+
+    pronunciation = record.get('pronunciation')
+    if isinstance(pronunciation, dict):
+        pronunciation = pronunciation.get('all')
+    if not isinstance(pronunciation, str):
+        pronunciation = ''
+    pronunciation = pronunciation.strip()[
+        :LexiconWord._meta.get_field('pronunciation').max_length
+        ]
+
+    results = [result for result in record.get('results') or []
+               if isinstance(result, dict)]
+
+    payload = {'word': word, 'results': results}
+    if frequency is not None:
+        payload['frequency'] = frequency
+    if syllable_count is not None:
+        payload['syllables'] = syllables
+    if pronunciation:
+        payload['pronunciation'] = {'all': pronunciation}
+
+    return LexiconWord(word=word,
+                       frequency=frequency,
+                       syllables=syllable_count,
+                       letters=len(word),
+                       pronunciation=pronunciation,
+                       payload=payload)
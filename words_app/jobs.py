@@ -0,0 +1,396 @@
+"""
+Contains the background job runner of the words app
+
+Jobs are functions registered with the 'job' decorator. Running a job
+means adding a row to the 'Job' table, which the workers started with
+'python manage.py run_jobs' take from in order of their 'run_at' time.
+The queue lives in the app database, so no message broker is needed
+
+A job can be scheduled to run again after each run, be retried with an
+increasing delay when it fails and be limited to a number of runs at
+the same time across all the workers. While a job runs, its worker
+updates its heartbeat, and a job whose heartbeat stops, e.g., because
+its worker was killed, is queued again. A scheduled job is only queued
+if it is not queued or running already, checked in the same statement
+that queues it, so workers sharing the queue cannot queue it twice. The
+duration of each run is saved with the job, and 'job_statistics' sums
+them up for the metrics view
+"""
+# words_app/jobs.py
+
+import datetime
+import logging
+import threading
+import time
+import traceback
+from typing import Callable, NamedTuple
+from django.db import connections, router
+from django.db.models import (Avg, Count, Max, OuterRef, Q, Subquery,
+                              Value)
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from .models import Job
+from . import constants
+
+logger = logging.getLogger(__name__)
+
+
+class JobDefinition(NamedTuple):
+    """A registered job and the options it was registered with"""
+    name: str
+    function: Callable
+    # Returns the number of seconds until the next run, if scheduled
+    schedule: Callable[[], float] | None
+    max_attempts: int
+    # Seconds before the first retry. Doubled for each further retry
+    retry_delay: float
+    # The most runs of the job allowed at the same time
+    max_concurrency: int
+
+
+# The registered jobs, by name
+JOBS = {}
+
+
+def job(name: str | None = None,
+        schedule: Callable[[], float] | None = None,
+        max_attempts: int = 3,
+        retry_delay: float = 60,
+        max_concurrency: int = 1) -> Callable:
+    """
+    Registers a function as a background job
+
+    Parameters
+    ----------
+    name: str | None
+        The name of the job. Defaults to the name of the function
+    schedule: Callable[[], float] | None
+        Returns the number of seconds until the job should run again,
+        e.g., 'seconds_until_midnight_uk'. The job is only run when
+        queued if None
+    max_attempts: int
+        The number of times the job is tried before it is marked failed
+    retry_delay: float
+        The number of seconds before the first retry
+    max_concurrency: int
+        The maximum number of runs of the job at the same time
+
+    Returns
+    ----------
+    The decorator, which returns the function unchanged
+    """
+
+    def register(function: Callable) -> Callable:
+        job_name = name or function.__name__
+        JOBS[job_name] = JobDefinition(job_name,
+                                       function,
+                                       schedule,
+                                       max_attempts,
+                                       retry_delay,
+                                       max_concurrency)
+        return function
+
+    return register
+
+
+def enqueue(name: str, delay: float = 0, **kwargs) -> Job:
+    """
+    Queues a run of a registered job
+
+    Parameters
+    ----------
+    name: str
+        The name of the job
+    delay: float
+        The number of seconds to wait before running the job
+    kwargs: dict
+        The keyword arguments to call the job with. Must be JSON
+        serialisable
+
+    Returns
+    ----------
+    Job
+
+    Raises
+    ----------
+    KeyError
+        If no job is registered under the name
+    """
+
+    if name not in JOBS:
+        raise KeyError(f'No job is registered as {name!r}')
+
+    return Job.objects.create(
+        name=name,
+        kwargs=kwargs,
+        run_at=timezone.now() + datetime.timedelta(seconds=delay)
+        )
+
+
+def enqueue_scheduled(definition: JobDefinition) -> bool:
+    """
+    Queues the next run of a scheduled job unless it is already queued
+    or running
+
+    The check and the insert are a single INSERT ... SELECT ... WHERE
+    NOT EXISTS statement. SQLite runs one write at a time, so two
+    workers can never both queue the job
+
+    Parameters
+    ----------
+    definition: JobDefinition
+        The scheduled job
+
+    Returns
+    ----------
+    True if the job was queued, False if it was pending already
+    """
+
+    database = router.db_for_write(Job)
+    connection = connections[database]
+    quote_name = connection.ops.quote_name
+    table = quote_name(Job._meta.db_table)
+
+    values = {
+        'name': definition.name,
+        'kwargs': {},
+        'status': Job.Status.QUEUED,
+        'run_at': timezone.now() + datetime.timedelta(
+            seconds=definition.schedule()
+            ),
+        'attempts': 0,
+        'error': '',
+        }
+    fields = [Job._meta.get_field(name) for name in values]
+    columns = ', '.join(quote_name(field.column) for field in fields)
+    placeholders = ', '.join(['%s'] * len(fields))
+    name_column = quote_name(Job._meta.get_field('name').column)
+    status_column = quote_name(Job._meta.get_field('status').column)
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {table} ({columns}) SELECT {placeholders}'
+            f' WHERE NOT EXISTS (SELECT 1 FROM {table}'
+            f' WHERE {name_column} = %s AND {status_column} IN (%s, %s))',
+            [field.get_db_prep_save(value, connection)
+             for field, value in zip(fields, values.values())]
+            + [definition.name, Job.Status.QUEUED, Job.Status.RUNNING]
+            )
+        return cursor.rowcount == 1
+
+
+def schedule_jobs() -> int:
+    """
+    Queues the next run of each scheduled job that is not already
+    queued or running
+
+    Returns
+    ----------
+    Int
+        The number of jobs queued
+    """
+
+    return sum(enqueue_scheduled(definition)
+               for definition in JOBS.values() if definition.schedule)
+
+
+def requeue_stuck_jobs(timeout: float) -> int:
+    """
+    Queues again the running jobs without a heartbeat for longer than
+    the timeout, e.g., because their worker was stopped. A job that
+    runs for long is not queued again while its worker is alive
+
+    Parameters
+    ----------
+    timeout: float
+        The number of seconds without a heartbeat after which a running
+        job is stuck
+
+    Returns
+    ----------
+    Int
+        The number of jobs queued again
+    """
+
+    return Job.objects.filter(
+        status=Job.Status.RUNNING,
+        heartbeat_at__lt=timezone.now() - datetime.timedelta(seconds=timeout)
+        ).update(status=Job.Status.QUEUED, run_at=timezone.now())
+
+
+def delete_finished_jobs(older_than: float) -> int:
+    """
+    Deletes the succeeded and failed jobs that finished before a number
+    of seconds ago, so the queue does not grow without end
+
+    Parameters
+    ----------
+    older_than: float
+        The number of seconds finished jobs are kept for
+
+    Returns
+    ----------
+    Int
+        The number of jobs deleted
+    """
+
+    deleted, _ = Job.objects.filter(
+        status__in=(Job.Status.SUCCEEDED, Job.Status.FAILED),
+        finished_at__lt=timezone.now() - datetime.timedelta(
+            seconds=older_than
+            )
+        ).delete()
+
+    return deleted
+
+
+def claim_next_job() -> Job | None:
+    """
+    Marks the next due job as running and returns it
+
+    The job is claimed with a single UPDATE that also checks that it is
+    still queued and that its job has fewer runs going than its
+    'max_concurrency'. SQLite runs one write at a time, so two workers
+    can never claim the same job or go over the limit
+
+    Returns
+    ----------
+    Job | None
+        None if no job is due
+    """
+
+    running = Job.objects.filter(
+        name=OuterRef('name'), status=Job.Status.RUNNING
+        ).values('name').annotate(number=Count('id')).values('number')
+
+    due_jobs = Job.objects.filter(
+        status=Job.Status.QUEUED, run_at__lte=timezone.now()
+        ).order_by('run_at', 'id')
+
+    for due_job in due_jobs[:20]:
+        definition = JOBS.get(due_job.name)
+        if definition is None:
+            continue
+        claimed = Job.objects.filter(
+            id=due_job.id, status=Job.Status.QUEUED
+            ).alias(
+            running=Coalesce(Subquery(running), Value(0))
+            ).filter(
+            running__lt=definition.max_concurrency
+            ).update(
+            status=Job.Status.RUNNING,
+            started_at=timezone.now(),
+            heartbeat_at=timezone.now(),
+            attempts=due_job.attempts + 1
+            )
+        if claimed:
+            due_job.refresh_from_db()
+            return due_job
+
+    return None
+
+
+def _send_heartbeats(job_id: int, stopped: threading.Event) -> None:
+    """
+    Updates the heartbeat of a running job every
+    'constants.JOB_HEARTBEAT_INTERVAL' seconds until it stops. Run in a
+    thread
+    """
+
+    try:
+        while not stopped.wait(constants.JOB_HEARTBEAT_INTERVAL):
+            Job.objects.filter(id=job_id, status=Job.Status.RUNNING).update(
+                heartbeat_at=timezone.now()
+                )
+    except Exception:
+        logger.exception('Could not update the heartbeat of job %s', job_id)
+    finally:
+        # Threads get their own database connections
+        connections.close_all()
+
+
+def run_job(claimed_job: Job) -> bool:
+    """
+    Runs a claimed job and records the result. A failed job is queued
+    again until it has been tried 'max_attempts' times, and the next
+    run of a scheduled job is queued once it finishes. The heartbeat of
+    the job is updated in a thread while it runs
+
+    Parameters
+    ----------
+    claimed_job: Job
+        A job returned by 'claim_next_job'
+
+    Returns
+    ----------
+    True if the job succeeded, False otherwise
+    """
+
+    definition = JOBS[claimed_job.name]
+
+    stopped = threading.Event()
+    heartbeat = threading.Thread(target=_send_heartbeats,
+                                 args=(claimed_job.id, stopped),
+                                 name=f'job-{claimed_job.id}-heartbeat',
+                                 daemon=True)
+    heartbeat.start()
+
+    start = time.perf_counter()
+    try:
+        definition.function(**claimed_job.kwargs)
+    except Exception:
+        succeeded = False
+        claimed_job.error = traceback.format_exc()
+        logger.exception('Job %s failed', claimed_job.name)
+    else:
+        succeeded = True
+        claimed_job.error = ''
+    finally:
+        stopped.set()
+        heartbeat.join()
+    claimed_job.duration = time.perf_counter() - start
+    claimed_job.finished_at = timezone.now()
+
+    if succeeded:
+        claimed_job.status = Job.Status.SUCCEEDED
+    elif claimed_job.attempts < definition.max_attempts:
+        claimed_job.status = Job.Status.QUEUED
+        claimed_job.run_at = timezone.now() + datetime.timedelta(
+            seconds=definition.retry_delay * 2 ** (claimed_job.attempts - 1)
+            )
+    else:
+        claimed_job.status = Job.Status.FAILED
+    # The heartbeat saved by the thread is kept
+    claimed_job.save(update_fields=['status', 'run_at', 'error', 'duration',
+                                    'finished_at'])
+
+    if definition.schedule and claimed_job.status != Job.Status.QUEUED:
+        enqueue_scheduled(definition)
+
+    return succeeded
+
+
+def job_statistics() -> dict[str, dict]:
+    """
+    Returns the number of runs of each job and how long they took, from
+    the 'Job' table, so the web processes can show what the workers did
+
+    Parameters
+    ----------
+    None
+
+    Returns
+    ----------
+    Dictionary of each job name to its number of finished runs, failed
+    runs and queued runs, and the mean and longest duration in seconds
+    """
+
+    statistics = Job.objects.values('name').annotate(
+        runs=Count('id', filter=Q(finished_at__isnull=False)),
+        failures=Count('id', filter=Q(status=Job.Status.FAILED)),
+        queued=Count('id', filter=Q(status=Job.Status.QUEUED)),
+        mean_duration_seconds=Avg('duration'),
+        max_duration_seconds=Max('duration'),
+        ).order_by('name')
+
+    return {row.pop('name'): row for row in statistics}
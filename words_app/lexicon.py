@@ -0,0 +1,130 @@
+"""
+Loads the local lexicon used by the word games and search helpers
+
+The lexicon is a tab separated text file with one word per line. Each
+line holds the word followed by its optional frequency score, number of
+syllables and pronunciation, in the same form as WordsAPI returns them.
+For example:
+
+    wizard	4.02	2	ˈwɪzərd
+
+Lines that are empty or start with '#' are skipped. The file is set by
+'settings.WORDS_LEXICON_PATH' and is loaded once per process. If a
+binary snapshot of the lexicon has been built (see
+words_app/snapshot.py), its entries are read from the mapped file
+instead, which needs no parsing and no copy of the lexicon per process
+"""
+# words_app/lexicon.py
+
+from functools import lru_cache
+from pathlib import Path
+from typing import Iterable, NamedTuple
+from django.conf import settings
+
+
+class LexiconEntry(NamedTuple):
+    """
+    Subclasses from 'typing.NamedTuple'. It represents a word in the
+    lexicon together with the WordsAPI fields used to rank and filter it
+    """
+
+    word: str
+    frequency: float
+    syllables: int
+    pronunciation: str
+
+
+def parse_lexicon_line(line: str) -> LexiconEntry | None:
+    """
+    Parses a single line of the lexicon file
+
+    Parameters
+    ----------
+    line: str
+        A line from the lexicon file
+
+    Returns
+    ----------
+    LexiconEntry or None if the line holds no word
+    """
+
+    line = line.strip()
+    if not line or line.startswith('#'):
+        return None
+
+    fields = line.split('\t')
+    word = fields[0].strip().lower()
+    if not word:
+        return None
+
+    try:
+        frequency = float(fields[1]) if len(fields) > 1 else 0.0
+    except ValueError:
+        frequency = 0.0
+    try:
+        syllables = int(fields[2]) if len(fields) > 2 else 0
+    except ValueError:
+        syllables = 0
+    pronunciation = fields[3].strip() if len(fields) > 3 else ''
+
+    return LexiconEntry(word, frequency, syllables, pronunciation)
+
+
+def read_lexicon_file(path: str | Path) -> tuple[LexiconEntry, ...]:
+    """
+    Reads and parses a lexicon file. Duplicate words are dropped,
+    keeping the first occurrence
+
+    Parameters
+    ----------
+    path: str | Path
+        The lexicon file
+
+    Returns
+    ----------
+    Tuple of LexiconEntry (empty if the lexicon file does not exist)
+    """
+
+    path = Path(path)
+    if not path.is_file():
+        return ()
+
+    entries = {}
+    with path.open(encoding='utf-8') as lexicon_file:
+        for line in lexicon_file:
+            entry = parse_lexicon_line(line)
+            if entry and entry.word not in entries:
+                entries[entry.word] = entry
+
+    return tuple(entries.values())
+
+
+@lru_cache(maxsize=1)
+def _read_lexicon_file_once(path: str | Path) -> tuple[LexiconEntry, ...]:
+    """Reads the lexicon file once per process"""
+    return read_lexicon_file(path)
+
+
+def get_lexicon() -> Iterable[LexiconEntry]:
+    """
+    Returns the lexicon entries, from the current binary snapshot if
+    there is one and from the lexicon file otherwise. The snapshot's
+    entries are read from the mapped file as they are iterated
+
+    Parameters
+    ----------
+    None
+
+    Returns
+    ----------
+    Iterable of LexiconEntry (empty if there is no lexicon)
+    """
+
+    # Imported here as the snapshot module uses LexiconEntry
+    from .snapshot import get_lexicon_snapshot
+
+    snapshot = get_lexicon_snapshot()
+    if snapshot is not None:
+        return snapshot
+
+    return _read_lexicon_file_once(settings.WORDS_LEXICON_PATH)
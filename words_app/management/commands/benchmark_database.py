@@ -0,0 +1,138 @@
+"""
+Defines the 'benchmark_database' management command
+
+It measures how many reads per second the database serves while
+favourite words are being written at the same time. Compare the
+development and production database profiles with:
+python manage.py benchmark_database
+WORDS_DB_PROFILE=production python manage.py benchmark_database
+
+The benchmark runs against a throwaway copy of the database, created
+like the test database, so the live database is never written to
+"""
+# words_app/management/commands/benchmark_database.py
+
+import threading
+import time
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connections, OperationalError
+from django.test.utils import setup_databases, teardown_databases
+from words_app.utils import toggle_favourite_word
+
+
+class Command(BaseCommand):
+    """
+    Inherits from Django's BaseCommand class. It runs reader threads
+    and a writer thread against the database and reports their
+    throughput
+    """
+
+    help = 'Benchmarks concurrent reads while favourite words are written'
+
+    def add_arguments(self, parser) -> None:
+        """Adds the command line options"""
+
+        parser.add_argument('--readers', type=int, default=4,
+                            help='The number of reader threads')
+        parser.add_argument('--seconds', type=float, default=5,
+                            help='How long to run the benchmark for')
+
+    def handle(self, *args, **options) -> None:
+        """
+        Runs the benchmark and reports the reads and writes per second
+        """
+
+        # Points every connection at a new, migrated database file
+        old_config = setup_databases(verbosity=0, interactive=False,
+                                     serialized_aliases=set())
+        try:
+            counts = self.benchmark(options['readers'], options['seconds'])
+        finally:
+            connections.close_all()
+            teardown_databases(old_config, verbosity=0)
+
+        seconds = options['seconds']
+        writes = options['readers']
+        self.stdout.write(f'Database profile: {settings.DB_PROFILE}')
+        self.stdout.write(
+            f'Reads: {sum(counts[:writes]) / seconds:.0f}/s '
+            f'with {options["readers"]} readers'
+            )
+        self.stdout.write(f'Writes: {counts[writes] / seconds:.0f}/s')
+        self.stdout.write(f'Locked database errors: {counts[writes + 1]}')
+
+    def benchmark(self, readers: int, seconds: float) -> list[int]:
+        """
+        Reads and writes favourite words from several threads at once
+
+        Parameters
+        ----------
+        readers: int
+            The number of reader threads
+        seconds: float
+            How long to run the benchmark for
+
+        Returns
+        ----------
+        List
+            The number of reads of each reader thread, followed by the
+            number of writes and the number of locked database errors
+        """
+
+        user = User.objects.create(username='benchmark_database_user')
+        words = [f'benchmark{number}' for number in range(100)]
+
+        stop = threading.Event()
+        # Number of reads per reader thread, followed by writes and errors
+        counts = [0] * (readers + 2)
+        writes = readers
+        errors = readers + 1
+
+        def read(reader: int) -> None:
+            # Reads the favourite words of the user, as the views do
+            try:
+                while not stop.is_set():
+                    try:
+                        list(user.favourite_words.values_list('word',
+                                                              flat=True))
+                        counts[reader] += 1
+                    except OperationalError:
+                        counts[errors] += 1
+            finally:
+                connections.close_all()
+
+        def write() -> None:
+            # Adds and removes favourite words as the views do, one
+            # transaction each
+            try:
+                position = 0
+                while not stop.is_set():
+                    try:
+                        toggle_favourite_word(
+                            user, words[position % len(words)],
+                            favourite=not position // len(words) % 2
+                            )
+                        counts[writes] += 1
+                    except OperationalError:
+                        counts[errors] += 1
+                    position += 1
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=read, args=(reader,))
+                   for reader in range(readers)]
+        threads.append(threading.Thread(target=write))
+
+        try:
+            for thread in threads:
+                thread.start()
+            time.sleep(seconds)
+        finally:
+            stop.set()
+            for thread in threads:
+                if thread.ident is not None:
+                    thread.join()
+
+        return counts
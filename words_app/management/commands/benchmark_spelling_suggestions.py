@@ -0,0 +1,157 @@
+"""
+Defines the 'benchmark_spelling_suggestions' management command
+
+It measures how long the spelling index takes to build, how much memory
+it uses and how long searches take at edit distances 1 and 2. Run it
+with:
+python manage.py benchmark_spelling_suggestions --words 300000 --memory
+"""
+# words_app/management/commands/benchmark_spelling_suggestions.py
+
+import random
+import statistics
+import time
+import tracemalloc
+from django.core.management.base import BaseCommand
+from words_app.lexicon import LexiconEntry, get_lexicon
+from words_app.suggestions import SpellingIndex
+
+# English letters and their approximate relative frequencies, used to
+# generate word-like test words
+LETTERS = 'etaoinshrdlcumwfgypbvkjxqz'
+LETTER_WEIGHTS = [12, 9, 8, 8, 7, 7, 6, 6, 6, 4, 4, 3, 3,
+                  2, 2, 2, 2, 2, 2, 1, 1, 1, 1, 1, 1, 1]
+
+
+def generate_entries(number_of_words: int) -> list[LexiconEntry]:
+    """
+    Generates random lexicon entries of 3 to 12 letters
+
+    Parameters
+    ----------
+    number_of_words: int
+        The number of entries to generate
+
+    Returns
+    ----------
+    List of LexiconEntry
+    """
+
+    words = set()
+    while len(words) < number_of_words:
+        words.add(''.join(random.choices(LETTERS,
+                                         LETTER_WEIGHTS,
+                                         k=random.randint(3, 12))))
+
+    return [LexiconEntry(word, random.uniform(1.74, 8.03), 0, '')
+            for word in words]
+
+
+def misspell(word: str, edits: int) -> str:
+    """
+    Returns the word with a number of random letters substituted,
+    inserted or deleted
+
+    Parameters
+    ----------
+    word: str
+        The word to misspell
+    edits: int
+        The number of edits to make
+
+    Returns
+    ----------
+    String
+    """
+
+    for _ in range(edits):
+        position = random.randrange(len(word))
+        letter = random.choice(LETTERS)
+        edit = random.choice(('substitute', 'insert', 'delete'))
+        if edit == 'substitute':
+            word = word[:position] + letter + word[position + 1:]
+        elif edit == 'insert':
+            word = word[:position] + letter + word[position:]
+        elif len(word) > 1:
+            word = word[:position] + word[position + 1:]
+
+    return word
+
+
+class Command(BaseCommand):
+    """
+    Inherits from Django's BaseCommand class. It benchmarks the spelling
+    index on the lexicon or on randomly generated words
+    """
+
+    help = 'Benchmarks building and searching the spelling index'
+
+    def add_arguments(self, parser) -> None:
+        """Adds the command line options"""
+
+        parser.add_argument(
+            '--words',
+            type=int,
+            default=0,
+            help='Generate this many random words instead of using the '
+            'lexicon'
+            )
+        parser.add_argument(
+            '--queries',
+            type=int,
+            default=50,
+            help='The number of searches to time at each edit distance'
+            )
+        parser.add_argument(
+            '--memory',
+            action='store_true',
+            help='Measure the memory used by the index. This makes '
+            'building it several times slower'
+            )
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options) -> None:
+        """
+        Builds the spelling index and reports the build time, memory
+        use and search times
+        """
+
+        random.seed(options['seed'])
+        entries = (
+            generate_entries(options['words']) if options['words']
+            else list(get_lexicon())
+            )
+        if not entries:
+            self.stderr.write('The lexicon is empty. Use --words to '
+                              'benchmark with random words')
+            return
+
+        if options['memory']:
+            tracemalloc.start()
+        start = time.perf_counter()
+        spelling_index = SpellingIndex(entries)
+        build_seconds = time.perf_counter() - start
+
+        self.stdout.write(
+            f'Indexed {len(spelling_index)} words in {build_seconds:.1f} s'
+            )
+        if options['memory']:
+            memory_mb = tracemalloc.get_traced_memory()[0] / 1e6
+            tracemalloc.stop()
+            self.stdout.write(f'The index uses {memory_mb:.0f} MB')
+
+        words = [entry.word for entry in entries]
+        for distance in (1, 2):
+            timings = []
+            for _ in range(options['queries']):
+                query = misspell(random.choice(words), distance)
+                start = time.perf_counter()
+                spelling_index.search(query, distance)
+                timings.append((time.perf_counter() - start) * 1000)
+
+            timings.sort()
+            self.stdout.write(
+                f'Edit distance {distance}: '
+                f'mean {statistics.mean(timings):.1f} ms, '
+                f'p95 {timings[int(len(timings) * 0.95) - 1]:.1f} ms'
+                )
@@ -0,0 +1,73 @@
+"""
+Defines the 'build_lexicon_snapshot' management command
+
+It converts the lexicon file into the binary snapshot that the server
+processes map into memory. The running servers pick up the new
+snapshot without a restart. Run it after changing the lexicon with:
+python manage.py build_lexicon_snapshot
+Build it from the words loaded by 'ingest_lexicon' instead with:
+python manage.py build_lexicon_snapshot --from-database
+"""
+# words_app/management/commands/build_lexicon_snapshot.py
+
+import os
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from words_app.lexicon import LexiconEntry, read_lexicon_file
+from words_app.models import LexiconWord
+from words_app.snapshot import LexiconSnapshot, write_snapshot
+
+
+class Command(BaseCommand):
+    """
+    Inherits from Django's BaseCommand class. It writes the lexicon
+    snapshot and checks that it can be read back
+    """
+
+    help = 'Builds the binary lexicon snapshot from the lexicon file'
+
+    def add_arguments(self, parser) -> None:
+        """Adds the command line options"""
+
+        parser.add_argument('--source',
+                            default=settings.WORDS_LEXICON_PATH,
+                            help='The lexicon file to read')
+        parser.add_argument('--from-database', action='store_true',
+                            help='Read the words ingested into the '
+                                 'database instead of the lexicon file')
+        parser.add_argument('--output',
+                            default=settings.WORDS_LEXICON_SNAPSHOT_PATH,
+                            help='Where to write the snapshot')
+
+    def handle(self, *args, **options) -> None:
+        """
+        Builds the snapshot and reports its size
+        """
+
+        start = time.perf_counter()
+        if options['from_database']:
+            source = 'the database'
+            entries = [
+                LexiconEntry(word, frequency or 0.0, syllables or 0,
+                             pronunciation)
+                for word, frequency, syllables, pronunciation in
+                LexiconWord.objects.values_list(
+                    'word', 'frequency', 'syllables', 'pronunciation'
+                    ).iterator()
+                ]
+        else:
+            source = options['source']
+            entries = read_lexicon_file(source)
+        if not entries:
+            raise CommandError(f'No words found in {source}')
+
+        count = write_snapshot(entries, options['output'])
+        # Make sure the new file can be read before the servers use it
+        LexiconSnapshot(options['output'])
+
+        size = os.path.getsize(options['output'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Wrote {count} words ({size / 1024 / 1024:.1f} MB) to '
+            f'{options["output"]} in {time.perf_counter() - start:.1f} s'
+            ))
@@ -0,0 +1,36 @@
+"""
+Defines the 'clean_favourite_words' management command
+
+It corrects the favourite counts left wrong by changes made outside
+the app and deletes favourite words that are no longer favourited by
+any user.
+Run it periodically (e.g., from cron) with:
+python manage.py clean_favourite_words
+"""
+# words_app/management/commands/clean_favourite_words.py
+
+from django.core.management.base import BaseCommand
+from words_app.utils import (delete_orphaned_favourite_words,
+                             recount_favourite_words)
+
+
+class Command(BaseCommand):
+    """
+    Inherits from Django's BaseCommand class. It removes orphaned
+    favourite words in one batch
+    """
+
+    help = 'Deletes favourite words that are not favourited by any user'
+
+    def handle(self, *args, **options) -> None:
+        """
+        Recounts the favourite words, deletes the orphaned ones and
+        reports how many were corrected and removed
+        """
+
+        recounted = recount_favourite_words()
+        self.stdout.write(f'Corrected {recounted} favourite counts')
+        deleted = delete_orphaned_favourite_words()
+        self.stdout.write(
+            self.style.SUCCESS(f'Deleted {deleted} orphaned favourite words')
+            )
@@ -0,0 +1,39 @@
+"""
+Defines the 'fill_word_of_day_calendar' management command
+
+It fetches the words of the day for the coming weeks in one batch, so
+the index page only has to look up today's word in the database. It is
+also run daily by the background job worker. Run it by hand with:
+python manage.py fill_word_of_day_calendar --days 28
+"""
+# words_app/management/commands/fill_word_of_day_calendar.py
+
+from django.core.management.base import BaseCommand
+from words_app import constants
+from words_app.utils import fill_word_of_day_calendar
+
+
+class Command(BaseCommand):
+    """
+    Inherits from Django's BaseCommand class. It fills in the days of
+    the word of the day calendar that have no word yet
+    """
+
+    help = 'Fetches the words of the day for the coming days'
+
+    def add_arguments(self, parser) -> None:
+        """Adds the command line options"""
+
+        parser.add_argument('--days', type=int,
+                            default=constants.WORD_OF_DAY_CALENDAR_DAYS,
+                            help='The number of days to fill in')
+
+    def handle(self, *args, **options) -> None:
+        """
+        Fills in the calendar and reports how many days were added
+        """
+
+        filled = fill_word_of_day_calendar(options['days'])
+        self.stdout.write(
+            self.style.SUCCESS(f'Filled in {filled} days of the calendar')
+            )
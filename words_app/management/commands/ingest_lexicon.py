@@ -0,0 +1,136 @@
+"""
+Defines the 'ingest_lexicon' management command
+
+It loads a JSON or JSON Lines dump of WordsAPI word records into the
+local lexicon tables, in batches. If it is stopped, running it again on
+the same dump resumes after the last batch saved. Run it with:
+python manage.py ingest_lexicon words.jsonl
+"""
+# words_app/management/commands/ingest_lexicon.py
+
+import os
+import time
+from itertools import islice
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from words_app import constants
+from words_app.ingest import iter_dump_records, normalise_word_record
+from words_app.models import IngestCheckpoint, LexiconWord
+
+
+class Command(BaseCommand):
+    """
+    Inherits from Django's BaseCommand class. It streams the records of
+    a dump into the 'LexiconWord' table and saves a checkpoint with
+    each batch
+    """
+
+    help = 'Loads a WordsAPI JSON or JSON Lines dump into the lexicon'
+
+    def add_arguments(self, parser) -> None:
+        """Adds the command line options"""
+
+        parser.add_argument('dump', help='The JSON or JSON Lines file')
+        parser.add_argument('--batch-size', type=int,
+                            default=constants.INGEST_BATCH_SIZE,
+                            help='The number of records saved at a time')
+        parser.add_argument('--restart', action='store_true',
+                            help='Ignore the checkpoint and start again')
+
+    def handle(self, *args, **options) -> None:
+        """
+        Loads the dump and reports the throughput in records per second
+        """
+
+        source = os.path.abspath(options['dump'])
+        batch_size = options['batch_size']
+        if not os.path.isfile(source):
+            raise CommandError(f'{source} does not exist')
+        if batch_size < 1:
+            raise CommandError('--batch-size must be at least 1')
+
+        stat = os.stat(source)
+        checkpoint, _ = IngestCheckpoint.objects.get_or_create(
+            source=source,
+            defaults={'source_size': stat.st_size,
+                      'source_modified': stat.st_mtime}
+            )
+        if (options['restart'] or checkpoint.source_size != stat.st_size
+                or checkpoint.source_modified != stat.st_mtime):
+            if checkpoint.records and not options['restart']:
+                self.stdout.write('The dump has changed, starting again')
+            checkpoint.source_size = stat.st_size
+            checkpoint.source_modified = stat.st_mtime
+            checkpoint.records = 0
+            checkpoint.is_complete = False
+            checkpoint.save()
+        elif checkpoint.is_complete:
+            self.stdout.write(self.style.SUCCESS(
+                f'{source} was already ingested. Use --restart to load '
+                f'it again'
+                ))
+            return
+
+        skipped = checkpoint.records
+        if skipped:
+            self.stdout.write(f'Resuming after {skipped} records')
+
+        read = written = invalid = 0
+        start = time.perf_counter()
+
+        with open(source, encoding='utf-8-sig') as dump:
+            records = iter_dump_records(dump)
+            # Records saved by an earlier run are read but not checked
+            for _ in islice(records, skipped):
+                pass
+
+            while True:
+                batch = list(islice(records, batch_size))
+                if not batch:
+                    break
+
+                words = {}
+                for record in batch:
+                    lexicon_word = normalise_word_record(record)
+                    if lexicon_word is None:
+                        invalid += 1
+                    else:
+                        # A word repeated in a batch keeps its last record
+                        words[lexicon_word.word] = lexicon_word
+
+                # The checkpoint is saved with the batch, so a batch is
+                # never saved twice or skipped
+                with transaction.atomic():
+                    LexiconWord.objects.bulk_create(
+                        words.values(),
+                        update_conflicts=True,
+                        unique_fields=['word'],
+                        update_fields=['frequency', 'syllables', 'letters',
+                                       'pronunciation', 'payload']
+                        )
+                    checkpoint.records += len(batch)
+                    checkpoint.save(update_fields=['records', 'updated_at'])
+
+                read += len(batch)
+                written += len(words)
+                if read % (batch_size * 10) < batch_size:
+                    self.report(read, start)
+
+        checkpoint.is_complete = True
+        checkpoint.save(update_fields=['is_complete', 'updated_at'])
+
+        seconds = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f'Read {read} records ({invalid} invalid), saved {written} '
+            f'words in {seconds:.1f} s '
+            f'({read / seconds if seconds else 0:.0f} records/s)'
+            ))
+
+    def report(self, read: int, start: float) -> None:
+        """Writes the progress and throughput so far"""
+
+        seconds = time.perf_counter() - start
+        self.stdout.write(
+            f'{read} records, {read / seconds if seconds else 0:.0f} '
+            f'records/s'
+            )
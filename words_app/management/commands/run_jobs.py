@@ -0,0 +1,86 @@
+"""
+Defines the 'run_jobs' management command
+
+It starts a worker that runs the background jobs queued in the
+database, e.g., the midnight word of the day refresh. Start one or more
+workers alongside the web server with:
+python manage.py run_jobs
+Queue a job by hand with, e.g.:
+python manage.py run_jobs --enqueue warm_search \
+    --kwargs '{"querystring": "letterPattern=%5Ea&limit=200"}'
+"""
+# words_app/management/commands/run_jobs.py
+
+import json
+import time
+from django.core.management.base import BaseCommand, CommandError
+from words_app import constants
+from words_app.jobs import (JOBS,
+                            claim_next_job,
+                            enqueue,
+                            requeue_stuck_jobs,
+                            run_job,
+                            schedule_jobs
+                            )
+
+
+class Command(BaseCommand):
+    """
+    Inherits from Django's BaseCommand class. It runs the due jobs one
+    at a time, waiting for more when none are due
+    """
+
+    help = 'Runs the background jobs queued in the database'
+
+    def add_arguments(self, parser) -> None:
+        """Adds the command line options"""
+
+        parser.add_argument('--once', action='store_true',
+                            help='Exit once no job is due')
+        parser.add_argument('--poll-interval', type=float,
+                            default=constants.JOB_POLL_INTERVAL,
+                            help='Seconds to wait when no job is due')
+        parser.add_argument('--enqueue', metavar='JOB',
+                            help='Queue a run of a job and exit')
+        parser.add_argument('--kwargs', default='{}',
+                            help='The JSON keyword arguments of --enqueue')
+
+    def handle(self, *args, **options) -> None:
+        """
+        Queues a job, or runs the due jobs until stopped
+        """
+
+        if options['enqueue']:
+            try:
+                queued_job = enqueue(options['enqueue'],
+                                     **json.loads(options['kwargs']))
+            except (KeyError, json.JSONDecodeError) as error:
+                raise CommandError(error)
+            self.stdout.write(self.style.SUCCESS(f'Queued {queued_job}'))
+            return
+
+        requeued = requeue_stuck_jobs(constants.JOB_TIMEOUT)
+        if requeued:
+            self.stdout.write(f'Queued {requeued} stuck jobs again')
+        self.stdout.write(f'Running jobs: {", ".join(sorted(JOBS))}')
+
+        try:
+            while True:
+                schedule_jobs()
+                claimed_job = claim_next_job()
+                if claimed_job is None:
+                    if options['once']:
+                        break
+                    # The jobs of a worker that stopped while this one
+                    # runs are queued again too
+                    requeue_stuck_jobs(constants.JOB_TIMEOUT)
+                    time.sleep(options['poll_interval'])
+                    continue
+
+                succeeded = run_job(claimed_job)
+                message = (f'{claimed_job.name} took '
+                           f'{claimed_job.duration:.2f} s')
+                self.stdout.write(self.style.SUCCESS(message) if succeeded
+                                  else self.style.ERROR(f'{message}, failed'))
+        except KeyboardInterrupt:
+            self.stdout.write('Stopped')
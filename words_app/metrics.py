@@ -0,0 +1,76 @@
+"""
+Contains the in-memory metrics registry of the words app
+
+Each metric has a name (e.g., 'compression') and is kept per label
+(e.g., the view name). Recording a value adds it to the totals for the
+label and counts one more event. The totals are kept per process and
+can be read by staff on the metrics page
+"""
+# words_app/metrics.py
+
+import threading
+from collections import defaultdict
+
+
+class MetricsRegistry:
+    """
+    Thread-safe totals of the values recorded for each metric and label
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        # Metric name -> label -> value name -> total
+        self._metrics = defaultdict(lambda: defaultdict(
+            lambda: defaultdict(float)
+            ))
+
+    def add(self, name: str, label: str, **values: float) -> None:
+        """
+        Adds values to the totals of a metric for a label and counts
+        one more event
+
+        Parameters
+        ----------
+        name: str
+            The name of the metric, e.g., 'compression'
+        label: str
+            What the values are for, e.g., the view name
+        values: float
+            The values to add, e.g., original_bytes=5120
+
+        Returns
+        ----------
+        None
+        """
+
+        with self._lock:
+            totals = self._metrics[name][label]
+            totals['count'] += 1
+            for value_name, value in values.items():
+                totals[value_name] += value
+
+    def snapshot(self) -> dict[str, dict[str, dict[str, float]]]:
+        """
+        Returns a copy of the totals of every metric
+
+        Returns
+        ----------
+        Dictionary of metric name to label to value name to total
+        """
+
+        with self._lock:
+            return {
+                name: {label: dict(totals)
+                       for label, totals in labels.items()}
+                for name, labels in self._metrics.items()
+                }
+
+    def reset(self) -> None:
+        """Removes all the totals"""
+
+        with self._lock:
+            self._metrics.clear()
+
+
+# The registry used by the words app
+metrics = MetricsRegistry()
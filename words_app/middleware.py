@@ -0,0 +1,431 @@
+"""
+Defines the middleware for the words app
+
+The 'QueryBudgetMiddleware' class counts the database queries run for
+each request and logs the views that go over the query budget or run
+the same query repeatedly
+
+The 'StaticFilesMiddleware' class serves the files collected by
+'collectstatic' when the site is deployed, choosing the precompressed
+copy of each file the browser accepts
+
+The 'CompressionMiddleware' class compresses the pages and other text
+responses, including streaming responses, with brotli or gzip
+"""
+# words_app/middleware.py
+
+import logging
+import mimetypes
+import os
+import secrets
+import time
+from gzip import GzipFile
+from io import BytesIO
+from urllib.parse import urlparse
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.exceptions import MiddlewareNotUsed, SuspiciousFileOperation
+from django.http import FileResponse, HttpRequest, HttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.crypto import get_random_string
+from .metrics import metrics
+from .query_budget import QueryCounter
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Uncompressed bytes a compression stream takes before it flushes what
+# it has compressed. Small chunks, e.g., the rows of a CSV export, are
+# compressed together instead of each being flushed on its own
+STREAM_FLUSH_SIZE = 16 * 1024
+
+
+class QueryBudgetMiddleware:
+    """
+    Logs a warning when a request runs more database queries than
+    'settings.QUERY_BUDGET["MAX_QUERIES"]', or runs the same query more
+    than 'settings.QUERY_BUDGET["MAX_REPEATS"]' times (an N+1 pattern)
+    """
+
+    def __init__(self, get_response) -> None:
+        """
+        Parameters
+        ----------
+        get_response: Callable
+            The next middleware or the view
+        """
+
+        if not getattr(settings, 'QUERY_BUDGET', None):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.max_queries = settings.QUERY_BUDGET['MAX_QUERIES']
+        self.max_repeats = settings.QUERY_BUDGET['MAX_REPEATS']
+
+    def __call__(self, request: HttpRequest) -> HttpResponse:
+        """
+        Counts the queries run while the request is handled
+        """
+
+        with QueryCounter() as counter:
+            response = self.get_response(request)
+
+        repeated = counter.repeated_queries(self.max_repeats + 1)
+        if counter.count > self.max_queries or repeated:
+            view_name = (
+                request.resolver_match.view_name
+                if request.resolver_match else request.path
+                )
+            logger.warning(
+                '%s ran %d queries in %.1f ms (budget %d), %d repeated: %s',
+                view_name,
+                counter.count,
+                counter.duration * 1000,
+                self.max_queries,
+                len(repeated),
+                '; '.join(f'{number}x {sql}'
+                          for sql, number in repeated.items())
+                )
+
+        return response
+
+
+def accepted_encodings(accept_encoding: str) -> dict[str, float]:
+    """
+    Parses an Accept-Encoding header
+
+    Parameters
+    ----------
+    accept_encoding: str
+        The header, e.g., 'gzip, deflate, br;q=0.9'
+
+    Returns
+    ----------
+    Dictionary of each encoding accepted to its quality value. The
+    encodings refused with 'q=0' are left out
+    """
+
+    encodings = {}
+    for coding in accept_encoding.split(','):
+        name, _, parameters = coding.partition(';')
+        name = name.strip().lower()
+        quality = 1.0
+        parameter, _, value = parameters.partition('=')
+        if parameter.strip().lower() == 'q':
+            try:
+                quality = float(value)
+            except ValueError:
+                quality = 0.0
+        if name and quality > 0:
+            encodings[name] = quality
+
+    return encodings
+
+
+class StaticFilesMiddleware:
+    """
+    Serves the files in 'settings.STATIC_ROOT' when DEBUG is off
+
+    The brotli ('.br') or gzip ('.gz') copy written by
+    'words_app.storage.CompressedManifestStaticFilesStorage' is sent
+    when the browser accepts it. Files with a content hash in their
+    name never change, so they are cached by browsers for a year
+    without being revalidated
+    """
+
+    # Precompressed copies in order of preference
+    encodings = (('br', '.br'), ('gzip', '.gz'))
+    # One year, the longest time browsers are expected to cache a file
+    immutable_max_age = 31536000
+    # Files without a hash in their name may change between deploys
+    max_age = 60
+
+    def __init__(self, get_response) -> None:
+        """
+        Parameters
+        ----------
+        get_response: Callable
+            The next middleware or the view
+        """
+
+        # The development server serves the static files itself
+        if settings.DEBUG or not settings.STATIC_ROOT:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.static_prefix = urlparse(settings.STATIC_URL).path
+        self.hashed_names = set(
+            getattr(staticfiles_storage, 'hashed_files', {}).values()
+            )
+
+    def __call__(self, request: HttpRequest) -> HttpResponse:
+        """
+        Serves the request if it is for a static file
+        """
+
+        if (request.method not in ('GET', 'HEAD')
+                or not request.path_info.startswith(self.static_prefix)):
+            return self.get_response(request)
+
+        name = request.path_info[len(self.static_prefix):]
+        try:
+            path = safe_join(settings.STATIC_ROOT, name)
+        except SuspiciousFileOperation:
+            return self.get_response(request)
+        if not os.path.isfile(path):
+            return self.get_response(request)
+
+        content_type, _ = mimetypes.guess_type(path)
+        accepted = accepted_encodings(
+            request.META.get('HTTP_ACCEPT_ENCODING', '')
+            )
+        encoding, served_path = None, path
+        for candidate, extension in self.encodings:
+            if candidate in accepted and os.path.isfile(path + extension):
+                encoding, served_path = candidate, path + extension
+                break
+
+        response = FileResponse(
+            open(served_path, 'rb'),
+            content_type=content_type or 'application/octet-stream'
+            )
+        if encoding:
+            response['Content-Encoding'] = encoding
+        patch_vary_headers(response, ('Accept-Encoding',))
+
+        if name in self.hashed_names:
+            patch_cache_control(response,
+                                public=True,
+                                max_age=self.immutable_max_age,
+                                immutable=True)
+        else:
+            patch_cache_control(response, public=True, max_age=self.max_age)
+
+        return response
+
+
+class GzipStream:
+    """
+    Compresses a response with gzip one chunk at a time
+
+    The gzip header is given a random length file name, so the size of
+    the compressed page changes on every request. This stops an
+    attacker from guessing a secret in the page (such as the CSRF
+    token) from the compressed size (the BREACH attack)
+    """
+
+    encoding = 'gzip'
+    # The most random bytes added to the header
+    max_random_bytes = 100
+
+    def __init__(self) -> None:
+        # Bytes written since the last flush
+        self._pending = 0
+        self._buffer = BytesIO()
+        self._file = GzipFile(
+            filename=get_random_string(
+                secrets.randbelow(self.max_random_bytes) + 1
+                ),
+            mode='wb',
+            compresslevel=6,
+            fileobj=self._buffer,
+            mtime=0
+            )
+
+    def _read(self) -> bytes:
+        """Returns and removes what has been written to the buffer"""
+
+        data = self._buffer.getvalue()
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        return data
+
+    def compress(self, chunk: bytes) -> bytes:
+        """Compresses a chunk and returns the bytes ready to be sent"""
+
+        self._file.write(chunk)
+        self._pending += len(chunk)
+        if self._pending >= STREAM_FLUSH_SIZE:
+            self._file.flush()
+            self._pending = 0
+        return self._read()
+
+    def finish(self) -> bytes:
+        """Returns the last compressed bytes"""
+
+        self._file.close()
+        return self._read()
+
+
+class BrotliStream:
+    """
+    Compresses a response with brotli one chunk at a time
+
+    Brotli has no header to pad, but Django masks the CSRF token with a
+    new random value on every request, so it cannot be guessed from the
+    compressed size
+    """
+
+    encoding = 'br'
+
+    def __init__(self) -> None:
+        # Quality 11 is too slow to run on every request
+        self._compressor = brotli.Compressor(quality=5)
+        # Bytes processed since the last flush
+        self._pending = 0
+
+    def compress(self, chunk: bytes) -> bytes:
+        """Compresses a chunk and returns the bytes ready to be sent"""
+
+        data = self._compressor.process(chunk)
+        self._pending += len(chunk)
+        if self._pending >= STREAM_FLUSH_SIZE:
+            data += self._compressor.flush()
+            self._pending = 0
+        return data
+
+    def finish(self) -> bytes:
+        """Returns the last compressed bytes"""
+        return self._compressor.finish()
+
+
+class CompressionMiddleware:
+    """
+    Compresses text responses with the encoding the browser prefers
+
+    Small responses, responses that are already compressed and binary
+    content types are sent as they are. The bytes saved and the CPU time
+    spent compressing are recorded per view under a metric named after
+    the encoding, i.e., 'compression.br' or 'compression.gzip'
+    """
+
+    # Responses smaller than this are not worth compressing
+    min_size = 200
+    # Content types that compress well. Images are already compressed
+    compressible_types = ('text/', 'application/json',
+                          'application/javascript', 'application/xml',
+                          'image/svg+xml')
+
+    def __init__(self, get_response) -> None:
+        """
+        Parameters
+        ----------
+        get_response: Callable
+            The next middleware or the view
+        """
+
+        self.get_response = get_response
+        self.streams = {'gzip': GzipStream}
+        if brotli:
+            self.streams['br'] = BrotliStream
+
+    def choose_stream(self, request: HttpRequest):
+        """
+        Returns the compression stream class for the encoding the
+        browser accepts with the highest quality value (brotli if tied),
+        or None if it accepts none of them
+        """
+
+        accepted = accepted_encodings(
+            request.META.get('HTTP_ACCEPT_ENCODING', '')
+            )
+        encodings = sorted(
+            (encoding for encoding in self.streams if encoding in accepted),
+            key=lambda encoding: (accepted[encoding], encoding == 'br'),
+            reverse=True
+            )
+
+        return self.streams[encodings[0]] if encodings else None
+
+    def __call__(self, request: HttpRequest) -> HttpResponse:
+        """
+        Compresses the response if it is worth it
+        """
+
+        response = self.get_response(request)
+
+        content_type = response.get('Content-Type', '')
+        if (response.has_header('Content-Encoding')
+                or not content_type.startswith(self.compressible_types)
+                or getattr(response, 'is_async', False)
+                or (not response.streaming
+                    and len(response.content) < self.min_size)):
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        stream_class = self.choose_stream(request)
+        if stream_class is None:
+            return response
+
+        view_name = (request.resolver_match.view_name
+                     if request.resolver_match else request.path)
+
+        if response.streaming:
+            response.streaming_content = self.compress_chunks(
+                response.streaming_content, stream_class(), view_name
+                )
+            del response.headers['Content-Length']
+        else:
+            compressed = b''.join(self.compress_chunks(
+                [response.content], stream_class(), view_name
+                ))
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response.headers['Content-Length'] = str(len(compressed))
+
+        # A strong ETag must change with the encoding, so make it weak
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = stream_class.encoding
+
+        return response
+
+    def compress_chunks(self, chunks, stream, view_name: str):
+        """
+        Compresses the chunks of a response as they are sent and records
+        the compression metrics once the last chunk is compressed
+
+        Parameters
+        ----------
+        chunks: Iterable[bytes]
+            The content of the response
+        stream: GzipStream | BrotliStream
+            The stream compressing the response
+        view_name: str
+            The view the response is from
+
+        Returns
+        ----------
+        Generator of compressed bytes
+        """
+
+        original_bytes = compressed_bytes = 0
+        cpu_seconds = 0.0
+
+        for chunk in chunks:
+            start = time.thread_time()
+            data = stream.compress(chunk)
+            cpu_seconds += time.thread_time() - start
+            original_bytes += len(chunk)
+            compressed_bytes += len(data)
+            if data:
+                yield data
+
+        start = time.thread_time()
+        data = stream.finish()
+        cpu_seconds += time.thread_time() - start
+        compressed_bytes += len(data)
+
+        metrics.add(f'compression.{stream.encoding}',
+                    view_name,
+                    original_bytes=original_bytes,
+                    compressed_bytes=compressed_bytes,
+                    bytes_saved=original_bytes - compressed_bytes,
+                    cpu_seconds=cpu_seconds)
+
+        yield data
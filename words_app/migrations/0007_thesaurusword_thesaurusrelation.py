@@ -0,0 +1,35 @@
+# Generated by Django 5.0.6 on 2026-10-19 13:11
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('words_app', '0006_remove_favouriteword_user_favouriteword_users_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ThesaurusWord',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('word', models.CharField(max_length=100, unique=True)),
+                ('is_recorded', models.BooleanField(default=False)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ThesaurusRelation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('relation_type', models.PositiveSmallIntegerField(choices=[(1, 'Synonym'), (2, 'Antonym')])),
+                ('source', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='relations', to='words_app.thesaurusword')),
+                ('target', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='words_app.thesaurusword')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='thesaurusrelation',
+            constraint=models.UniqueConstraint(fields=('source', 'target', 'relation_type'), name='unique_thesaurus_relation'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.0.6 on 2026-10-19 13:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('words_app', '0008_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WordOfDay',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True)),
+                ('word', models.CharField(max_length=100)),
+                ('payload', models.JSONField()),
+            ],
+        ),
+    ]
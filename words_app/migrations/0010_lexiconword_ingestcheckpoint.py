@@ -0,0 +1,37 @@
+# Generated by Django 5.0.6 on 2026-10-19 13:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('words_app', '0009_wordofday'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IngestCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=500, unique=True)),
+                ('source_size', models.BigIntegerField()),
+                ('source_modified', models.FloatField()),
+                ('records', models.BigIntegerField(default=0)),
+                ('is_complete', models.BooleanField(default=False)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='LexiconWord',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('word', models.CharField(max_length=100, unique=True)),
+                ('frequency', models.FloatField(blank=True, null=True)),
+                ('syllables', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('letters', models.PositiveSmallIntegerField()),
+                ('pronunciation', models.CharField(blank=True, max_length=200)),
+                ('payload', models.JSONField()),
+            ],
+        ),
+    ]
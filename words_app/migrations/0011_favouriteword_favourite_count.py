@@ -0,0 +1,42 @@
+# Generated by Django 5.0.6 on 2026-10-19 13:41
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_favourites(apps, schema_editor):
+    FavouriteWord = apps.get_model('words_app', 'FavouriteWord')
+    user_favourite_word = FavouriteWord.users.through
+    FavouriteWord.objects.update(favourite_count=Coalesce(
+        Subquery(
+            user_favourite_word.objects.
+            filter(favouriteword_id=OuterRef('id')).
+            order_by().values('favouriteword_id').
+            annotate(count=Count('id')).values('count'),
+            output_field=IntegerField()
+            ),
+        0
+        ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('words_app', '0010_lexiconword_ingestcheckpoint'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='favouriteword',
+            name='favourite_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(count_favourites, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='favouriteword',
+            index=models.Index(fields=['-favourite_count', 'word'], name='favourite_count_idx'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.0.6 on 2026-10-19 13:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('words_app', '0011_favouriteword_favourite_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ThrottleWindow',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=100)),
+                ('window', models.BigIntegerField()),
+                ('count', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='throttlewindow',
+            constraint=models.UniqueConstraint(fields=('key', 'window'), name='unique_throttle_window'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.0.6 on 2026-10-19 16:02
+
+from django.db import migrations
+
+
+def process_payloads(apps, schema_editor):
+    from words_app.utils import process_word_of_day
+
+    WordOfDay = apps.get_model('words_app', 'WordOfDay')
+    days = list(WordOfDay.objects.exclude(payload__has_key='results_data'))
+    for day in days:
+        day.payload = process_word_of_day(day.payload)
+    WordOfDay.objects.bulk_update(days, ['payload'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('words_app', '0012_throttlewindow'),
+    ]
+
+    operations = [
+        migrations.RunPython(process_payloads, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.0.6 on 2026-10-19 16:48
+
+from django.db import migrations, models
+
+
+def set_heartbeats(apps, schema_editor):
+    Job = apps.get_model('words_app', 'Job')
+    Job.objects.filter(started_at__isnull=False).update(
+        heartbeat_at=models.F('started_at')
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('words_app', '0013_process_word_of_day_payload'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='job',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(set_heartbeats, migrations.RunPython.noop),
+    ]
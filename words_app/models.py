@@ -3,7 +3,14 @@ Defines the database models for the words app
 
 It includes the 'FavouriteWord' model, which represents words that can
 be marked as favourites by multiple users. The model includes fields for
-the word, the users who favourited it, and the date it was added
+the word, the users who favourited it, how many users favourited it and
+the date it was added. The 'ThesaurusWord' and 'ThesaurusRelation'
+models store the synonyms and antonyms returned by WordsAPI as a graph
+of words. The 'Job' model is the queue of background jobs run by the
+'run_jobs' command, and the 'WordOfDay' model is the calendar of words
+of the day. The 'LexiconWord' and 'IngestCheckpoint' models hold the
+word records loaded from WordsAPI dumps by the 'ingest_lexicon' command,
+and the 'ThrottleWindow' model counts the WordsAPI calls of each user
 """
 # words_app/models.py
 from django.db import models
@@ -21,9 +28,195 @@ class FavouriteWord(models.Model):
     # Ensure word is unique
     word = models.CharField(max_length=100, unique=True)
     date_added = models.DateField(auto_now_add=True)
+    # Number of users who favourited the word. Updated with each
+    # favourite and unfavourite so the most favourited words can be
+    # read from an index instead of counting the links
+    favourite_count = models.PositiveIntegerField(default=0)
 
     # Permissions could be defined here within Meta class
+    class Meta:
+        indexes = [
+            models.Index(fields=['-favourite_count', 'word'],
+                         name='favourite_count_idx'),
+            ]
 
     def __str__(self) -> str:
         """Returns a word"""
         return f'{self.word}'
+
+
+class ThesaurusWord(models.Model):
+    """
+    Subclasses from 'django.db.models.Model'. It represents a word in
+    the thesaurus graph. Its integer id is used to store the relations
+    between words compactly
+    """
+    word = models.CharField(max_length=100, unique=True)
+    # Whether the synonyms and antonyms of the word have been recorded
+    is_recorded = models.BooleanField(default=False)
+
+    def __str__(self) -> str:
+        """Returns a word"""
+        return f'{self.word}'
+
+
+class ThesaurusRelation(models.Model):
+    """
+    Subclasses from 'django.db.models.Model'. It represents an edge in
+    the thesaurus graph, i.e., a synonym or antonym of a word
+    """
+
+    class RelationType(models.IntegerChoices):
+        """The kinds of relation between two words"""
+        SYNONYM = 1
+        ANTONYM = 2
+
+    source = models.ForeignKey(ThesaurusWord,
+                               on_delete=models.CASCADE,
+                               related_name='relations')
+    target = models.ForeignKey(ThesaurusWord,
+                               on_delete=models.CASCADE,
+                               related_name='+')
+    relation_type = models.PositiveSmallIntegerField(
+        choices=RelationType.choices
+        )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['source', 'target', 'relation_type'],
+                name='unique_thesaurus_relation'
+                ),
+        ]
+
+    def __str__(self) -> str:
+        """Returns the relation between two words"""
+        return (
+            f'{self.source} -> {self.target} '
+            f'({self.get_relation_type_display()})'
+            )
+
+
+class WordOfDay(models.Model):
+    """
+    Subclasses from 'django.db.models.Model'. It represents the word of
+    the day for a UK date, filled in ahead by the
+    'fill_word_of_day_calendar' command
+    """
+    # Unique, so looking up today's word uses the index
+    date = models.DateField(unique=True)
+    word = models.CharField(max_length=100)
+    # The word as shown on the index page, see 'process_word_of_day'
+    payload = models.JSONField()
+
+    def __str__(self) -> str:
+        """Returns the date and the word"""
+        return f'{self.date}: {self.word}'
+
+
+class Job(models.Model):
+    """
+    Subclasses from 'django.db.models.Model'. It represents a run of a
+    background job registered in 'words_app/jobs.py'
+    """
+
+    class Status(models.IntegerChoices):
+        """The stages of a job run"""
+        QUEUED = 1
+        RUNNING = 2
+        SUCCEEDED = 3
+        FAILED = 4
+
+    # The name the job was registered under
+    name = models.CharField(max_length=100)
+    # The keyword arguments passed to the job
+    kwargs = models.JSONField(default=dict, blank=True)
+    status = models.PositiveSmallIntegerField(choices=Status.choices,
+                                              default=Status.QUEUED)
+    # The job is not run before this time
+    run_at = models.DateTimeField()
+    # The number of times the job has been started
+    attempts = models.PositiveSmallIntegerField(default=0)
+    started_at = models.DateTimeField(null=True, blank=True)
+    # Updated by the worker while the job runs. A running job whose
+    # worker stopped updating it is queued again
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    # How long the last attempt took, in seconds
+    duration = models.FloatField(null=True, blank=True)
+    # The error raised by the last failed attempt
+    error = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [
+            # Used by the workers to find the next job to run
+            models.Index(fields=['status', 'run_at'],
+                         name='job_status_run_at_idx'),
+        ]
+
+    def __str__(self) -> str:
+        """Returns the job name and its status"""
+        return f'{self.name} ({self.get_status_display()})'
+
+
+class LexiconWord(models.Model):
+    """
+    Subclasses from 'django.db.models.Model'. It represents a word
+    record loaded from a WordsAPI dump, with the fields used to filter
+    words kept in their own columns
+    """
+    word = models.CharField(max_length=100, unique=True)
+    frequency = models.FloatField(null=True, blank=True)
+    syllables = models.PositiveSmallIntegerField(null=True, blank=True)
+    letters = models.PositiveSmallIntegerField()
+    pronunciation = models.CharField(max_length=200, blank=True)
+    # The record in the form WordsAPI returns it
+    payload = models.JSONField()
+
+    def __str__(self) -> str:
+        """Returns a word"""
+        return f'{self.word}'
+
+
+class IngestCheckpoint(models.Model):
+    """
+    Subclasses from 'django.db.models.Model'. It records how far the
+    'ingest_lexicon' command got through a dump, so it can resume there
+    """
+    # The absolute path of the dump
+    source = models.CharField(max_length=500, unique=True)
+    # The size and modification time of the dump, to notice changes
+    source_size = models.BigIntegerField()
+    source_modified = models.FloatField()
+    # The number of records read, valid or not
+    records = models.BigIntegerField(default=0)
+    is_complete = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self) -> str:
+        """Returns the dump and how far it was read"""
+        return f'{self.source}: {self.records} records'
+
+
+class ThrottleWindow(models.Model):
+    """
+    Subclasses from 'django.db.models.Model'. It counts the WordsAPI
+    calls made for a user in one fixed window of the throttle (see
+    words_app/throttle.py)
+    """
+    # Who the calls are counted for, e.g., 'user_1'
+    key = models.CharField(max_length=100)
+    # The number of the window, i.e., its start time divided by its
+    # length
+    window = models.BigIntegerField()
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['key', 'window'],
+                                    name='unique_throttle_window'),
+        ]
+
+    def __str__(self) -> str:
+        """Returns the key, the window and the count"""
+        return f'{self.key} in window {self.window}: {self.count}'
@@ -0,0 +1,207 @@
+"""
+Contains the on-demand profiling of single requests by staff users
+
+A staff user can add '_profile' to the querystring of any words app
+page, or send an 'X-Profile' header, to have that request profiled with
+cProfile. The report lists the functions that took the most cumulative
+time, every database query run and the WordsAPI calls, cache operations
+and template renders of the request with their timings:
+
+    /view_word/wizard/?_profile          the report replaces the page
+    /view_word/wizard/?_profile=save     the page is returned and the
+                                         report saved to the directory
+                                         'settings.PROFILING_DIRECTORY'
+
+Saved reports come with the raw cProfile data ('.prof'), which can be
+opened with 'python -m pstats' or snakeviz. Requests without the
+parameter or header, or from other users, are not profiled and only
+cost the check for them
+"""
+# words_app/profiling.py
+
+import cProfile
+import io
+import logging
+import pstats
+import time
+from pathlib import Path
+from django.conf import settings
+from django.http import HttpRequest, HttpResponse
+from django.utils import timezone
+from .query_budget import QueryCounter
+from .tracing import Trace, collect_spans
+from . import constants
+
+logger = logging.getLogger(__name__)
+
+
+def profile_mode(request: HttpRequest) -> str | None:
+    """
+    Returns how a request asks to be profiled: 'inline', 'save' or None
+    if it does not
+    """
+
+    mode = request.GET.get('_profile')
+    if mode is None:
+        mode = request.headers.get('X-Profile')
+        if mode is None:
+            return None
+    return 'save' if mode.strip().lower() == 'save' else 'inline'
+
+
+def build_report(request: HttpRequest,
+                 response: HttpResponse,
+                 profile: cProfile.Profile,
+                 counter: QueryCounter,
+                 trace: Trace,
+                 seconds: float) -> str:
+    """
+    Writes the profiling report of a request
+
+    Parameters
+    ----------
+    request: HttpRequest
+        The profiled request
+    response: HttpResponse
+        The response of the view
+    profile: cProfile.Profile
+        The profile of the request
+    counter: QueryCounter
+        The queries run by the request
+    trace: Trace
+        The spans recorded for the request
+    seconds: float
+        How long the request took
+
+    Returns
+    ----------
+    String
+    """
+
+    report = io.StringIO()
+    report.write(
+        f'{request.method} {request.get_full_path()} -> '
+        f'{response.status_code} in {seconds * 1000:.1f} ms\n'
+        f'Request ID: {getattr(request, "request_id", "-")}\n'
+        f'Profiled at {timezone.now().isoformat()}\n\n'
+        )
+
+    report.write(f'== Top {constants.PROFILE_TOP_FUNCTIONS} functions by '
+                 f'cumulative time ==\n')
+    stats = pstats.Stats(profile, stream=report)
+    stats.strip_dirs().sort_stats(pstats.SortKey.CUMULATIVE).print_stats(
+        constants.PROFILE_TOP_FUNCTIONS
+        )
+
+    repeated = counter.repeated_queries()
+    report.write(f'== {counter.count} database queries in '
+                 f'{counter.duration * 1000:.1f} ms, {len(repeated)} '
+                 f'repeated ==\n')
+    for number, (sql, query_seconds) in enumerate(counter.queries, 1):
+        report.write(f'{number:4}. {query_seconds * 1000:8.2f} ms  {sql}\n')
+
+    spans = [trace_span for trace_span in trace.spans
+             if not trace_span.name.startswith('db.')]
+    upstream = [trace_span for trace_span in spans
+                if trace_span.name == 'http.client']
+    report.write(f'\n== {len(upstream)} WordsAPI calls in '
+                 f'{sum(s.duration_ns for s in upstream) / 1e6:.1f} ms, '
+                 f'cache operations and template renders ==\n')
+    # Spans are recorded as they finish, so order them by start time
+    for trace_span in sorted(spans, key=lambda s: s.start_time_ns):
+        details = ' '.join(f'{key}={value}'
+                           for key, value in trace_span.attributes.items())
+        error = f' error={trace_span.error}' if trace_span.error else ''
+        report.write(f'{trace_span.duration_ns / 1e6:10.2f} ms  '
+                     f'{trace_span.name}  {details}{error}\n')
+
+    return report.getvalue()
+
+
+def save_report(report: str,
+                profile: cProfile.Profile,
+                request: HttpRequest) -> str:
+    """
+    Saves a report and its cProfile data to
+    'settings.PROFILING_DIRECTORY'
+
+    Returns
+    ----------
+    String
+        The name the files were saved under, without extension
+    """
+
+    directory = Path(settings.PROFILING_DIRECTORY)
+    directory.mkdir(parents=True, exist_ok=True)
+    view_name = (request.resolver_match.view_name.replace(':', '.')
+                 if request.resolver_match else 'unknown')
+    name = (f'{timezone.now():%Y%m%d-%H%M%S}-{view_name}-'
+            f'{getattr(request, "request_id", "")[:8]}')
+
+    (directory / f'{name}.txt').write_text(report, encoding='utf-8')
+    profile.dump_stats(directory / f'{name}.prof')
+
+    return name
+
+
+class ProfilingMiddleware:
+    """
+    Profiles the requests of staff users that ask for it with the
+    '_profile' parameter or the 'X-Profile' header. Must come after
+    'AuthenticationMiddleware'
+    """
+
+    def __init__(self, get_response) -> None:
+        """
+        Parameters
+        ----------
+        get_response: Callable
+            The next middleware or the view
+        """
+
+        self.get_response = get_response
+
+    def __call__(self, request: HttpRequest) -> HttpResponse:
+        """
+        Profiles the request if asked to, and returns the report or the
+        response
+        """
+
+        mode = profile_mode(request)
+        if mode is None or not request.user.is_staff:
+            return self.get_response(request)
+
+        profile = cProfile.Profile()
+        with collect_spans() as trace, QueryCounter() as counter:
+            try:
+                profile.enable()
+            except ValueError:
+                # Another profiler is running in this thread
+                logger.warning('Could not profile %s', request.path)
+                return self.get_response(request)
+            start = time.perf_counter()
+            try:
+                response = self.get_response(request)
+            finally:
+                profile.disable()
+            seconds = time.perf_counter() - start
+
+        # Only the words app views are profiled
+        if (request.resolver_match is None
+                or request.resolver_match.app_name != 'words_app'):
+            return response
+
+        report = build_report(request, response, profile, counter, trace,
+                              seconds)
+
+        if mode == 'save':
+            name = save_report(report, profile, request)
+            response['X-Profile-Report'] = name
+            logger.info('Saved the profile of %s as %s', request.path, name)
+            return response
+
+        report_response = HttpResponse(
+            report, content_type='text/plain; charset=utf-8'
+            )
+        report_response['Cache-Control'] = 'no-store'
+        return report_response
@@ -0,0 +1,148 @@
+"""
+Contains the tools used to keep the number of database queries per
+request in check
+
+The 'QueryCounter' class records every query run on the database
+connections, how long it took and which queries were repeated. It is
+used by 'QueryBudgetMiddleware' to log slow views and can be used in
+tests to fail when a view runs more queries than expected, e.g.:
+
+    with QueryCounter() as counter:
+        self.client.get(reverse('words_app:index'))
+    counter.assert_within_budget(max_queries=8)
+"""
+# words_app/query_budget.py
+
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack
+from django.db import connections
+
+# Numbers and quoted strings, which are removed from the SQL so queries
+# that only differ by their values are counted as the same query
+SQL_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+\b")
+# Statements that start and end transactions and savepoints. A request
+# that writes several times runs them more than once, which is not a
+# repeated query
+TRANSACTION_CONTROL = re.compile(
+    r'\s*(BEGIN|COMMIT|ROLLBACK|SAVEPOINT|RELEASE)\b', re.IGNORECASE
+    )
+
+
+class QueryCounter:
+    """
+    A context manager that records the SQL and duration of every query
+    run on the database connections while it is active
+    """
+
+    def __init__(self, using: list[str] | None = None) -> None:
+        """
+        Parameters
+        ----------
+        using: list[str] | None
+            The aliases of the database connections to watch. All the
+            connections are watched if None
+        """
+
+        self._using = using
+        self._exit_stack = None
+        # List of (sql, seconds) tuples
+        self.queries = []
+
+    def __enter__(self) -> 'QueryCounter':
+        """Starts recording the queries"""
+
+        self._exit_stack = ExitStack()
+        aliases = self._using or list(connections)
+        for alias in aliases:
+            self._exit_stack.enter_context(
+                connections[alias].execute_wrapper(self._record)
+                )
+
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        """Stops recording the queries"""
+        self._exit_stack.close()
+
+    def _record(self, execute, sql, params, many, context):
+        """
+        Runs a query and records its SQL and how long it took. Follows
+        the signature required by 'connection.execute_wrapper'
+        """
+
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((sql, time.perf_counter() - start))
+
+    @property
+    def count(self) -> int:
+        """Returns the number of queries run"""
+        return len(self.queries)
+
+    @property
+    def duration(self) -> float:
+        """Returns the total time spent running queries, in seconds"""
+        return sum(seconds for _, seconds in self.queries)
+
+    def repeated_queries(self, min_repeats: int = 2) -> dict[str, int]:
+        """
+        Returns the queries that were run at least 'min_repeats' times,
+        ignoring their values and transaction control statements. A
+        query repeated many times is usually a sign of an N+1 problem,
+        i.e., one query per item of a list
+
+        Parameters
+        ----------
+        min_repeats: int
+            The number of times a query must be run to be returned
+
+        Returns
+        ----------
+        Dictionary of SQL to the number of times it was run
+        """
+
+        repeats = Counter(
+            SQL_LITERALS.sub('?', sql) for sql, _ in self.queries
+            if not TRANSACTION_CONTROL.match(sql)
+            )
+
+        return {sql: number for sql, number in repeats.items()
+                if number >= min_repeats}
+
+    def assert_within_budget(self,
+                             max_queries: int,
+                             max_repeats: int = 1) -> None:
+        """
+        Checks that no more than 'max_queries' queries were run and that
+        no query was run more than 'max_repeats' times
+
+        Parameters
+        ----------
+        max_queries: int
+            The maximum number of queries allowed
+        max_repeats: int
+            The maximum number of times the same query may be run
+
+        Raises
+        ----------
+        AssertionError
+            If the budget was exceeded. The message lists the queries
+        """
+
+        repeated = self.repeated_queries(max_repeats + 1)
+        if self.count <= max_queries and not repeated:
+            return
+
+        queries = '\n'.join(
+            f'{number}. {sql}'
+            for number, (sql, _) in enumerate(self.queries, 1)
+            )
+        raise AssertionError(
+            f'{self.count} queries were run (budget {max_queries}), '
+            f'{len(repeated)} repeated more than {max_repeats} times:\n'
+            f'{queries}'
+            )
@@ -0,0 +1,294 @@
+"""
+Contains the rhyme and word ending indexes
+
+It includes an index of the lexicon words spelled backwards, which
+finds the words ending in some letters, and an index of rhyme keys,
+which finds the words that rhyme with a word. Both rank the words by
+their WordsAPI frequency score. Advanced searches that only ask for a
+word ending are answered from the local index instead of WordsAPI
+"""
+# words_app/rhymes.py
+
+import re
+import threading
+from collections import defaultdict
+from typing import Iterable
+from .lexicon import LexiconEntry
+from .snapshot import BackgroundIndex
+from .suggestions import PrefixIndex
+from . import constants
+
+# Vowel symbols used in WordsAPI (IPA) pronunciations
+IPA_VOWELS = 'aeiouyæɑɒɔəɚɛɜɝɪʊʌʏøœɐɘɵɤɯɨʉ'
+# Stress and length marks, which do not change what a word rhymes with
+IPA_MARKS = re.compile('[ˈˌː.]')
+# The last group of vowels in a spelling and the letters after it
+SPELLING_RHYME = re.compile(r'[aeiouy]+[^aeiouy]*$')
+# A letter pattern that only asks for the words ending in some letters
+ENDING_PATTERN = re.compile(r'^([a-z]+)\$$')
+
+
+def pronunciation_rhyme_key(pronunciation: str) -> str:
+    """
+    Returns the part of a pronunciation from the vowel of its last
+    stressed syllable to the end. Words with the same key rhyme
+
+    Parameters
+    ----------
+    pronunciation: str
+        A WordsAPI (IPA) pronunciation, e.g., 'ˈwɪzərd'
+
+    Returns
+    ----------
+    String (empty if the pronunciation has no vowel)
+    """
+
+    # Only look at the syllables from the last stress mark onwards
+    stressed = pronunciation.rsplit('ˈ', 1)[-1]
+    stressed = IPA_MARKS.sub('', stressed)
+
+    for position, symbol in enumerate(stressed):
+        if symbol in IPA_VOWELS:
+            return stressed[position:]
+
+    return ''
+
+
+def spelling_rhyme_key(word: str) -> str:
+    """
+    Returns the last group of vowels of a word and the letters after
+    it, used when the pronunciation of a word is not known. A final
+    silent 'e' is kept with the letters before it, e.g., 'make' has the
+    key 'ake'
+
+    Parameters
+    ----------
+    word: str
+        The word to find the key of
+
+    Returns
+    ----------
+    String (empty if the word has no vowel)
+    """
+
+    word = word.lower()
+    silent_e = (
+        len(word) > 3 and word.endswith('e') and word[-2] not in 'aeiouy'
+        )
+    stem = word[:-1] if silent_e else word
+
+    match = SPELLING_RHYME.search(stem)
+    if not match:
+        return ''
+
+    return match.group() + ('e' if silent_e else '')
+
+
+class RhymeIndex:
+    """
+    Finds the words ending in some letters and the words that rhyme
+    with a word
+
+    Word endings are found with a prefix index over the words spelled
+    backwards. Rhymes are found by grouping the words by their rhyme
+    key. The key is taken from the pronunciation of a word when the
+    lexicon has it and from its spelling otherwise
+    """
+
+    def __init__(self, entries: Iterable[LexiconEntry]) -> None:
+        """
+        Builds the indexes from the lexicon entries
+
+        Parameters
+        ----------
+        entries: Iterable[LexiconEntry]
+            The lexicon entries to index
+        """
+
+        entries = list(entries)
+        self._pronunciations = {entry.word: entry.pronunciation
+                                for entry in entries
+                                if entry.pronunciation}
+        self._endings = PrefixIndex.from_entries(
+            [entry._replace(word=entry.word[::-1]) for entry in entries]
+            )
+
+        pronunciation_rhymes = defaultdict(list)
+        spelling_rhymes = defaultdict(list)
+        for entry in sorted(entries, key=lambda entry: -entry.frequency):
+            if entry.pronunciation:
+                pronunciation_rhymes[
+                    pronunciation_rhyme_key(entry.pronunciation)
+                    ].append(entry.word)
+            # Every word has a spelling key, so words whose
+            # pronunciation is not known can still be matched
+            spelling_rhymes[spelling_rhyme_key(entry.word)].append(
+                entry.word
+                )
+
+        self._pronunciation_rhymes = {
+            key: tuple(words)
+            for key, words in pronunciation_rhymes.items() if key
+            }
+        self._spelling_rhymes = {
+            key: tuple(words)
+            for key, words in spelling_rhymes.items() if key
+            }
+
+    def __len__(self) -> int:
+        """Returns the number of words in the index"""
+        return len(self._endings)
+
+    def ending_with(self,
+                    ending: str,
+                    limit: int = constants.NUM_OF_RHYMES) -> list[str]:
+        """
+        Returns the most frequent words ending in some letters
+
+        Parameters
+        ----------
+        ending: str
+            The letters the words must end in
+        limit: int
+            The maximum number of words to return
+
+        Returns
+        ----------
+        List of strings
+        """
+
+        return [word[::-1] for word in
+                self._endings.complete(ending.strip().lower()[::-1], limit)]
+
+    def count_ending_with(self, ending: str) -> int:
+        """
+        Returns the number of words ending in some letters
+
+        Parameters
+        ----------
+        ending: str
+            The letters the words must end in
+
+        Returns
+        ----------
+        Int
+        """
+
+        return self._endings.count(ending.strip().lower()[::-1])
+
+    def rhymes_with(self,
+                    word: str,
+                    limit: int = constants.NUM_OF_RHYMES) -> list[str]:
+        """
+        Returns the most frequent words that rhyme with a word
+
+        Parameters
+        ----------
+        word: str
+            The word to find rhymes for
+        limit: int
+            The maximum number of words to return
+
+        Returns
+        ----------
+        List of strings
+        """
+
+        word = word.strip().lower()
+        pronunciation = self._pronunciations.get(word)
+        if pronunciation:
+            rhymes = self._pronunciation_rhymes.get(
+                pronunciation_rhyme_key(pronunciation), ()
+                )
+        else:
+            rhymes = self._spelling_rhymes.get(spelling_rhyme_key(word), ())
+
+        return [rhyme for rhyme in rhymes[:limit + 1] if rhyme != word][:limit]
+
+
+# The rhyme index of this process
+_rhyme_index = BackgroundIndex('rhyme', RhymeIndex)
+
+
+def warm_rhyme_index() -> threading.Thread:
+    """
+    Starts building the rhyme index of the current lexicon snapshot in
+    a background thread, unless it is built or being built
+
+    Parameters
+    ----------
+    None
+
+    Returns
+    ----------
+    threading.Thread
+        The thread building the index
+    """
+
+    return _rhyme_index.warm()
+
+
+def get_rhyme_index() -> RhymeIndex | None:
+    """
+    Returns the rhyme index if it has been built. Otherwise starts
+    building it in the background and returns None, so no request waits
+    for it. When the snapshot file is replaced, the old index is
+    returned until the new one is built
+
+    Parameters
+    ----------
+    None
+
+    Returns
+    ----------
+    RhymeIndex | None
+    """
+
+    return _rhyme_index.get()
+
+
+def search_word_ending(querystring: dict) -> dict | None:
+    """
+    Answers an advanced search locally if it only asks for the words
+    ending in some letters (a letter pattern such as 'ight$')
+
+    Parameters
+    ----------
+    querystring: dict
+        The advanced search parameters sent to WordsAPI
+
+    Returns
+    ----------
+    Dictionary in the same form as the WordsAPI search results, or None
+    if the search has to be sent to WordsAPI
+    """
+
+    match = ENDING_PATTERN.match(querystring.get('letterPattern', ''))
+    other_parameters = [
+        value for key, value in querystring.items()
+        if key not in ('letterPattern', 'limit') and value
+        ]
+    if not match or other_parameters:
+        return None
+
+    rhyme_index = get_rhyme_index()
+    if rhyme_index is None:
+        return None
+
+    ending = match.group(1)
+    total = rhyme_index.count_ending_with(ending)
+    if not total:
+        return None
+
+    try:
+        limit = int(querystring.get('limit', constants.NUM_OF_RHYMES))
+    except ValueError:
+        limit = constants.NUM_OF_RHYMES
+
+    return {
+        'query': querystring,
+        'results': {
+            'total': total,
+            'data': rhyme_index.ending_with(ending, limit),
+            },
+        }
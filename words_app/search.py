@@ -0,0 +1,190 @@
+"""
+Contains the canonical form of advanced searches and the search result
+cache
+
+The same search can be written in many ways, e.g., with the parameters
+in another order, with empty parameters or with '05' instead of '5'.
+'CanonicalQuery' reduces a search to one querystring, which is used in
+the URL of the results page, and hashes it to get the key the results
+are cached under. Repeated and shared searches are then only sent to
+WordsAPI once
+"""
+# words_app/search.py
+
+import hashlib
+from decimal import Decimal, InvalidOperation
+from functools import partial
+from urllib.parse import parse_qsl, urlencode
+from .caching import cached_fetch, refresh_cached
+from .jobs import enqueue
+from .rhymes import search_word_ending
+from .utils import fetch_word
+from . import constants
+
+# WordsAPI search parameters whose values are numbers
+NUMERIC_PARAMETERS = frozenset([
+    'lettersmin', 'lettersMax', 'letters', 'syllables', 'syllablesMin',
+    'syllablesMax', 'frequencymin', 'frequencymax', 'limit',
+    ])
+
+
+def normalise_number(value: str) -> str:
+    """
+    Writes a number in its shortest form, e.g., '05' as '5' and '2.50'
+    as '2.5'. Values that are not numbers are returned as they are
+
+    Parameters
+    ----------
+    value: str
+        The number to normalise
+
+    Returns
+    ----------
+    String
+    """
+
+    try:
+        number = Decimal(value)
+    except InvalidOperation:
+        return value
+    if not number.is_finite():
+        return value
+
+    number = number.normalize()
+    # normalize() writes whole numbers such as 10 as '1E+1'
+    if number == number.to_integral_value():
+        return str(number.quantize(Decimal(1)))
+
+    return format(number, 'f')
+
+
+def advanced_search_params(cleaned_data: dict) -> dict:
+    """
+    Maps the fields of the advanced search form to the WordsAPI search
+    parameters
+
+    Parameters
+    ----------
+    cleaned_data: dict
+        The cleaned data of an 'AdvancedSearchForm'. Fields that are
+        missing, e.g., because they are not valid, are left out
+
+    Returns
+    ----------
+    Dictionary of the WordsAPI search parameters
+    """
+
+    return {
+        "letterPattern": cleaned_data.get('letter_pattern'),
+        "lettersmin": cleaned_data.get('letters_min'),
+        "lettersMax": cleaned_data.get('letters_max'),
+        "letters": cleaned_data.get('letters'),
+        "syllables": cleaned_data.get('syllables'),
+        "syllablesMin": cleaned_data.get('syllables_min'),
+        "syllablesMax": cleaned_data.get('syllables_max'),
+        "frequencymin": cleaned_data.get('frequency_min'),
+        "frequencymax": cleaned_data.get('frequency_max'),
+        }
+
+
+class CanonicalQuery:
+    """
+    An advanced search in canonical form: empty parameters dropped,
+    values stripped, numbers normalised and parameters sorted by name
+    """
+
+    def __init__(self, params: dict) -> None:
+        """
+        Parameters
+        ----------
+        params: dict
+            The WordsAPI search parameters
+        """
+
+        canonical = {}
+        for key, value in params.items():
+            value = '' if value is None else str(value).strip()
+            if not value:
+                continue
+            if key in NUMERIC_PARAMETERS:
+                value = normalise_number(value)
+            canonical[key] = value
+
+        self.params = dict(sorted(canonical.items()))
+        self.querystring = urlencode(self.params)
+        self.hash = hashlib.sha256(
+            self.querystring.encode('utf-8')
+            ).hexdigest()
+
+    @classmethod
+    def from_querystring(cls, querystring: str) -> 'CanonicalQuery':
+        """
+        Builds the canonical query from a querystring, e.g., from the
+        URL of the results page
+
+        Parameters
+        ----------
+        querystring: str
+            The search parameters, e.g., 'letterPattern=%5Ea&limit=200'
+
+        Returns
+        ----------
+        CanonicalQuery
+        """
+
+        return cls(dict(parse_qsl(querystring)))
+
+    @property
+    def cache_key(self) -> str:
+        """Returns the key the search results are cached under"""
+        return f'advanced_search_{self.hash}'
+
+    def __eq__(self, other: object) -> bool:
+        """Returns True if both are the same search"""
+        return (isinstance(other, CanonicalQuery)
+                and self.querystring == other.querystring)
+
+    def __hash__(self) -> int:
+        """Returns the hash of the canonical querystring"""
+        return hash(self.querystring)
+
+
+def search_words(query: CanonicalQuery, refresh: bool = False) -> dict:
+    """
+    Returns the results of an advanced search, from the local word
+    ending index, the cache or WordsAPI, in that order. Results from
+    WordsAPI are cached, and stale results are refreshed by the
+    'warm_search' job
+
+    Parameters
+    ----------
+    query: CanonicalQuery
+        The search
+    refresh: bool
+        Whether to fetch new results even if the cached ones are fresh,
+        e.g., to warm the cache
+
+    Returns
+    ----------
+    Dictionary (empty if the search failed)
+    """
+
+    local_results = search_word_ending(query.params)
+    if local_results:
+        return local_results
+
+    if refresh:
+        get = refresh_cached
+    else:
+        get = partial(cached_fetch,
+                      refresh_later=lambda: enqueue(
+                          'warm_search', querystring=query.querystring
+                          ))
+
+    return get(
+        query.cache_key,
+        lambda: fetch_word(get_random_word=False, querystring=query.params),
+        fresh_for=constants.SEARCH_RESULTS_CACHE_TIMEOUT,
+        stale_for=constants.SEARCH_RESULTS_STALE_TIMEOUT,
+        is_valid=lambda results: bool(results) and 'results' in results
+        )
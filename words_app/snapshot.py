@@ -0,0 +1,403 @@
+"""
+Contains the binary lexicon snapshot shared by the server processes
+
+The snapshot holds the lexicon in a form that can be used straight from
+the file, without parsing it. Workers open it with 'mmap', so the
+operating system keeps one copy of it in memory for all of them, and a
+worker starts using it as soon as the file is opened
+
+The file is made of a header and sections, each starting at a multiple
+of 8 bytes. All numbers are little-endian:
+
+    header          magic b'WWLEXSNP', version (u16), 2 unused bytes,
+                    number of words n (u32), then the byte offset of
+                    each of the 7 sections below (u64 each)
+    word offsets    n + 1 u32: word i is word_pool[offset[i]:offset[i+1]]
+    word pool       the UTF-8 words, sorted, one after the other
+    frequencies     n float32 WordsAPI frequency scores
+    syllables       n u8 numbers of syllables
+    letters         n u8 numbers of letters (at most 255)
+    pronunciation   n + 1 u32 offsets into the pronunciation pool
+    offsets
+    pronunciation   the UTF-8 pronunciations
+    pool
+
+A new snapshot is written to a temporary file and renamed over the old
+one, which is atomic. Workers notice the new file by its inode and
+open it, while requests still using the old mapping finish with it.
+The indexes that read the snapshot directly are cached by snapshot.
+Those that have to be built from its entries are 'BackgroundIndex'es,
+built again in a background thread when the file is replaced
+"""
+# words_app/snapshot.py
+
+import logging
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import threading
+import time
+from array import array
+from pathlib import Path
+from typing import Callable, Iterable, Iterator
+from django.conf import settings
+from .lexicon import LexiconEntry, get_lexicon
+from . import constants
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'WWLEXSNP'
+VERSION = 1
+# Magic, version, unused, number of words and the 7 section offsets
+HEADER = struct.Struct('<8sHHI7Q')
+SECTIONS = ('word_offsets', 'word_pool', 'frequencies', 'syllables',
+            'letters', 'pronunciation_offsets', 'pronunciation_pool')
+
+
+def _padding(size: int) -> bytes:
+    """Returns the bytes needed to align a section to 8 bytes"""
+    return b'\0' * (-size % 8)
+
+
+def _little_endian(values: array) -> bytes:
+    """Returns the bytes of an array of numbers in little-endian order"""
+
+    if sys.byteorder == 'big':
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def write_snapshot(entries: Iterable[LexiconEntry], path: str | Path) -> int:
+    """
+    Writes the lexicon entries to a snapshot file, replacing any
+    existing snapshot atomically
+
+    Parameters
+    ----------
+    entries: Iterable[LexiconEntry]
+        The lexicon entries. Duplicate words are dropped, keeping the
+        first occurrence
+    path: str | Path
+        Where to write the snapshot
+
+    Returns
+    ----------
+    Int
+        The number of words written
+    """
+
+    unique_entries = {}
+    for entry in entries:
+        unique_entries.setdefault(entry.word, entry)
+    sorted_entries = sorted(unique_entries.values(),
+                            key=lambda entry: entry.word)
+
+    def pool(strings: list[bytes]) -> tuple[bytes, bytes]:
+        """Returns the offsets and the pool of a list of strings"""
+        offsets = array('I', [0])
+        for string in strings:
+            offsets.append(offsets[-1] + len(string))
+        return _little_endian(offsets), b''.join(strings)
+
+    words = [entry.word.encode('utf-8') for entry in sorted_entries]
+    word_offsets, word_pool = pool(words)
+    pronunciation_offsets, pronunciation_pool = pool(
+        [entry.pronunciation.encode('utf-8') for entry in sorted_entries]
+        )
+    sections = [
+        word_offsets,
+        word_pool,
+        _little_endian(array('f', [entry.frequency
+                                   for entry in sorted_entries])),
+        bytes(min(max(entry.syllables, 0), 255) for entry in sorted_entries),
+        bytes(min(len(entry.word), 255) for entry in sorted_entries),
+        pronunciation_offsets,
+        pronunciation_pool,
+        ]
+
+    section_offsets = []
+    position = HEADER.size + len(_padding(HEADER.size))
+    for section in sections:
+        section_offsets.append(position)
+        position += len(section) + len(_padding(len(section)))
+
+    path = Path(path)
+    with tempfile.NamedTemporaryFile(dir=path.parent,
+                                     prefix=f'.{path.name}.',
+                                     delete=False) as snapshot_file:
+        snapshot_file.write(HEADER.pack(MAGIC, VERSION, 0,
+                                        len(sorted_entries),
+                                        *section_offsets))
+        snapshot_file.write(_padding(HEADER.size))
+        for section in sections:
+            snapshot_file.write(section)
+            snapshot_file.write(_padding(len(section)))
+        snapshot_file.flush()
+        os.fsync(snapshot_file.fileno())
+    # Temporary files are only readable by their owner
+    os.chmod(snapshot_file.name, 0o644)
+
+    # Readers see either the whole old file or the whole new one
+    os.replace(snapshot_file.name, path)
+
+    return len(sorted_entries)
+
+
+class LexiconSnapshot:
+    """
+    A lexicon snapshot file mapped into memory. The numeric columns are
+    memoryviews over the mapping, so reading them copies nothing. On a
+    big-endian machine they are byte swapped copies instead
+    """
+
+    def __init__(self, path: str | Path) -> None:
+        """
+        Maps a snapshot file into memory
+
+        Parameters
+        ----------
+        path: str | Path
+            The snapshot file
+
+        Raises
+        ----------
+        ValueError
+            If the file is not a snapshot of a supported version
+        """
+
+        with open(path, 'rb') as snapshot_file:
+            self.inode = os.fstat(snapshot_file.fileno()).st_ino
+            self._mmap = mmap.mmap(snapshot_file.fileno(), 0,
+                                   access=mmap.ACCESS_READ)
+
+        if len(self._mmap) < HEADER.size:
+            raise ValueError(f'{path} is not a lexicon snapshot')
+        magic, version, _, count, *section_offsets = HEADER.unpack_from(
+            self._mmap
+            )
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f'{path} is not a version {VERSION} '
+                             f'lexicon snapshot')
+
+        self._count = count
+        # The byte offset of each section, by name
+        self.offsets = dict(zip(SECTIONS, section_offsets))
+
+        view = memoryview(self._mmap)
+
+        def column(name: str, item_size: int, item_format: str,
+                   length: int) -> memoryview | array:
+            """Returns a section of the file as an array of numbers"""
+            start = self.offsets[name]
+            values = view[start:start + item_size * length].cast(item_format)
+            if sys.byteorder == 'big' and item_size > 1:
+                values = array(item_format, values)
+                values.byteswap()
+            return values
+
+        self._word_offsets = column('word_offsets', 4, 'I', count + 1)
+        self._pronunciation_offsets = column('pronunciation_offsets', 4, 'I',
+                                             count + 1)
+        self.frequencies = column('frequencies', 4, 'f', count)
+        self.syllables = column('syllables', 1, 'B', count)
+        self.letters = column('letters', 1, 'B', count)
+        self._word_pool = self.offsets['word_pool']
+        self._pronunciation_pool = self.offsets['pronunciation_pool']
+
+    def __len__(self) -> int:
+        """Returns the number of words in the snapshot"""
+        return self._count
+
+    @property
+    def buffer(self) -> mmap.mmap:
+        """Returns the mapped file, e.g., to read columns with NumPy"""
+        return self._mmap
+
+    def word(self, index: int) -> str:
+        """Returns the word at an index, in alphabetical order"""
+
+        start = self._word_pool + self._word_offsets[index]
+        end = self._word_pool + self._word_offsets[index + 1]
+        return self._mmap[start:end].decode('utf-8')
+
+    def pronunciation(self, index: int) -> str:
+        """Returns the pronunciation of the word at an index"""
+
+        start = self._pronunciation_pool + self._pronunciation_offsets[index]
+        end = (self._pronunciation_pool
+               + self._pronunciation_offsets[index + 1])
+        return self._mmap[start:end].decode('utf-8')
+
+    def entry(self, index: int) -> LexiconEntry:
+        """Returns the lexicon entry of the word at an index"""
+
+        # float32 keeps about 7 significant digits, so rounding gives
+        # back the score that was written, e.g., 6.3 not 6.3000001
+        return LexiconEntry(self.word(index),
+                            round(self.frequencies[index], 6),
+                            self.syllables[index],
+                            self.pronunciation(index))
+
+    def __iter__(self) -> Iterator[LexiconEntry]:
+        """Yields the lexicon entries in alphabetical order"""
+
+        for index in range(self._count):
+            yield self.entry(index)
+
+
+# The snapshot opened by this process and when its file was last checked
+_snapshot = None
+_snapshot_checked_at = 0.0
+
+
+def get_lexicon_snapshot() -> LexiconSnapshot | None:
+    """
+    Returns the lexicon snapshot at 'settings.WORDS_LEXICON_SNAPSHOT_PATH',
+    opening it again if the file was replaced. The file is checked at
+    most every 'constants.SNAPSHOT_CHECK_INTERVAL' seconds
+
+    Parameters
+    ----------
+    None
+
+    Returns
+    ----------
+    LexiconSnapshot | None
+        None if there is no snapshot file
+    """
+
+    global _snapshot, _snapshot_checked_at
+
+    if (_snapshot is not None and time.monotonic() - _snapshot_checked_at
+            < constants.SNAPSHOT_CHECK_INTERVAL):
+        return _snapshot
+    _snapshot_checked_at = time.monotonic()
+
+    path = Path(settings.WORDS_LEXICON_SNAPSHOT_PATH)
+    try:
+        inode = path.stat().st_ino
+    except FileNotFoundError:
+        _snapshot = None
+        return None
+
+    if _snapshot is None or _snapshot.inode != inode:
+        _snapshot = LexiconSnapshot(path)
+
+    return _snapshot
+
+
+class BackgroundIndex:
+    """
+    An index built from the lexicon in a background thread, so no
+    request waits for it. When the snapshot file is replaced, the index
+    is built again in the background and the old one is used until the
+    new one is ready
+
+    Threads do not survive a fork, e.g., when gunicorn is run with
+    '--preload', so a build that was still running when the process was
+    forked is started again in the child the next time it is needed
+    """
+
+    def __init__(self,
+                 name: str,
+                 build: Callable[[Iterable[LexiconEntry]], object]) -> None:
+        """
+        Parameters
+        ----------
+        name: str
+            What the index is for, e.g., 'spelling'
+        build: Callable[[Iterable[LexiconEntry]], object]
+            Builds the index from the lexicon entries
+        """
+
+        self.name = name
+        self.build = build
+        # The index, once built
+        self.index = None
+        # The snapshot the index was last built from, or is being built
+        # from, the thread building it and whether it is still building
+        self._snapshot = None
+        self._thread = None
+        self._building = False
+        self._lock = threading.Lock()
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self) -> None:
+        """
+        Forgets the build thread of the parent process if it was still
+        building, since it does not exist in the child
+        """
+
+        self._lock = threading.Lock()
+        if self._building:
+            self._thread = None
+            self._building = False
+
+    def _build(self, snapshot: LexiconSnapshot | None) -> None:
+        """
+        Builds the index for a snapshot, or from the lexicon file. Run
+        in a thread
+        """
+
+        try:
+            self.index = self.build(
+                snapshot if snapshot is not None else get_lexicon()
+                )
+        except Exception:
+            logger.exception('Could not build the %s index', self.name)
+        finally:
+            self._building = False
+
+    def warm(self) -> threading.Thread:
+        """
+        Starts building the index of the current lexicon snapshot in a
+        background thread, unless it is built or being built
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        ----------
+        threading.Thread
+            The thread building the index
+        """
+
+        snapshot = get_lexicon_snapshot()
+        with self._lock:
+            if self._thread is None or (self._snapshot is not snapshot
+                                        and not self._building):
+                self._snapshot = snapshot
+                self._building = True
+                self._thread = threading.Thread(
+                    target=self._build,
+                    args=(snapshot,),
+                    name=f'{self.name}-index',
+                    daemon=True
+                    )
+                self._thread.start()
+
+        return self._thread
+
+    def get(self):
+        """
+        Returns the index if it has been built. Otherwise starts
+        building it and returns None
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        ----------
+        The index or None
+        """
+
+        if self.index is None or self._snapshot is not get_lexicon_snapshot():
+            self.warm()
+
+        return self.index
@@ -0,0 +1,129 @@
+"""
+Contains the static files storage used when the site is deployed
+
+'collectstatic' copies the static files to 'settings.STATIC_ROOT' with
+the hash of their contents in their names (e.g., 'styles.3b1f2c.css'),
+so a changed file always gets a new URL and browsers can cache every
+file forever. Text files are also saved gzip and brotli compressed next
+to the originals, so they are compressed once at build time instead of
+on every request, and PNG images are optimised
+
+Brotli and Pillow are in requirements.txt. If either is missing, the
+'.br' files are not written or the images are copied as they are
+"""
+# words_app/storage.py
+
+import gzip
+import os
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """
+    Saves the hashed copy of each static file, a gzip ('.gz') and a
+    brotli ('.br') copy of each text file and optimises the PNG images
+    """
+
+    # Files that are worth compressing. Images are already compressed
+    compressible_extensions = ('.css', '.js', '.svg', '.txt', '.json',
+                               '.map', '.html', '.xml')
+    # Compressed copies that do not save at least this fraction of the
+    # size are not written, so the original is served instead
+    min_compression_saving = 0.05
+
+    def post_process(self, paths, dry_run=False, **options):
+        """
+        Hashes the files, then compresses and optimises the hashed
+        copies. Yields (original name, processed name, processed)
+        tuples, as expected by 'collectstatic'
+        """
+
+        yield from super().post_process(paths, dry_run, **options)
+
+        if dry_run:
+            return
+
+        for name, hashed_name in self.hashed_files.items():
+            if hashed_name.endswith('.png'):
+                if self.optimise_image(hashed_name):
+                    yield name, hashed_name, True
+            elif hashed_name.endswith(self.compressible_extensions):
+                for compressed_name in self.compress(hashed_name):
+                    yield name, compressed_name, True
+
+    def compress(self, name: str) -> list[str]:
+        """
+        Writes the gzip and brotli copies of a file
+
+        Parameters
+        ----------
+        name: str
+            The name of the file in the storage
+
+        Returns
+        ----------
+        List of the names of the compressed copies written
+        """
+
+        with self.open(name) as original:
+            content = original.read()
+
+        compressors = [('.gz', lambda content: gzip.compress(
+            content, compresslevel=9, mtime=0
+            ))]
+        if brotli:
+            compressors.append(('.br', lambda content: brotli.compress(
+                content, quality=11
+                )))
+
+        compressed_names = []
+        for extension, compress in compressors:
+            compressed = compress(content)
+            if len(compressed) > len(content) * (
+                    1 - self.min_compression_saving):
+                continue
+            with open(self.path(name + extension), 'wb') as compressed_file:
+                compressed_file.write(compressed)
+            compressed_names.append(name + extension)
+
+        return compressed_names
+
+    def optimise_image(self, name: str) -> bool:
+        """
+        Saves a PNG image again with Pillow's optimiser, keeping the
+        original if the optimised copy is not smaller
+
+        Parameters
+        ----------
+        name: str
+            The name of the image in the storage
+
+        Returns
+        ----------
+        True if the image was made smaller, False otherwise
+        """
+
+        if Image is None:
+            return False
+
+        path = self.path(name)
+        optimised_path = path + '.tmp'
+        with Image.open(path) as image:
+            image.save(optimised_path, format='PNG', optimize=True)
+
+        if os.path.getsize(optimised_path) < os.path.getsize(path):
+            os.replace(optimised_path, path)
+            return True
+
+        os.remove(optimised_path)
+        return False
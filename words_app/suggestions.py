@@ -0,0 +1,477 @@
+"""
+Contains the word suggestion indexes used by the search box
+
+It includes a prefix index that completes what the user is typing with
+the most frequently used words in the local lexicon, and a spelling
+index that suggests the closest known words when a lookup fails
+
+Building the spelling index takes a few seconds for a large lexicon, so
+it is built in a background thread when the server starts (see
+'warm_spelling_index') and never inside a request. Until it is ready,
+failed lookups get no spelling suggestions. When the lexicon snapshot
+is replaced, the old index is used while the new one is built
+"""
+# words_app/suggestions.py
+
+import threading
+from array import array
+from bisect import bisect_left
+from functools import lru_cache
+from typing import Callable, Iterable
+import numpy as np
+from django.conf import settings
+from .lexicon import LexiconEntry, get_lexicon
+from .snapshot import (BackgroundIndex, LexiconSnapshot,
+                       get_lexicon_snapshot)
+from . import constants
+
+
+class PrefixIndex:
+    """
+    Completes prefixes using the lexicon words sorted alphabetically.
+    The words starting with a prefix are found with two binary searches
+    and the most frequent of them are picked with NumPy, which takes a
+    few milliseconds even for a one letter prefix
+
+    When there is a lexicon snapshot, the words are read from the
+    mapped file and the frequencies are a view of it, so the index
+    copies nothing and is ready as soon as the snapshot is opened
+    """
+
+    def __init__(self,
+                 word: Callable[[int], str],
+                 frequencies: np.ndarray) -> None:
+        """
+        Parameters
+        ----------
+        word: Callable[[int], str]
+            Returns the word at an index, in alphabetical order
+        frequencies: np.ndarray
+            The WordsAPI frequency score of each word, 0 if unknown
+        """
+
+        self._word = word
+        self.frequencies = frequencies
+
+    @classmethod
+    def from_snapshot(cls, snapshot: LexiconSnapshot) -> 'PrefixIndex':
+        """Returns an index reading the words of a snapshot file"""
+
+        return cls(snapshot.word,
+                   np.frombuffer(snapshot.buffer,
+                                 dtype='<f4',
+                                 count=len(snapshot),
+                                 offset=snapshot.offsets['frequencies']))
+
+    @classmethod
+    def from_entries(cls, entries: Iterable[LexiconEntry]) -> 'PrefixIndex':
+        """Returns an index holding the lexicon entries in memory"""
+
+        entries = sorted(entries, key=lambda entry: entry.word)
+        words = [entry.word for entry in entries]
+        return cls(words.__getitem__,
+                   np.array([entry.frequency for entry in entries],
+                            dtype='<f4'))
+
+    def __len__(self) -> int:
+        """Returns the number of words in the index"""
+        return len(self.frequencies)
+
+    def _prefix_range(self, prefix: str) -> tuple[int, int]:
+        """
+        Returns the position of the first word starting with the prefix
+        and the position after the last one
+        """
+
+        start = bisect_left(range(len(self)), prefix, key=self._word)
+        # The search for the end may start where the words begin
+        end = bisect_left(range(start, len(self)), prefix + '\U0010ffff',
+                          key=self._word) + start
+
+        return start, end
+
+    def _most_frequent(self, start: int, end: int, limit: int) -> list:
+        """
+        Returns the most frequent words between two positions, most
+        frequent first and then in alphabetical order
+        """
+
+        frequencies = self.frequencies[start:end]
+        if limit <= 0:
+            return []
+        if limit < len(frequencies):
+            # Every word as frequent as the last one returned is kept,
+            # so ties are broken alphabetically below
+            threshold = np.partition(
+                frequencies, len(frequencies) - limit
+                )[len(frequencies) - limit]
+            positions = np.flatnonzero(frequencies >= threshold)
+        else:
+            positions = np.arange(len(frequencies))
+        # A stable sort keeps words as frequent in alphabetical order
+        positions = positions[
+            np.argsort(-frequencies[positions], kind='stable')
+            ][:limit]
+
+        return [self._word(start + int(position)) for position in positions]
+
+    def complete(self,
+                 prefix: str,
+                 limit: int = constants.NUM_OF_SUGGESTIONS) -> list[str]:
+        """
+        Returns the most frequent words starting with the prefix
+
+        Parameters
+        ----------
+        prefix: str
+            What the user has typed so far
+        limit: int
+            The maximum number of words to return
+
+        Returns
+        ----------
+        List of strings
+        """
+
+        prefix = prefix.strip().lower()
+        if not prefix:
+            return []
+
+        return self._most_frequent(*self._prefix_range(prefix), limit)
+
+    def count(self, prefix: str) -> int:
+        """
+        Returns the number of words starting with the prefix
+
+        Parameters
+        ----------
+        prefix: str
+            The start of the words to count
+
+        Returns
+        ----------
+        Int
+        """
+
+        prefix = prefix.strip().lower()
+        if not prefix:
+            return 0
+
+        start, end = self._prefix_range(prefix)
+
+        return end - start
+
+
+@lru_cache(maxsize=1)
+def _build_prefix_index(snapshot: LexiconSnapshot | None) -> PrefixIndex:
+    """Builds the prefix index for a snapshot, or from the lexicon file"""
+
+    if snapshot is not None:
+        return PrefixIndex.from_snapshot(snapshot)
+    return PrefixIndex.from_entries(get_lexicon())
+
+
+def get_prefix_index() -> PrefixIndex:
+    """
+    Returns the prefix index of the current lexicon snapshot, building
+    it again when the snapshot file is replaced
+
+    Parameters
+    ----------
+    None
+
+    Returns
+    ----------
+    PrefixIndex
+    """
+
+    return _build_prefix_index(get_lexicon_snapshot())
+
+
+def pattern_bitmasks(word: str) -> dict[str, int]:
+    """
+    Returns a bitmask for each letter of a word, with bit i set where
+    the letter appears at position i
+
+    The bitmasks are used by 'bit_parallel_edit_distance'
+
+    Parameters
+    ----------
+    word: str
+        The word to build the bitmasks for
+
+    Returns
+    ----------
+    Dictionary
+    """
+
+    bitmasks = {}
+    for position, letter in enumerate(word):
+        bitmasks[letter] = bitmasks.get(letter, 0) | (1 << position)
+
+    return bitmasks
+
+
+def bit_parallel_edit_distance(bitmasks: dict[str, int],
+                               length: int,
+                               word: str) -> int:
+    """
+    Returns the Levenshtein distance between a pattern, given as its
+    'pattern_bitmasks' and length, and a word
+
+    Uses Myers' bit-parallel algorithm, which updates a whole column of
+    the dynamic programming table with a few integer operations per
+    letter of the word. Building the bitmasks once lets the same
+    pattern be compared against many words cheaply
+
+    Parameters
+    ----------
+    bitmasks: dict[str, int]
+        The bitmasks of the pattern
+    length: int
+        The number of letters in the pattern
+    word: str
+        The word to compare the pattern with
+
+    Returns
+    ----------
+    Int
+    """
+
+    if not length:
+        return len(word)
+
+    all_bits = (1 << length) - 1
+    last_bit = 1 << (length - 1)
+    vertical_positive = all_bits
+    vertical_negative = 0
+    distance = length
+
+    for letter in word:
+        matches = bitmasks.get(letter, 0)
+        vertical = matches | vertical_negative
+        horizontal = (
+            (((matches & vertical_positive) + vertical_positive)
+             ^ vertical_positive) | matches
+            )
+        horizontal_positive = (
+            vertical_negative | ~(horizontal | vertical_positive)
+            )
+        horizontal_negative = vertical_positive & horizontal
+        if horizontal_positive & last_bit:
+            distance += 1
+        elif horizontal_negative & last_bit:
+            distance -= 1
+        horizontal_positive = (horizontal_positive << 1) | 1
+        horizontal_negative <<= 1
+        vertical_positive = (
+            (horizontal_negative | ~(vertical | horizontal_positive))
+            & all_bits
+            )
+        vertical_negative = horizontal_positive & vertical
+
+    return distance
+
+
+def edit_distance(first: str, second: str) -> int:
+    """
+    Returns the Levenshtein distance between two words, i.e., the
+    number of single letter insertions, deletions and substitutions
+    needed to turn one into the other
+
+    Parameters
+    ----------
+    first: str
+        The first word
+    second: str
+        The second word
+
+    Returns
+    ----------
+    Int
+    """
+
+    return bit_parallel_edit_distance(pattern_bitmasks(first),
+                                      len(first),
+                                      second)
+
+
+class SpellingIndex:
+    """
+    A BK-tree over the most frequent words in the lexicon. Each word is
+    a node and its children are keyed by their edit distance to it, so
+    a search only visits the children whose distance could be within
+    the limit (by the triangle inequality)
+
+    Memory is bounded by the number of words indexed: one word, one
+    frequency and one (possibly empty) dictionary of children per word
+    """
+
+    def __init__(self,
+                 entries: Iterable[LexiconEntry],
+                 max_words: int | None = None) -> None:
+        """
+        Builds the tree from the lexicon entries, most frequent words
+        first
+
+        Parameters
+        ----------
+        entries: Iterable[LexiconEntry]
+            The lexicon entries to index
+        max_words: int | None
+            The maximum number of words to index. The least frequent
+            words are left out. All words are indexed if None
+        """
+
+        entries = sorted(entries, key=lambda entry: -entry.frequency)
+        if max_words is not None:
+            entries = entries[:max_words]
+
+        self._words = [entry.word for entry in entries]
+        self._frequencies = array('f', [entry.frequency
+                                        for entry in entries])
+        # The children of each node, keyed by edit distance
+        self._children = [None] * len(self._words)
+
+        for node, word in enumerate(self._words[1:], 1):
+            bitmasks = pattern_bitmasks(word)
+            parent = 0
+            while True:
+                distance = bit_parallel_edit_distance(
+                    bitmasks, len(word), self._words[parent]
+                    )
+                children = self._children[parent]
+                if children is None:
+                    self._children[parent] = {distance: node}
+                    break
+                if distance not in children:
+                    children[distance] = node
+                    break
+                parent = children[distance]
+
+    def __len__(self) -> int:
+        """Returns the number of words in the index"""
+        return len(self._words)
+
+    def search(self, word: str, max_distance: int) -> list[tuple[int, str]]:
+        """
+        Returns the words within the edit distance of the word, closest
+        and then most frequent first
+
+        Parameters
+        ----------
+        word: str
+            The word to search for
+        max_distance: int
+            The maximum edit distance of the words returned
+
+        Returns
+        ----------
+        List of (distance, word) tuples
+        """
+
+        if not self._words:
+            return []
+
+        word = word.strip().lower()
+        bitmasks = pattern_bitmasks(word)
+        matches = []
+        nodes = [0]
+        while nodes:
+            node = nodes.pop()
+            distance = bit_parallel_edit_distance(
+                bitmasks, len(word), self._words[node]
+                )
+            if distance <= max_distance:
+                matches.append((distance, -self._frequencies[node], node))
+            children = self._children[node]
+            if children:
+                nodes.extend(
+                    child for child_distance, child in children.items()
+                    if abs(child_distance - distance) <= max_distance
+                    )
+
+        matches.sort()
+        return [(distance, self._words[node])
+                for distance, _, node in matches]
+
+    def suggest(self,
+                word: str,
+                max_distance: int = constants.SPELLING_MAX_DISTANCE,
+                limit: int = constants.NUM_OF_SUGGESTIONS) -> list[str]:
+        """
+        Returns the best spelling suggestions for a word that could not
+        be found, excluding the word itself
+
+        Parameters
+        ----------
+        word: str
+            The misspelled word
+        max_distance: int
+            The maximum edit distance of the suggestions
+        limit: int
+            The maximum number of suggestions to return
+
+        Returns
+        ----------
+        List of strings
+        """
+
+        word = word.strip().lower()
+
+        # Most misspellings are one edit away, so only search further
+        # when nothing closer was found. Larger distances visit much
+        # more of the tree
+        for distance in range(1, max_distance + 1):
+            suggestions = [suggestion for _, suggestion
+                           in self.search(word, distance)
+                           if suggestion != word]
+            if suggestions:
+                return suggestions[:limit]
+
+        return []
+
+
+# The spelling index of this process
+_spelling_index = BackgroundIndex(
+    'spelling',
+    lambda entries: SpellingIndex(entries,
+                                  max_words=settings.SPELLING_INDEX_MAX_WORDS)
+    )
+
+
+def warm_spelling_index() -> threading.Thread:
+    """
+    Starts building the spelling index of the current lexicon snapshot
+    in a background thread, unless it is built or being built
+
+    Parameters
+    ----------
+    None
+
+    Returns
+    ----------
+    threading.Thread
+        The thread building the index
+    """
+
+    return _spelling_index.warm()
+
+
+def get_spelling_index() -> SpellingIndex | None:
+    """
+    Returns the spelling index if it has been built. Otherwise starts
+    building it in the background and returns None, so no request waits
+    for it. When the snapshot file is replaced, the old index is
+    returned until the new one is built
+
+    Parameters
+    ----------
+    None
+
+    Returns
+    ----------
+    SpellingIndex | None
+    """
+
+    return _spelling_index.get()
@@ -0,0 +1,102 @@
+"""
+Defines the background jobs of the words app
+
+They are run by the workers started with 'python manage.py run_jobs'.
+See words_app/jobs.py for how jobs are queued and run
+"""
+# words_app/tasks.py
+
+from .jobs import delete_finished_jobs, job
+from .models import WordOfDay
+from .search import CanonicalQuery, search_words
+from .thesaurus import record_thesaurus_relations
+from .throttle import delete_old_throttle_windows
+from .utils import (delete_orphaned_favourite_words,
+                    fill_word_of_day_calendar,
+                    get_word_of_day,
+                    recount_favourite_words,
+                    seconds_until_midnight_uk,
+                    uk_today
+                    )
+from . import constants
+
+
+@job(schedule=seconds_until_midnight_uk, retry_delay=30, max_attempts=5)
+def refresh_word_of_day() -> None:
+    """
+    Fetches the new word of the day at midnight UK time, so no visitor
+    has to wait for it or is shown yesterday's word. Only used when
+    the word of the day calendar has not been filled in
+    """
+
+    if WordOfDay.objects.filter(date=uk_today()).exists():
+        return
+    if not get_word_of_day(refresh=True):
+        raise RuntimeError('WordsAPI did not return a word of the day')
+
+
+@job(schedule=seconds_until_midnight_uk, retry_delay=300)
+def fill_calendar() -> None:
+    """
+    Keeps the word of the day calendar filled in
+    'constants.WORD_OF_DAY_CALENDAR_DAYS' days ahead
+    """
+    fill_word_of_day_calendar(constants.WORD_OF_DAY_CALENDAR_DAYS)
+
+
+@job(schedule=lambda: constants.CLEAN_FAVOURITE_WORDS_INTERVAL)
+def clean_favourite_words() -> None:
+    """
+    Corrects the favourite counts and deletes the favourite words no
+    longer favourited by any user
+    """
+
+    recount_favourite_words()
+    delete_orphaned_favourite_words()
+
+
+@job(schedule=lambda: constants.CLEAN_THROTTLE_WINDOWS_INTERVAL)
+def clean_throttle_windows() -> None:
+    """Deletes the throttle counts of windows that are over"""
+    delete_old_throttle_windows()
+
+
+@job(schedule=lambda: constants.CLEAN_JOBS_INTERVAL)
+def clean_jobs() -> None:
+    """
+    Deletes the jobs that finished more than 'constants.JOB_RETENTION'
+    seconds ago
+    """
+    delete_finished_jobs(constants.JOB_RETENTION)
+
+
+@job(max_concurrency=2)
+def warm_search(querystring: str) -> None:
+    """
+    Fetches the results of an advanced search into the cache. Queued by
+    'search_words' when the cached results go stale
+
+    Parameters
+    ----------
+    querystring: str
+        The search parameters, as in the URL of the results page
+    """
+
+    if not search_words(CanonicalQuery.from_querystring(querystring),
+                        refresh=True):
+        raise RuntimeError(f'WordsAPI did not return results for '
+                           f'{querystring}')
+
+
+@job(max_concurrency=2)
+def record_thesaurus(word_data: dict) -> None:
+    """
+    Records the synonyms and antonyms of a word looked up for the
+    thesaurus graph. Queued by 'queue_thesaurus_relations'
+
+    Parameters
+    ----------
+    word_data: dict
+        The word, with the synonyms and antonyms of each result
+    """
+    record_thesaurus_relations(word_data)
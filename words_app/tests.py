@@ -1,3 +1,1717 @@
-# from django.test import TestCase
+"""
+Contains the tests of the words app
 
-# Create your tests here.
+WordsAPI is never called: 'requests.get' is replaced by a mock that
+returns the same word for every lookup and the same results for every
+search. Run them with:
+python manage.py test words_app
+"""
+# words_app/tests.py
+
+import gzip
+import io
+import itertools
+import json
+import os
+import random
+import struct
+import tempfile
+import threading
+import time
+from pathlib import Path
+from unittest import mock, skipUnless
+import requests
+from django.conf import settings
+from django.contrib.auth.models import Group, User
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, connections
+from django.http import HttpRequest, HttpResponse, StreamingHttpResponse
+from django.test import (RequestFactory, TestCase, TransactionTestCase,
+                         override_settings)
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from .circuit_breaker import CircuitBreaker, CircuitOpenError
+from .concurrency import AdaptiveConcurrencyLimiter
+from .facets import FacetIndex
+from .forms import BasicSearchForm
+from .games import (AnagramIndex, can_spell, get_anagram_index,
+                    letter_signature, warm_anagram_index)
+from .ingest import iter_json_array
+from .jobs import (JOBS, JobDefinition, claim_next_job,
+                   delete_finished_jobs, enqueue, job_statistics,
+                   requeue_stuck_jobs, run_job, schedule_jobs)
+from .lexicon import LexiconEntry
+from .metrics import MetricsRegistry, metrics
+from .middleware import CompressionMiddleware, StaticFilesMiddleware
+from .models import (FavouriteWord, Job, ThesaurusRelation, ThesaurusWord,
+                     WordOfDay)
+from .query_budget import TRANSACTION_CONTROL, QueryCounter
+from .rhymes import (RhymeIndex, get_rhyme_index, pronunciation_rhyme_key,
+                     search_word_ending, spelling_rhyme_key,
+                     warm_rhyme_index)
+from .search import CanonicalQuery, normalise_number, search_words
+from .snapshot import BackgroundIndex, LexiconSnapshot, write_snapshot
+from .storage import Image, brotli
+from .suggestions import (PrefixIndex, SpellingIndex, get_prefix_index,
+                          edit_distance, get_spelling_index,
+                          warm_spelling_index)
+from .thesaurus import ThesaurusGraph, record_thesaurus_relations
+from .throttle import Throttled
+from .tracing import NOOP_SPAN, TracingMiddleware, get_exporters, span
+from .utils import (fetch_word, fill_word_of_day_calendar,
+                    toggle_favourite_word, words_api_breaker,
+                    words_api_limiter)
+from . import caching, constants, games, rhymes, suggestions, thesaurus
+
+# What the WordsAPI mock returns
+WORD_DATA = {
+    'word': 'wizard',
+    'results': [{
+        'definition': 'someone who is dazzlingly skilled in any field',
+        'partOfSpeech': 'noun',
+        'synonyms': ['ace', 'genius'],
+        }],
+    'syllables': {'count': 2, 'list': ['wiz', 'ard']},
+    'pronunciation': {'all': 'ˈwɪzərd'},
+    'frequency': 4.02,
+}
+# What the WordsAPI mock returns for a search
+SEARCH_DATA = {
+    'query': {'letterPattern': '^wiz', 'limit': '200', 'page': '1'},
+    'results': {'total': 2, 'data': ['wizard', 'wizardry']},
+}
+
+
+def words_api_response(url: str, params: dict | None = None,
+                       **kwargs) -> mock.Mock:
+    """Returns a WordsAPI response for a call to 'requests.get'"""
+
+    response = mock.Mock(status_code=200)
+    response.json.return_value = (
+        SEARCH_DATA if params and 'random' not in params else WORD_DATA
+        )
+    return response
+
+
+@override_settings(WORDS_API_KEY='test')
+class WordsAppTestCase(TestCase):
+    """
+    Logs in a Pro user and replaces the WordsAPI calls with a mock
+    """
+
+    user_group = 'Pro'
+
+    def setUp(self) -> None:
+        """Creates the account groups and logs in a user"""
+
+        cache.clear()
+        for name in ('Starter', 'Plus', 'Pro'):
+            Group.objects.get_or_create(name=name)
+        self.user = User.objects.create_user('wizard', password='wizard')
+        self.user.groups.add(Group.objects.get(name=self.user_group))
+        self.client.force_login(self.user)
+
+        words_api = mock.patch('words_app.utils.requests.get')
+        self.words_api = words_api.start()
+        self.addCleanup(words_api.stop)
+        self.words_api.side_effect = words_api_response
+
+        # The thesaurus graph is loaded in a thread, which cannot read
+        # the tables while a test holds its transaction
+        reload_graph = mock.patch(
+            'words_app.thesaurus.reload_thesaurus_graph'
+            )
+        reload_graph.start()
+        self.addCleanup(reload_graph.stop)
+        self.enterContext(
+            mock.patch('words_app.thesaurus._queued_words', set())
+            )
+
+
+class QueryCounterTests(TestCase):
+    """Tests the counting of repeated queries"""
+
+    def test_transaction_control_is_not_repeated(self) -> None:
+        counter = QueryCounter()
+        counter.queries = [
+            ('BEGIN', 0), ('SAVEPOINT "s1"', 0), ('RELEASE SAVEPOINT "s1"', 0),
+            ('SAVEPOINT "s2"', 0), ('RELEASE SAVEPOINT "s2"', 0),
+            ('COMMIT', 0), ('BEGIN', 0), ('COMMIT', 0),
+            ]
+        self.assertEqual(counter.repeated_queries(), {})
+
+    def test_repeated_query_ignores_values(self) -> None:
+        counter = QueryCounter()
+        counter.queries = [
+            ('SELECT * FROM "word" WHERE "id" = 1', 0),
+            ('SELECT * FROM "word" WHERE "id" = 2', 0),
+            ]
+        self.assertEqual(counter.repeated_queries(),
+                         {'SELECT * FROM "word" WHERE "id" = ?': 2})
+        with self.assertRaises(AssertionError):
+            counter.assert_within_budget(max_queries=2, max_repeats=1)
+
+
+class ViewQueryBudgetTests(WordsAppTestCase):
+    """
+    Checks the number of queries run by each view, with an empty cache
+    and with a warm one. The budgets are the numbers measured, so any
+    new query fails the test until its budget is raised
+    """
+
+    # URL name, arguments and the budgets with a cold and a warm cache
+    budgets = [
+        ('words_app:index', (), 18, 6),
+        ('words_app:favourite', (), 4, 4),
+        ('words_app:view_word', ('wizard',), 8, 7),
+        ('words_app:random_word', (), 6, 5),
+        ('words_app:games', (), 3, 3),
+        ('words_app:user_profile', (), 3, 3),
+        ('words_app:upgrade_account', (), 3, 3),
+        ('words_app:most_favourited', (), 10, 4),
+        ('words_app:most_favourited_api', (), 3, 3),
+        ('words_app:suggest_words', (), 2, 2),
+        ('words_app:search_facets', (), 2, 2),
+        ('words_app:view_words', (CanonicalQuery({
+            'letterPattern': '^wiz',
+            'limit': constants.NUM_OF_PRO_RESULTS,
+            }).querystring,), 11, 4),
+        ]
+
+    def test_views_within_budget(self) -> None:
+        for cache_state, budget_index in (('cold', 2), ('warm', 3)):
+            for budget in self.budgets:
+                url = reverse(budget[0], args=budget[1])
+                with self.subTest(url=url, cache=cache_state):
+                    with QueryCounter() as counter:
+                        response = self.client.get(url)
+                    self.assertEqual(response.status_code, 200)
+                    counter.assert_within_budget(
+                        max_queries=budget[budget_index],
+                        max_repeats=settings.QUERY_BUDGET['MAX_REPEATS']
+                        )
+
+    def test_no_budget_warning_on_normal_traffic(self) -> None:
+        with self.assertNoLogs('words_app.middleware', level='WARNING'):
+            for _ in range(2):
+                for budget in self.budgets:
+                    self.client.get(reverse(budget[0], args=budget[1]))
+
+
+class JobSchedulingTests(TestCase):
+    """Tests the queueing of scheduled jobs and their statistics"""
+
+    def test_scheduled_jobs_are_queued_once(self) -> None:
+        scheduled = sum(1 for definition in JOBS.values()
+                        if definition.schedule)
+        self.assertEqual(schedule_jobs(), scheduled)
+        self.assertEqual(schedule_jobs(), 0)
+        self.assertEqual(Job.objects.count(), scheduled)
+
+    def test_job_statistics(self) -> None:
+        now = timezone.now()
+        Job.objects.create(name='fill_calendar', run_at=now,
+                           status=Job.Status.SUCCEEDED,
+                           finished_at=now, duration=1.0)
+        Job.objects.create(name='fill_calendar', run_at=now,
+                           status=Job.Status.FAILED,
+                           finished_at=now, duration=3.0)
+        Job.objects.create(name='fill_calendar', run_at=now)
+        self.assertEqual(job_statistics(), {'fill_calendar': {
+            'runs': 2, 'failures': 1, 'queued': 1,
+            'mean_duration_seconds': 2.0, 'max_duration_seconds': 3.0,
+            }})
+
+
+class JobQueueTests(TestCase):
+    """Tests the queueing, pruning and requeueing of jobs"""
+
+    def test_stale_search_queues_warm_search(self) -> None:
+        cache.clear()
+        query = CanonicalQuery({'letterPattern': '^wiz'})
+        # Fresh until a second ago
+        with mock.patch('words_app.caching.time.time',
+                        return_value=time.time() - 1 -
+                        constants.SEARCH_RESULTS_CACHE_TIMEOUT):
+            caching._store(query.cache_key, SEARCH_DATA,
+                           fresh_for=constants.SEARCH_RESULTS_CACHE_TIMEOUT,
+                           stale_for=constants.SEARCH_RESULTS_STALE_TIMEOUT)
+
+        with mock.patch('words_app.utils.requests.get') as words_api:
+            self.assertEqual(search_words(query), SEARCH_DATA)
+            self.assertEqual(search_words(query), SEARCH_DATA)
+        words_api.assert_not_called()
+
+        queued_job = Job.objects.get()
+        self.assertEqual(queued_job.name, 'warm_search')
+        self.assertEqual(queued_job.kwargs,
+                         {'querystring': query.querystring})
+
+    def test_finished_jobs_are_deleted(self) -> None:
+        now = timezone.now()
+        old = now - timezone.timedelta(seconds=120)
+        for status, finished_at in ((Job.Status.SUCCEEDED, old),
+                                    (Job.Status.FAILED, old),
+                                    (Job.Status.SUCCEEDED, now),
+                                    (Job.Status.QUEUED, None)):
+            Job.objects.create(name='fill_calendar', run_at=old,
+                               status=status, finished_at=finished_at)
+        self.assertEqual(delete_finished_jobs(60), 2)
+        self.assertEqual(Job.objects.count(), 2)
+
+    def test_only_jobs_without_heartbeat_are_requeued(self) -> None:
+        now = timezone.now()
+        old = now - timezone.timedelta(seconds=120)
+        alive = Job.objects.create(name='fill_calendar', run_at=old,
+                                   status=Job.Status.RUNNING,
+                                   started_at=old, heartbeat_at=now)
+        stuck = Job.objects.create(name='fill_calendar', run_at=old,
+                                   status=Job.Status.RUNNING,
+                                   started_at=old, heartbeat_at=old)
+        self.assertEqual(requeue_stuck_jobs(60), 1)
+        alive.refresh_from_db()
+        stuck.refresh_from_db()
+        self.assertEqual(alive.status, Job.Status.RUNNING)
+        self.assertEqual(stuck.status, Job.Status.QUEUED)
+
+
+class JobHeartbeatTests(TransactionTestCase):
+    """
+    Tests the heartbeat of a running job, which is sent from another
+    thread and so needs the test transaction to be committed
+    """
+
+    databases = '__all__'
+
+    def test_heartbeat_sent_while_job_runs(self) -> None:
+        definition = JobDefinition('sleep', lambda: time.sleep(0.2),
+                                   None, 1, 0, 1)
+        self.enterContext(mock.patch.dict(JOBS, {'sleep': definition}))
+        self.enterContext(
+            mock.patch.object(constants, 'JOB_HEARTBEAT_INTERVAL', 0.05)
+            )
+        enqueue('sleep')
+        claimed_job = claim_next_job()
+        first_heartbeat = claimed_job.heartbeat_at
+
+        self.assertTrue(run_job(claimed_job))
+        claimed_job.refresh_from_db()
+        self.assertGreater(claimed_job.heartbeat_at, first_heartbeat)
+
+
+class AdaptiveConcurrencyLimiterTests(TestCase):
+    """Tests the AIMD concurrency limit"""
+
+    def setUp(self) -> None:
+        self.limiter = AdaptiveConcurrencyLimiter(
+            'test', initial_limit=4, min_limit=2, max_limit=6,
+            latency_tolerance=2, backoff_ratio=0.5, queue_timeout=0
+            )
+
+    def fill(self) -> int:
+        """Takes every free slot and returns how many were taken"""
+
+        taken = 0
+        while self.limiter.acquire():
+            taken += 1
+        return taken
+
+    def test_calls_over_the_limit_are_shed(self) -> None:
+        self.assertEqual(self.fill(), 4)
+        self.assertFalse(self.limiter.acquire())
+        self.limiter.release(None)
+        self.assertTrue(self.limiter.acquire())
+        self.assertEqual(self.limiter.status()['in_flight'], 4)
+
+    def test_waiting_call_takes_a_freed_slot(self) -> None:
+        self.fill()
+        acquired = []
+        waiting = threading.Thread(
+            target=lambda: acquired.append(self.limiter.acquire(timeout=5))
+            )
+        waiting.start()
+        self.limiter.release(None)
+        waiting.join()
+        self.assertEqual(acquired, [True])
+
+    def test_fast_calls_raise_the_limit_up_to_the_maximum(self) -> None:
+        for _ in range(30):
+            for _ in range(self.fill()):
+                self.limiter.release(0.1)
+        self.assertEqual(self.limiter.limit, 6)
+
+    def test_light_traffic_does_not_raise_the_limit(self) -> None:
+        for _ in range(30):
+            self.limiter.acquire()
+            self.limiter.release(0.1)
+        self.assertEqual(self.limiter.limit, 4)
+
+    def test_slow_calls_lower_the_limit_once_per_burst(self) -> None:
+        self.limiter.acquire()
+        self.limiter.release(0.1)
+        self.fill()
+        for _ in range(4):
+            self.limiter.release(1.0)
+        self.assertEqual(self.limiter.limit, 2)
+        self.assertEqual(self.limiter.status()['latency_floor_seconds'], 0.1)
+
+        # Calls started after the decrease can lower it again, but not
+        # below the minimum
+        clock = itertools.count(time.monotonic() + 10, 10)
+        with mock.patch('words_app.concurrency.time.monotonic',
+                        side_effect=lambda: next(clock)):
+            for _ in range(3):
+                self.limiter.acquire()
+                self.limiter.release(1.0)
+        self.assertEqual(self.limiter.limit, 2)
+
+    def test_calls_that_never_went_out_do_not_change_the_limit(self) -> None:
+        self.fill()
+        for _ in range(4):
+            self.limiter.release(None)
+        self.assertEqual(self.limiter.limit, 4)
+        self.assertIsNone(self.limiter.status()['latency_floor_seconds'])
+
+
+class CircuitBreakerTests(TestCase):
+    """Tests the states of the circuit breaker"""
+
+    def setUp(self) -> None:
+        """Creates a breaker that opens after two failures"""
+        self.breaker = CircuitBreaker('test', failure_threshold=2,
+                                      slow_call_seconds=1, window=4,
+                                      reset_timeout=60)
+
+    def fail(self) -> None:
+        """Makes a failed call through the breaker"""
+        with self.assertRaises(ValueError):
+            self.breaker.call(mock.Mock(side_effect=ValueError))
+
+    def open_and_half_open(self) -> None:
+        """Opens the breaker and lets its reset timeout pass"""
+        self.fail()
+        self.fail()
+        self.breaker._opened_at -= self.breaker.reset_timeout
+
+    def test_opens_after_failures_and_refuses_calls(self) -> None:
+        self.fail()
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+        self.assertEqual(self.breaker.call(lambda: 'ok'), 'ok')
+        self.fail()
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+
+        function = mock.Mock()
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.call(function)
+        function.assert_not_called()
+
+    def test_slow_and_invalid_calls_are_failures(self) -> None:
+        with mock.patch('words_app.circuit_breaker.time.monotonic',
+                        side_effect=[0, 2]):
+            self.breaker.call(lambda: 'ok')
+        self.breaker.call(lambda: 'error', is_success=lambda result: False)
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+
+    def test_half_open_lets_one_probe_through(self) -> None:
+        self.open_and_half_open()
+        self.assertEqual(self.breaker.state, CircuitBreaker.HALF_OPEN)
+
+        def probe():
+            # A second call while the probe runs is refused
+            self.assertFalse(self.breaker.allow_request())
+            return 'ok'
+
+        self.assertEqual(self.breaker.call(probe), 'ok')
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_failed_probe_opens_again(self) -> None:
+        self.open_and_half_open()
+        self.fail()
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+
+    def test_ignored_error_frees_the_probe(self) -> None:
+        self.open_and_half_open()
+        with self.assertRaises(Throttled):
+            self.breaker.call(mock.Mock(side_effect=Throttled(10)),
+                              ignore=(Throttled,))
+        self.assertEqual(self.breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertTrue(self.breaker.allow_request())
+
+    def test_call_counted_only_once_admitted(self) -> None:
+        self.enterContext(mock.patch.multiple(
+            words_api_breaker, _state=CircuitBreaker.OPEN,
+            _opened_at=time.monotonic() - words_api_breaker.reset_timeout,
+            _probing=True
+            ))
+        count = self.enterContext(
+            mock.patch('words_app.utils.count_words_api_call')
+            )
+        words_api = self.enterContext(
+            mock.patch('words_app.utils.requests.get')
+            )
+
+        # Half open with a probe already running
+        self.assertIsNone(fetch_word('wizard', get_random_word=False))
+        count.assert_not_called()
+        words_api.assert_not_called()
+
+        # Throttled probes are not recorded as failures
+        words_api_breaker._probing = False
+        count.side_effect = Throttled(10)
+        with self.assertRaises(Throttled):
+            fetch_word('wizard', get_random_word=False)
+        words_api.assert_not_called()
+        self.assertEqual(words_api_breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertFalse(words_api_breaker._probing)
+
+
+class StaleWhileRevalidateTests(TestCase):
+    """Tests the soft and hard expiry of the WordsAPI cache"""
+
+    key = 'wizard_data'
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.fetch = mock.Mock(return_value='new')
+        self.thread = self.enterContext(
+            mock.patch('words_app.caching.threading.Thread')
+            )
+        # The refresh closes the connections of its thread, which here
+        # is the test's
+        self.enterContext(mock.patch('words_app.caching.connections'))
+
+    def get(self, **kwargs):
+        """Reads the test key through the cache"""
+        return caching.cached_fetch(self.key, self.fetch, fresh_for=60,
+                                    stale_for=600, **kwargs)
+
+    def set_entry(self, fresh_for: float, stale_for: float) -> None:
+        """Caches 'old', fresh or stale for some seconds from now"""
+
+        now = time.time()
+        cache.set(self.key, {'value': 'old',
+                             'fresh_until': now + fresh_for,
+                             'stale_until': now + stale_for})
+
+    def test_missing_and_fresh_values(self) -> None:
+        self.assertEqual(self.get(), 'new')
+        self.fetch.return_value = 'newer'
+        self.assertEqual(self.get(), 'new')
+        self.fetch.assert_called_once()
+
+        # Values that are not valid are returned but not cached
+        cache.clear()
+        self.fetch.return_value = {}
+        self.assertEqual(self.get(), {})
+        self.assertIsNone(cache.get(self.key))
+
+    def test_stale_value_refreshed_once_in_background(self) -> None:
+        self.set_entry(fresh_for=-1, stale_for=600)
+        self.assertEqual(self.get(), 'old')
+        self.assertEqual(self.get(), 'old')
+        self.fetch.assert_not_called()
+        self.thread.assert_called_once()
+        self.assertIs(self.thread.call_args.kwargs['target'],
+                      caching._refresh)
+
+        # What the thread runs
+        caching._refresh(*self.thread.call_args.kwargs['args'])
+        self.assertEqual(self.get(), 'new')
+        self.assertIsNone(cache.get(f'{self.key}_refreshing'))
+
+    def test_stale_value_refresh_can_be_queued(self) -> None:
+        refresh_later = mock.Mock()
+        self.set_entry(fresh_for=-1, stale_for=600)
+        self.assertEqual(self.get(refresh_later=refresh_later), 'old')
+        self.assertEqual(self.get(refresh_later=refresh_later), 'old')
+        refresh_later.assert_called_once()
+        self.thread.assert_not_called()
+
+    def test_failed_refresh_keeps_stale_value(self) -> None:
+        self.set_entry(fresh_for=-1, stale_for=1)
+        self.get()
+        self.fetch.side_effect = requests.ConnectionError
+        with self.assertLogs('words_app.caching', 'WARNING'):
+            caching._refresh(*self.thread.call_args.kwargs['args'])
+
+        entry = cache.get(self.key)
+        self.assertEqual(entry['value'], 'old')
+        self.assertGreater(entry['stale_until'],
+                           time.time() + constants.STALE_CACHE_EXTENSION - 5)
+        # The refresh is not retried until the lock expires
+        self.get()
+        self.thread.assert_called_once()
+
+    def test_expired_value_fetched_in_request(self) -> None:
+        self.set_entry(fresh_for=-10, stale_for=-1)
+        self.assertEqual(self.get(), 'new')
+        self.thread.assert_not_called()
+
+
+class CanonicalQueryTests(WordsAppTestCase):
+    """Tests that each search has one querystring and one cache key"""
+
+    def test_numbers_normalised(self) -> None:
+        for value, normalised in (('05', '5'), ('2.50', '2.5'), ('10', '10'),
+                                  ('1e1', '10'), ('0.000', '0'),
+                                  ('-0.5', '-0.5'), ('inf', 'inf'),
+                                  ('five', 'five')):
+            with self.subTest(value=value):
+                self.assertEqual(normalise_number(value), normalised)
+
+    def test_same_search_same_key(self) -> None:
+        query = CanonicalQuery({'letterPattern': '^wiz', 'syllables': 2,
+                                'frequencymin': '3.50', 'letters': None,
+                                'lettersMax': ''})
+        for other in (
+                CanonicalQuery({'frequencymin': '3.5', 'syllables': '02',
+                                'letterPattern': ' ^wiz '}),
+                CanonicalQuery.from_querystring(
+                    'syllables=2&letters=&letterPattern=%5Ewiz'
+                    '&frequencymin=3.500'
+                    ),
+                CanonicalQuery.from_querystring(query.querystring)):
+            with self.subTest(querystring=other.querystring):
+                self.assertEqual(other, query)
+                self.assertEqual(hash(other), hash(query))
+                self.assertEqual(other.cache_key, query.cache_key)
+        self.assertEqual(query.querystring,
+                         'frequencymin=3.5&letterPattern=%5Ewiz&syllables=2')
+        self.assertNotEqual(CanonicalQuery({'letterPattern': '^wit'}), query)
+
+    def test_search_sent_to_words_api_once(self) -> None:
+        canonical = CanonicalQuery({
+            'letterPattern': '^wiz',
+            'limit': constants.NUM_OF_PRO_RESULTS,
+            }).querystring
+
+        response = self.client.get(reverse(
+            'words_app:view_words', args=('limit=5&letterPattern=%5Ewiz',)
+            ))
+        self.assertRedirects(response, reverse('words_app:view_words',
+                                               args=(canonical,)))
+
+        for _ in range(2):
+            response = self.client.get(reverse('words_app:view_words',
+                                               args=(canonical,)))
+            self.assertEqual(response.context['num_of_results'],
+                             SEARCH_DATA['results']['total'])
+        self.assertEqual(self.words_api.call_count, 1)
+
+
+class ViewWordTests(WordsAppTestCase):
+    """Tests how a word is shown when WordsAPI cannot be called"""
+
+    def test_word_not_found(self) -> None:
+        self.words_api.side_effect = None
+        self.words_api.return_value = mock.Mock(status_code=404)
+        response = self.client.get(
+            reverse('words_app:view_word', args=('wizzard',))
+            )
+        self.assertContains(response, 'Word is not recognised')
+        self.assertFalse(response.context['words_api_degraded'])
+
+    def test_word_not_looked_up_while_breaker_open(self) -> None:
+        with mock.patch.multiple(words_api_breaker,
+                                 _state=CircuitBreaker.OPEN,
+                                 _opened_at=time.monotonic()):
+            response = self.client.get(
+                reverse('words_app:view_word', args=('wizard',))
+                )
+        self.assertNotContains(response, 'Word is not recognised')
+        self.assertContains(response, 'cannot be looked up right now')
+        self.assertTrue(response.context['words_api_degraded'])
+        self.words_api.assert_not_called()
+
+    def test_word_not_looked_up_when_shed(self) -> None:
+        with mock.patch.object(words_api_limiter, 'acquire',
+                               return_value=False):
+            response = self.client.get(
+                reverse('words_app:view_word', args=('wizard',))
+                )
+        self.assertContains(response, 'cannot be looked up right now')
+        self.assertTrue(response.context['words_api_degraded'])
+
+
+class ThesaurusRecordingTests(WordsAppTestCase):
+    """Tests that looked up words are recorded by the job queue"""
+
+    def test_relations_queued_once_on_get(self) -> None:
+        url = reverse('words_app:view_word', args=('wizard',))
+        self.client.post(url, {'add': 'wizard'})
+        self.assertFalse(Job.objects.exists())
+        self.client.get(url)
+        self.client.get(url)
+        self.client.get(reverse('words_app:random_word'))
+
+        queued_job = Job.objects.get()
+        self.assertEqual(queued_job.name, 'record_thesaurus')
+        self.assertFalse(ThesaurusWord.objects.exists())
+        self.assertTrue(run_job(claim_next_job()))
+        self.assertEqual(ThesaurusGraph.from_database().related_words('ace'),
+                         (('wizard', 1), ('genius', 2)))
+
+    def test_recorded_words_are_not_queued(self) -> None:
+        record_thesaurus_relations(WORD_DATA)
+        with mock.patch('words_app.thesaurus._graph',
+                        ThesaurusGraph.from_database()):
+            self.client.get(reverse('words_app:view_word',
+                                    args=('wizard',)))
+        self.assertFalse(Job.objects.exists())
+
+
+class PrefixIndexTests(TestCase):
+    """Tests the prefix index and the suggestions endpoint"""
+
+    def setUp(self) -> None:
+        """Indexes random words with many equal frequencies"""
+
+        generator = random.Random(11)
+        words = {''.join(generator.choice('abc')
+                         for _ in range(generator.randint(1, 6)))
+                 for _ in range(500)}
+        # Quarters are exact in the index's 32 bit floats
+        self.entries = [LexiconEntry(word, generator.randint(0, 20) / 4, 1, '')
+                        for word in words]
+        self.index = PrefixIndex.from_entries(self.entries)
+
+    def brute_force(self, prefix: str, limit: int) -> list[str]:
+        """Returns the most frequent words starting with the prefix"""
+
+        matches = sorted((entry for entry in self.entries
+                          if entry.word.startswith(prefix)),
+                         key=lambda entry: (-entry.frequency, entry.word))
+        return [entry.word for entry in matches][:limit]
+
+    def test_completions_match_brute_force(self) -> None:
+        for prefix in ('a', 'ab', 'cab', 'abcabc', 'abcabca', 'd'):
+            with self.subTest(prefix=prefix):
+                self.assertEqual(self.index.count(prefix),
+                                 len(self.brute_force(prefix, 1000)))
+                for limit in (0, 1, 10, 1000):
+                    self.assertEqual(self.index.complete(prefix, limit),
+                                     self.brute_force(prefix, limit))
+        self.assertEqual(self.index.complete(' AB ', 5),
+                         self.brute_force('ab', 5))
+        self.assertEqual(self.index.complete(''), [])
+        self.assertEqual(self.index.count(''), 0)
+
+    def test_snapshot_index_matches_entries_index(self) -> None:
+        directory = self.enterContext(tempfile.TemporaryDirectory())
+        path = Path(directory) / 'lexicon.snapshot'
+        write_snapshot(self.entries, path)
+        index = PrefixIndex.from_snapshot(LexiconSnapshot(path))
+
+        for prefix in ('a', 'bb', 'cab'):
+            with self.subTest(prefix=prefix):
+                self.assertEqual(index.complete(prefix, 20),
+                                 self.index.complete(prefix, 20))
+                self.assertEqual(index.count(prefix), self.index.count(prefix))
+
+    def test_suggestions_endpoint(self) -> None:
+        url = reverse('words_app:suggest_words')
+        self.assertEqual(self.client.get(url, {'q': 'ab'}).status_code, 302)
+
+        user = User.objects.create_user('wizard', password='wizard')
+        self.client.force_login(user)
+        with mock.patch('words_app.views.get_prefix_index',
+                        return_value=self.index):
+            response = self.client.get(url, {'q': 'ab'})
+            self.assertEqual(
+                response.json(),
+                {'suggestions': self.brute_force(
+                    'ab', constants.NUM_OF_SUGGESTIONS
+                    )}
+                )
+            # Longer text is cut to the length of the search box
+            complete = self.enterContext(mock.patch.object(
+                self.index, 'complete', wraps=self.index.complete
+                ))
+            response = self.client.get(
+                url, {'q': 'a' * (BasicSearchForm.max_search_length + 1)}
+                )
+        self.assertEqual(response.json(), {'suggestions': []})
+        complete.assert_called_once_with(
+            'a' * BasicSearchForm.max_search_length
+            )
+
+
+class RhymeIndexTests(TestCase):
+    """Tests the word ending and rhyme indexes"""
+
+    def setUp(self) -> None:
+        """Indexes a few rhyming words"""
+
+        self.entries = [LexiconEntry('night', 4.5, 1, 'naɪt'),
+                        LexiconEntry('light', 5.0, 1, 'laɪt'),
+                        LexiconEntry('bite', 3.5, 1, 'baɪt'),
+                        LexiconEntry('height', 4.0, 1, ''),
+                        LexiconEntry('weight', 4.2, 1, 'weɪt'),
+                        LexiconEntry('wizard', 4.02, 2, 'ˈwɪzərd'),
+                        LexiconEntry('lizard', 3.5, 2, 'ˈlɪzərd'),
+                        LexiconEntry('make', 4.8, 1, ''),
+                        LexiconEntry('take', 5.1, 1, '')]
+        self.index = RhymeIndex(self.entries)
+
+    def test_rhyme_keys(self) -> None:
+        self.assertEqual(pronunciation_rhyme_key('ˈwɪzərd'), 'ɪzərd')
+        self.assertEqual(pronunciation_rhyme_key('ˌʌndərˈstænd'), 'ænd')
+        self.assertEqual(pronunciation_rhyme_key('hm'), '')
+        self.assertEqual(spelling_rhyme_key('Night'), 'ight')
+        self.assertEqual(spelling_rhyme_key('make'), 'ake')
+        self.assertEqual(spelling_rhyme_key('the'), 'e')
+        self.assertEqual(spelling_rhyme_key('nth'), '')
+
+    def test_endings_match_brute_force(self) -> None:
+        generator = random.Random(19)
+        entries = [LexiconEntry(''.join(generator.choice('abc') for _ in
+                                        range(generator.randint(1, 6))),
+                                generator.randint(0, 20) / 4, 1, '')
+                   for _ in range(500)]
+        entries = list({entry.word: entry for entry in entries}.values())
+        index = RhymeIndex(entries)
+        for ending in ('a', 'bc', 'cab', 'abcabc', 'd'):
+            matches = sorted(
+                (entry for entry in entries if entry.word.endswith(ending)),
+                key=lambda entry: (-entry.frequency, entry.word[::-1])
+                )
+            with self.subTest(ending=ending):
+                self.assertEqual(index.count_ending_with(ending),
+                                 len(matches))
+                self.assertEqual(index.ending_with(ending, 10),
+                                 [entry.word for entry in matches][:10])
+
+    def test_rhymes_by_pronunciation_then_spelling(self) -> None:
+        self.assertEqual(self.index.rhymes_with('night'),
+                         ['light', 'bite'])
+        # 'height' has no pronunciation, so it is matched by spelling,
+        # which misses its rhymes with a different spelling
+        self.assertEqual(self.index.rhymes_with(' Height '), ['weight'])
+        self.assertEqual(self.index.rhymes_with('wizard'), ['lizard'])
+        self.assertEqual(self.index.rhymes_with('make', limit=1), ['take'])
+        self.assertEqual(self.index.rhymes_with('xyz'), [])
+
+    def test_ending_searches_answered_locally(self) -> None:
+        self.enterContext(mock.patch('words_app.rhymes.get_rhyme_index',
+                                     return_value=self.index))
+        self.assertEqual(
+            search_word_ending({'letterPattern': 'ight$', 'limit': '2'}),
+            {'query': {'letterPattern': 'ight$', 'limit': '2'},
+             'results': {'total': 4, 'data': ['light', 'night']}}
+            )
+        for querystring in ({'letterPattern': '^ight'},
+                            {'letterPattern': 'ight$', 'syllables': '1'},
+                            {'letterPattern': 'xyz$'},
+                            {}):
+            with self.subTest(querystring=querystring):
+                self.assertIsNone(search_word_ending(querystring))
+
+        with mock.patch('words_app.rhymes.get_rhyme_index',
+                        return_value=None):
+            self.assertIsNone(search_word_ending({'letterPattern': 'ight$'}))
+
+
+class AnagramIndexTests(TestCase):
+    """Tests the anagram index against a brute force search"""
+
+    def setUp(self) -> None:
+        """Indexes random words over a few letters"""
+
+        generator = random.Random(3)
+        self.words = sorted({
+            ''.join(generator.choice('aabdeirstw')
+                    for _ in range(generator.randint(1, 7)))
+            for _ in range(2000)
+            })
+        self.index = AnagramIndex(
+            [LexiconEntry(word, generator.random(), 0, '')
+             for word in self.words] +
+            [LexiconEntry('wi-fi', 3.0, 2, '')]
+            )
+        self.racks = [''.join(generator.choice('aabdeirstw')
+                              for _ in range(generator.randint(0, 10)))
+                      for _ in range(200)]
+
+    def test_sub_anagrams_match_brute_force(self) -> None:
+        for rack in self.racks:
+            with self.subTest(rack=rack):
+                found = self.index.sub_anagrams(rack)
+                self.assertCountEqual(
+                    found,
+                    [word for word in self.words
+                     if len(word) >= 3 and can_spell(word, rack)]
+                    )
+                lengths = [len(word) for word in found]
+                self.assertEqual(lengths, sorted(lengths, reverse=True))
+
+    def test_anagrams_match_brute_force(self) -> None:
+        for rack in self.racks:
+            with self.subTest(rack=rack):
+                self.assertCountEqual(
+                    self.index.anagrams(rack.upper()),
+                    [word for word in self.words
+                     if letter_signature(word) == letter_signature(rack)]
+                    )
+
+    def test_anagrams_ranked_by_frequency(self) -> None:
+        index = AnagramIndex([LexiconEntry('team', 3.0, 1, ''),
+                              LexiconEntry('meat', 4.5, 1, ''),
+                              LexiconEntry('mate', 3.5, 1, ''),
+                              LexiconEntry('wi-fi', 3.0, 2, '')])
+        self.assertEqual(index.anagrams('tame'), ('meat', 'mate', 'team'))
+        self.assertEqual(index.anagrams('wi-fi'), ())
+
+    def test_puzzles_can_be_solved(self) -> None:
+        random.seed(5)
+        for length in range(3, 8):
+            with self.subTest(length=length):
+                letters, solutions = self.index.generate_puzzle(
+                    length, min_solutions=1
+                    )
+                self.assertEqual(len(letters), length)
+                self.assertEqual(solutions, self.index.sub_anagrams(letters))
+                self.assertIn(letter_signature(letters),
+                              map(letter_signature, solutions))
+        self.assertIsNone(self.index.generate_puzzle(11))
+
+
+class GamesViewTests(WordsAppTestCase):
+    """Tests the games page"""
+
+    def setUp(self) -> None:
+        """Gives the games a small lexicon"""
+
+        super().setUp()
+        entries = [LexiconEntry('wizards', 3.0, 2, ''),
+                   LexiconEntry('wizard', 4.02, 2, ''),
+                   LexiconEntry('draw', 4.5, 1, ''),
+                   LexiconEntry('raw', 4.0, 1, ''),
+                   LexiconEntry('war', 4.4, 1, ''),
+                   LexiconEntry('lizard', 3.5, 2, '')]
+        self.enterContext(mock.patch('words_app.views.get_anagram_index',
+                                     return_value=AnagramIndex(entries)))
+        self.enterContext(mock.patch('words_app.views.get_rhyme_index',
+                                     return_value=RhymeIndex(entries)))
+
+    def test_guesses_checked_against_the_puzzle(self) -> None:
+        response = self.client.get(reverse('words_app:games'))
+        letters = response.context['puzzle_letters']
+        self.assertEqual(letter_signature(letters), 'adirswz')
+        self.assertEqual(response.context['puzzle_num_of_solutions'], 5)
+
+        url = reverse('words_app:games')
+        for guess, message in (('draw', 'draw is correct!'),
+                               ('draw', 'draw was already found'),
+                               ('lizard', 'lizard is not in the puzzle'),
+                               ('zaw', 'zaw is not in the puzzle')):
+            with self.subTest(guess=guess):
+                response = self.client.post(url, {'guess': guess},
+                                            follow=True)
+                self.assertContains(response, message)
+        self.assertEqual(response.context['puzzle_found'], ['draw'])
+
+        response = self.client.get(url, {'letters': 'drawl'})
+        self.assertEqual(response.context['solver_results'],
+                         ['draw', 'war', 'raw'])
+
+    def test_games_wait_for_the_indexes(self) -> None:
+        session = self.client.session
+        session['anagram_puzzle'] = {'letters': 'draziw', 'found': []}
+        session.save()
+        with mock.patch('words_app.views.get_anagram_index',
+                        return_value=None):
+            response = self.client.get(reverse('words_app:games'),
+                                       {'letters': 'draziw'})
+            self.assertTrue(response.context['games_loading'])
+            self.assertContains(response, 'The games are still loading')
+            self.assertIsNone(response.context.get('solver_results'))
+
+            response = self.client.post(reverse('words_app:games'),
+                                        {'guess': 'wizard'}, follow=True)
+        self.assertContains(response, 'Please try again in a moment')
+        self.assertEqual(self.client.session['anagram_puzzle']['found'], [])
+
+
+class WordOfDayTests(WordsAppTestCase):
+    """Tests the word of the day calendar"""
+
+    def test_calendar_holds_the_processed_word(self) -> None:
+        self.assertEqual(fill_word_of_day_calendar(1), 1)
+        self.assertEqual(WordOfDay.objects.get().payload, {
+            'usage_level': 'Commonly Used',
+            'word': 'wizard',
+            'syllable_count': 2,
+            'results_data': [{
+                'definition': WORD_DATA['results'][0]['definition'],
+                'partOfSpeech': 'noun',
+                'synonyms': ['ace', 'genius'],
+                'antonyms': None,
+                'examples': None,
+                }],
+            })
+
+        self.words_api.reset_mock()
+        response = self.client.get(reverse('words_app:index'))
+        self.assertEqual(response.context['word_of_today_word'], 'wizard')
+        self.assertEqual(response.context['word_of_today_syllable_count'], 2)
+        self.words_api.assert_not_called()
+
+
+class LexiconSnapshotTests(TestCase):
+    """Tests the lexicon snapshot and the indexes built from it"""
+
+    def setUp(self) -> None:
+        """Points the snapshot path at a temporary directory"""
+
+        directory = self.enterContext(tempfile.TemporaryDirectory())
+        self.path = Path(directory) / 'lexicon.snapshot'
+        self.enterContext(
+            override_settings(WORDS_LEXICON_SNAPSHOT_PATH=str(self.path))
+            )
+        self.enterContext(
+            mock.patch.object(constants, 'SNAPSHOT_CHECK_INTERVAL', 0)
+            )
+        self.enterContext(mock.patch('words_app.snapshot._snapshot', None))
+        for index in (suggestions._spelling_index, games._anagram_index,
+                      rhymes._rhyme_index):
+            self.enterContext(mock.patch.multiple(
+                index, index=None, _snapshot=None, _thread=None
+                ))
+
+    def warm_indexes(self) -> None:
+        """Builds the background indexes of the current snapshot"""
+
+        for warm in (warm_spelling_index, warm_anagram_index,
+                     warm_rhyme_index):
+            warm().join()
+
+    def test_numbers_are_little_endian(self) -> None:
+        entries = [LexiconEntry('wizard', 4.02, 2, 'ˈwɪzərd')]
+        write_snapshot(entries, self.path)
+        snapshot = LexiconSnapshot(self.path)
+        data = self.path.read_bytes()
+
+        self.assertEqual(
+            struct.unpack_from('<2I', data, snapshot.offsets['word_offsets']),
+            (0, 6)
+            )
+        self.assertAlmostEqual(
+            struct.unpack_from('<f', data, snapshot.offsets['frequencies'])[0],
+            4.02, places=6
+            )
+        self.assertEqual(list(snapshot), entries)
+
+    def test_indexes_follow_a_replaced_snapshot(self) -> None:
+        write_snapshot([LexiconEntry('wizard', 4.02, 2, ''),
+                        LexiconEntry('lizard', 3.5, 2, '')], self.path)
+        self.assertEqual(get_prefix_index().complete('wiz'), ['wizard'])
+        self.warm_indexes()
+        self.assertEqual(get_anagram_index().anagrams('draziw'),
+                         ('wizard',))
+        self.assertEqual(get_rhyme_index().rhymes_with('wizard'),
+                         ['lizard'])
+        old_spelling_index = get_spelling_index()
+        self.assertEqual(old_spelling_index.suggest('wizzard'), ['wizard'])
+
+        # Replaced by a new file, so the snapshot is opened again
+        write_snapshot([LexiconEntry('wizardry', 3.0, 3, ''),
+                        LexiconEntry('blizzard', 3.5, 2, '')], self.path)
+        self.assertEqual(get_prefix_index().complete('wiz'), ['wizardry'])
+        # The old indexes are used until the new ones are built
+        self.assertIsNotNone(get_spelling_index())
+        self.assertIsNotNone(get_anagram_index())
+        self.warm_indexes()
+        self.assertEqual(get_anagram_index().anagrams('draziw'), ())
+        self.assertEqual(get_rhyme_index().rhymes_with('wizard'),
+                         ['blizzard'])
+        self.assertIsNot(get_spelling_index(), old_spelling_index)
+        self.assertEqual(get_spelling_index().suggest('wizardy'),
+                         ['wizardry'])
+
+
+class ThesaurusTests(TestCase):
+    """Tests the thesaurus graph"""
+
+    def test_search_matches_brute_force(self) -> None:
+        generator = random.Random(7)
+        words = [f'word{number}' for number in range(40)]
+        edges = [(generator.randrange(40), generator.randrange(40),
+                  generator.choice(list(ThesaurusRelation.RelationType)))
+                 for _ in range(80)]
+        graph = ThesaurusGraph(words, edges)
+
+        for relation_type in ThesaurusRelation.RelationType:
+            neighbours = {word: set() for word in words}
+            for source, target, edge_type in edges:
+                if edge_type == relation_type:
+                    neighbours[words[source]].add(words[target])
+                    neighbours[words[target]].add(words[source])
+            for word in words:
+                for max_hops in range(4):
+                    # Each hop reaches the neighbours of the last one
+                    hops = {word: 0}
+                    reached = {word}
+                    for hop in range(1, max_hops + 1):
+                        reached = {neighbour for reached_word in reached
+                                   for neighbour in neighbours[reached_word]
+                                   if neighbour not in hops}
+                        hops.update(dict.fromkeys(reached, hop))
+                    del hops[word]
+                    with self.subTest(word=word, max_hops=max_hops,
+                                      relation_type=relation_type):
+                        self.assertEqual(
+                            graph.related_words(word, max_hops,
+                                                relation_type),
+                            tuple(sorted(hops.items(),
+                                         key=lambda item: (item[1], item[0])))
+                            )
+
+    def test_graph_loaded_from_recorded_relations(self) -> None:
+        record_thesaurus_relations(WORD_DATA)
+        record_thesaurus_relations({'word': 'ace', 'results': [
+            {'synonyms': ['expert'], 'antonyms': ['novice']}
+            ]})
+        graph = ThesaurusGraph.from_database()
+
+        self.assertEqual(len(graph), 5)
+        self.assertTrue(graph.is_recorded('wizard'))
+        self.assertFalse(graph.is_recorded('genius'))
+        self.assertEqual(graph.related_words('genius'),
+                         (('wizard', 1), ('ace', 2)))
+        self.assertEqual(
+            graph.related_words(
+                'ace', relation_type=ThesaurusRelation.RelationType.ANTONYM
+                ),
+            (('novice', 1),)
+            )
+
+    def test_load_started_again_after_fork(self) -> None:
+        parent_thread = threading.Thread(target=lambda: None)
+        with mock.patch.multiple(thesaurus,
+                                 _graph_thread=parent_thread,
+                                 _graph_loaded_at=time.monotonic(),
+                                 _load_thesaurus_graph=mock.DEFAULT) as mocks:
+            # What the child process runs after a fork
+            thesaurus._after_fork()
+            thesaurus.get_thesaurus_graph()
+            self.assertIsNot(thesaurus._graph_thread, parent_thread)
+            thesaurus._graph_thread.join()
+        mocks['_load_thesaurus_graph'].assert_called_once()
+
+
+@skipUnless(hasattr(os, 'fork'), 'Needs os.fork')
+class BackgroundIndexForkTests(TestCase):
+    """Tests a background index in a process forked mid-build"""
+
+    def test_build_started_again_after_fork(self) -> None:
+        directory = self.enterContext(tempfile.TemporaryDirectory())
+        path = Path(directory) / 'lexicon.snapshot'
+        self.enterContext(
+            override_settings(WORDS_LEXICON_SNAPSHOT_PATH=str(path))
+            )
+        self.enterContext(mock.patch('words_app.snapshot._snapshot', None))
+        write_snapshot([LexiconEntry('wizard', 4.02, 2, '')], path)
+
+        parent = os.getpid()
+        release = threading.Event()
+
+        def build(entries):
+            # Only the parent's build is held until the fork is done
+            if os.getpid() == parent:
+                release.wait()
+            return [entry.word for entry in entries]
+
+        index = BackgroundIndex('test', build)
+        parent_thread = index.warm()
+        child = os.fork()
+        if not child:
+            try:
+                index.warm().join(timeout=5)
+                os._exit(0 if index.get() == ['wizard'] else 1)
+            finally:
+                os._exit(2)
+
+        _, status = os.waitpid(child, 0)
+        release.set()
+        parent_thread.join()
+        self.assertEqual(os.waitstatus_to_exitcode(status), 0)
+        self.assertEqual(index.get(), ['wizard'])
+
+
+class JsonArrayReaderTests(TestCase):
+    """Tests reading a JSON array dump a chunk at a time"""
+
+    def test_items_cut_at_any_chunk_boundary(self) -> None:
+        dump = '[12, 3.5, -0.5e3, "wiz", {"word": ["wizard"]}, true, null]'
+        for chunk_size in range(1, len(dump) + 1):
+            with self.subTest(chunk_size=chunk_size):
+                with mock.patch('words_app.ingest.READ_CHUNK_SIZE',
+                                chunk_size):
+                    self.assertEqual(
+                        list(iter_json_array(io.StringIO(dump))),
+                        [12, 3.5, -500.0, 'wiz', {'word': ['wizard']},
+                         True, None]
+                        )
+
+    def test_invalid_items(self) -> None:
+        for dump in ('[12, 3.]', '[1 2]', '[tru]', '[3.5x]', '[1,'):
+            for chunk_size in (1, 2, 64):
+                with self.subTest(dump=dump, chunk_size=chunk_size):
+                    with mock.patch('words_app.ingest.READ_CHUNK_SIZE',
+                                    chunk_size):
+                        with self.assertRaises(ValueError):
+                            list(iter_json_array(io.StringIO(dump)))
+
+    def test_invalid_item_does_not_read_the_whole_dump(self) -> None:
+        dump = io.StringIO('[{"word": tru, ' + '"x": 1, ' * 10000 + '}]')
+        with mock.patch('words_app.ingest.READ_CHUNK_SIZE', 100), \
+                mock.patch('words_app.ingest.MAX_ITEM_SIZE', 1000):
+            with self.assertRaises(ValueError):
+                list(iter_json_array(dump))
+        self.assertLess(dump.tell(), 2000)
+
+
+class FacetIndexTests(TestCase):
+    """Tests the letter pattern counts of the facet index"""
+
+    def setUp(self) -> None:
+        self.index = FacetIndex.from_entries(
+            LexiconEntry(word, 3.0, 1, '')
+            for word in ('abbey', 'about', 'cdrom', 'cider', 'cdc',
+                         'lizard', 'wizard')
+            )
+
+    def test_letter_patterns(self) -> None:
+        for pattern, total in (('^ab', 2), ('^AB', 2), ('^ab|cd', 4),
+                               ('^ab|^cd|^c', 5), ('^(ab|cd)', 4),
+                               (r'^\D+$', 7), (r'^\d+$', 0),
+                               ('izard$', 2)):
+            with self.subTest(pattern=pattern):
+                counts = self.index.counts({'letterPattern': pattern})
+                self.assertTrue(counts['pattern_applied'])
+                self.assertEqual(counts['total'], total)
+
+
+class ToggleFavouriteWordTests(TestCase):
+    """Tests the statements run to favourite and unfavourite a word"""
+
+    def setUp(self) -> None:
+        self.user = User.objects.create_user('wizard')
+
+    def assert_statements(self, expected: list[str], favourite) -> bool:
+        """
+        Toggles 'wizard' and checks the statements run, leaving out the
+        transaction control statements
+        """
+
+        with CaptureQueriesContext(connection) as queries:
+            is_favourite = toggle_favourite_word(self.user, 'wizard',
+                                                 favourite=favourite)
+        self.assertEqual(
+            [query['sql'].split()[0] for query in queries
+             if not TRANSACTION_CONTROL.match(query['sql'])],
+            expected
+            )
+        return is_favourite
+
+    def favourite_count(self) -> int:
+        return FavouriteWord.objects.get(word='wizard').favourite_count
+
+    def test_add(self) -> None:
+        self.assertTrue(
+            self.assert_statements(['INSERT', 'INSERT', 'UPDATE'], True)
+            )
+        # Already a favourite, so it is not counted twice
+        self.assertTrue(self.assert_statements(['INSERT', 'INSERT'], True))
+        self.assertEqual(self.favourite_count(), 1)
+
+    def test_remove(self) -> None:
+        toggle_favourite_word(self.user, 'wizard', favourite=True)
+        self.assertFalse(self.assert_statements(['DELETE', 'UPDATE'], False))
+        self.assertFalse(self.assert_statements(['DELETE'], False))
+        self.assertEqual(self.favourite_count(), 0)
+
+    def test_toggle(self) -> None:
+        self.assertTrue(self.assert_statements(
+            ['DELETE', 'INSERT', 'INSERT', 'UPDATE'], None
+            ))
+        self.assertFalse(self.assert_statements(['DELETE', 'UPDATE'], None))
+        self.assertEqual(self.favourite_count(), 0)
+
+
+class ConcurrentToggleFavouriteWordTests(TransactionTestCase):
+    """Tests toggling a word from several threads at the same time"""
+
+    # Reads go to the 'replica' database in the production profile
+    databases = '__all__'
+
+    def test_count_matches_links(self) -> None:
+        users = [User.objects.create_user(f'wizard{number}')
+                 for number in range(8)]
+        errors = []
+
+        def toggle(user: User) -> None:
+            try:
+                for _ in range(random.randint(5, 10)):
+                    toggle_favourite_word(user, 'wizard')
+            except Exception as error:
+                errors.append(error)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=toggle, args=(user,))
+                   for user in users]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        favourite_word = FavouriteWord.objects.get(word='wizard')
+        self.assertEqual(favourite_word.favourite_count,
+                         favourite_word.users.count())
+
+
+class SpellingSuggestionTests(TestCase):
+    """Tests the spelling suggestions for words that were not found"""
+
+    def setUp(self) -> None:
+        self.entries = [
+            LexiconEntry(word, frequency, 2, '')
+            for word, frequency in (('wizard', 4.0), ('lizard', 3.0),
+                                    ('blizzard', 3.5), ('wizards', 2.0))
+            ]
+        self.index = SpellingIndex(self.entries)
+
+    def test_edit_distance_matches_dynamic_programming(self) -> None:
+        def levenshtein(first: str, second: str) -> int:
+            row = list(range(len(second) + 1))
+            for i, first_letter in enumerate(first, 1):
+                previous, row[0] = row[0], i
+                for j, second_letter in enumerate(second, 1):
+                    previous, row[j] = row[j], min(
+                        row[j] + 1, row[j - 1] + 1,
+                        previous + (first_letter != second_letter)
+                        )
+            return row[-1]
+
+        generator = random.Random(13)
+        pairs = [('', ''), ('', 'abc'), ('abc', ''), ('a' * 70, 'b' * 65)]
+        pairs += [tuple(''.join(generator.choice('abcd') for _ in
+                                range(generator.randint(0, 12)))
+                        for _ in range(2))
+                  for _ in range(500)]
+        for first, second in pairs:
+            with self.subTest(first=first, second=second):
+                self.assertEqual(edit_distance(first, second),
+                                 levenshtein(first, second))
+
+    def test_search_matches_brute_force(self) -> None:
+        generator = random.Random(17)
+        words = {''.join(generator.choice('abcd')
+                         for _ in range(generator.randint(1, 8)))
+                 for _ in range(800)}
+        index = SpellingIndex(LexiconEntry(word, generator.random(), 1, '')
+                              for word in words)
+        for _ in range(100):
+            query = ''.join(generator.choice('abcde')
+                            for _ in range(generator.randint(1, 8)))
+            for max_distance in range(4):
+                with self.subTest(query=query, max_distance=max_distance):
+                    found = index.search(query, max_distance)
+                    self.assertCountEqual(
+                        found,
+                        [(edit_distance(query, word), word) for word in words
+                         if edit_distance(query, word) <= max_distance]
+                        )
+                    distances = [distance for distance, _ in found]
+                    self.assertEqual(distances, sorted(distances))
+
+    def test_only_the_most_frequent_words_are_indexed(self) -> None:
+        index = SpellingIndex(self.entries, max_words=2)
+        self.assertEqual(len(index), 2)
+        self.assertEqual(index.search('lizard', 0), [])
+        self.assertEqual(index.search('blizzard', 0), [(0, 'blizzard')])
+
+    def test_distance_one_is_searched_first(self) -> None:
+        with mock.patch.object(self.index, 'search',
+                               wraps=self.index.search) as search:
+            self.assertEqual(self.index.suggest('wizard'),
+                             ['lizard', 'wizards'])
+        search.assert_called_once_with('wizard', 1)
+
+    def test_distance_two_only_when_nothing_closer(self) -> None:
+        with mock.patch.object(self.index, 'search',
+                               wraps=self.index.search) as search:
+            self.assertEqual(self.index.suggest('wizrad'), ['wizard'])
+        self.assertEqual(search.call_args_list,
+                         [mock.call('wizrad', 1), mock.call('wizrad', 2)])
+        self.assertEqual(self.index.suggest('xyzxyz'), [])
+
+
+@skipUnless(brotli and Image, 'Brotli and Pillow are not installed')
+class CompressedStaticFilesStorageTests(TestCase):
+    """Tests the compressed copies written by 'collectstatic'"""
+
+    def setUp(self) -> None:
+        """Creates a CSS file and a PNG image to collect"""
+
+        directory = Path(self.enterContext(tempfile.TemporaryDirectory()))
+        static = directory / 'static'
+        static.mkdir()
+        self.css = b'.wizard { color: purple; }\n' * 200
+        (static / 'styles.css').write_bytes(self.css)
+        Image.new('RGB', (64, 64), 'purple').save(static / 'wizard.png',
+                                                  compress_level=0)
+        self.png_size = (static / 'wizard.png').stat().st_size
+        self.static_root = directory / 'staticfiles'
+        self.enterContext(override_settings(
+            STATICFILES_DIRS=[static],
+            STATIC_ROOT=self.static_root,
+            STORAGES={
+                **settings.STORAGES,
+                'staticfiles': {
+                    'BACKEND':
+                        'words_app.storage.'
+                        'CompressedManifestStaticFilesStorage',
+                    },
+                },
+            ))
+
+    def test_post_process(self) -> None:
+        call_command('collectstatic', interactive=False, verbosity=0)
+
+        css_files = sorted(path.name for path
+                           in self.static_root.glob('styles.*.css*'))
+        self.assertEqual(len(css_files), 3)
+        hashed_css = self.static_root / css_files[0]
+        self.assertEqual(
+            gzip.decompress((self.static_root / (css_files[0] + '.gz'))
+                            .read_bytes()),
+            self.css
+            )
+        self.assertEqual(
+            brotli.decompress((self.static_root / (css_files[0] + '.br'))
+                              .read_bytes()),
+            self.css
+            )
+        self.assertEqual(hashed_css.read_bytes(), self.css)
+
+        # Images are optimised, not compressed
+        hashed_png, = self.static_root.glob('wizard.*.png')
+        self.assertLess(hashed_png.stat().st_size, self.png_size)
+        self.assertEqual(list(self.static_root.glob('wizard.*.png.*')), [])
+
+    def test_served_precompressed_with_cache_control(self) -> None:
+        call_command('collectstatic', interactive=False, verbosity=0)
+        hashed_name = staticfiles_storage.stored_name('styles.css')
+        middleware = StaticFilesMiddleware(
+            lambda request: HttpResponse('view')
+            )
+        factory = RequestFactory()
+
+        def get(name: str, encodings: str = '', method: str = 'get'):
+            response = middleware(getattr(factory, method)(
+                settings.STATIC_URL + name,
+                HTTP_ACCEPT_ENCODING=encodings
+                ))
+            self.addCleanup(response.close)
+            return response
+
+        for name, encodings, encoding, cache_control in (
+                (hashed_name, 'gzip, br', 'br',
+                 'public, max-age=31536000, immutable'),
+                (hashed_name, 'gzip', 'gzip',
+                 'public, max-age=31536000, immutable'),
+                (hashed_name, '', None,
+                 'public, max-age=31536000, immutable'),
+                # Files without a hash may change, so are not immutable,
+                # and only the hashed copies are compressed
+                ('styles.css', 'br', None, 'public, max-age=60')):
+            with self.subTest(name=name, encodings=encodings):
+                response = get(name, encodings)
+                body = b''.join(response.streaming_content)
+                self.assertEqual(response.get('Content-Encoding'), encoding)
+                self.assertEqual(response['Cache-Control'], cache_control)
+                self.assertEqual(response['Vary'], 'Accept-Encoding')
+                self.assertEqual(response['Content-Type'], 'text/css')
+                self.assertEqual(
+                    {'br': brotli.decompress, 'gzip': gzip.decompress,
+                     None: bytes}[encoding](body),
+                    self.css
+                    )
+
+        # Anything else is left to the views
+        for name, method in (('missing.css', 'get'),
+                             ('../settings.py', 'get'),
+                             (hashed_name, 'post')):
+            with self.subTest(name=name, method=method):
+                self.assertEqual(get(name, method=method).content, b'view')
+
+
+class CompressionMiddlewareTests(TestCase):
+    """Tests the compression of responses"""
+
+    # A page big enough to be compressed
+    page = b'<p>Word Wizards</p>' * 100
+
+    def compress(self, response, accept_encoding: str = 'gzip, br'):
+        """Passes a response through the middleware"""
+
+        request = RequestFactory().get(
+            '/', HTTP_ACCEPT_ENCODING=accept_encoding
+            )
+        return CompressionMiddleware(lambda request: response)(request)
+
+    @staticmethod
+    def decompress(response) -> bytes:
+        """Returns the content of a compressed response"""
+
+        content = (b''.join(response.streaming_content) if response.streaming
+                   else response.content)
+        if response.get('Content-Encoding') == 'br':
+            return brotli.decompress(content)
+        return gzip.decompress(content)
+
+    def test_negotiation(self) -> None:
+        for accept_encoding, encoding in (
+                ('gzip, deflate, br', 'br'),
+                ('br;q=0.5, gzip', 'gzip'),
+                ('gzip, br;q=0', 'gzip'),
+                ('GZIP', 'gzip'),
+                ('deflate', None),
+                ('', None)):
+            with self.subTest(accept_encoding=accept_encoding):
+                response = self.compress(HttpResponse(self.page),
+                                         accept_encoding)
+                self.assertEqual(response.get('Content-Encoding'), encoding)
+                self.assertEqual(response['Vary'], 'Accept-Encoding')
+                if encoding:
+                    self.assertEqual(self.decompress(response), self.page)
+                    self.assertEqual(int(response['Content-Length']),
+                                     len(response.content))
+                else:
+                    self.assertEqual(response.content, self.page)
+
+    def test_small_and_binary_responses_are_not_compressed(self) -> None:
+        for response in (HttpResponse(b'<p>Wizard</p>'),
+                         HttpResponse(self.page, content_type='image/png'),
+                         HttpResponse(self.page, headers={
+                             'Content-Encoding': 'gzip'})):
+            with self.subTest(content_type=response['Content-Type']):
+                content = response.content
+                response = self.compress(response)
+                self.assertEqual(response.content, content)
+                self.assertFalse(response.has_header('Vary'))
+
+    def test_streaming_small_chunks_are_compressed_together(self) -> None:
+        rows = [f'wizard{number},2024-01-01\n'.encode()
+                for number in range(5000)]
+        content = b''.join(rows)
+        for encoding in ('gzip', 'br'):
+            with self.subTest(encoding=encoding):
+                response = self.compress(
+                    StreamingHttpResponse(iter(rows),
+                                          content_type='text/csv'),
+                    encoding
+                    )
+                self.assertEqual(response['Content-Encoding'], encoding)
+                self.assertFalse(response.has_header('Content-Length'))
+                chunks = [chunk for chunk in response.streaming_content]
+                self.assertLess(len(chunks), 20)
+                compressed = b''.join(chunks)
+                self.assertLess(len(compressed), len(content) / 5)
+                self.assertEqual(
+                    brotli.decompress(compressed) if encoding == 'br'
+                    else gzip.decompress(compressed),
+                    content
+                    )
+
+    def test_metrics(self) -> None:
+        metrics.reset()
+        self.addCleanup(metrics.reset)
+        for encoding in ('gzip', 'br'):
+            response = self.compress(HttpResponse(self.page), encoding)
+            totals = metrics.snapshot()[f'compression.{encoding}']['/']
+            self.assertEqual(totals['count'], 1)
+            self.assertEqual(totals['original_bytes'], len(self.page))
+            self.assertEqual(totals['compressed_bytes'],
+                             len(response.content))
+
+
+class ProfilingMiddlewareTests(WordsAppTestCase):
+    """Tests that staff, and only staff, can profile a request"""
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.url = reverse('words_app:view_word', args=('wizard',))
+
+    def test_only_staff_requests_are_profiled(self) -> None:
+        for is_staff, params in ((False, {'_profile': ''}),
+                                 (True, {})):
+            self.user.is_staff = is_staff
+            self.user.save()
+            with self.subTest(is_staff=is_staff, params=params):
+                response = self.client.get(self.url, params)
+                self.assertTemplateUsed(response,
+                                        'words_app/view_word.html')
+                self.assertFalse(response.has_header('X-Profile-Report'))
+
+    def test_report_replaces_the_page(self) -> None:
+        self.user.is_staff = True
+        self.user.save()
+        for params, headers in (({'_profile': ''}, {}),
+                                ({}, {'X-Profile': '1'})):
+            with self.subTest(params=params, headers=headers):
+                response = self.client.get(self.url, params, headers=headers)
+                self.assertEqual(response['Content-Type'],
+                                 'text/plain; charset=utf-8')
+                self.assertEqual(response['Cache-Control'], 'no-store')
+                report = response.content.decode()
+                self.assertIn('functions by cumulative time', report)
+                self.assertIn('database queries', report)
+                self.assertIn('== 1 WordsAPI calls', report)
+
+    def test_report_saved(self) -> None:
+        self.user.is_staff = True
+        self.user.save()
+        directory = Path(self.enterContext(tempfile.TemporaryDirectory()))
+        with override_settings(PROFILING_DIRECTORY=directory), \
+                self.assertLogs('words_app.profiling', 'INFO'):
+            response = self.client.get(self.url, {'_profile': 'save'})
+        self.assertTemplateUsed(response, 'words_app/view_word.html')
+        name = response['X-Profile-Report']
+        self.assertIn('words_app.view_word', name)
+        self.assertIn('database queries',
+                      (directory / f'{name}.txt').read_text())
+        self.assertTrue((directory / f'{name}.prof').is_file())
+
+
+class MetricsTests(WordsAppTestCase):
+    """Tests the metrics registry and the staff metrics view"""
+
+    def test_totals_added_across_threads(self) -> None:
+        registry = MetricsRegistry()
+
+        def add() -> None:
+            for _ in range(1000):
+                registry.add('compression', 'index', original_bytes=2,
+                             compressed_bytes=1)
+
+        threads = [threading.Thread(target=add) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        snapshot = registry.snapshot()
+        self.assertEqual(snapshot, {'compression': {'index': {
+            'count': 4000, 'original_bytes': 8000, 'compressed_bytes': 4000
+            }}})
+        # The snapshot is a copy
+        snapshot['compression']['index']['count'] = 0
+        self.assertEqual(registry.snapshot()['compression']['index']['count'],
+                         4000)
+        registry.reset()
+        self.assertEqual(registry.snapshot(), {})
+
+    def test_metrics_view_is_for_staff_only(self) -> None:
+        url = reverse('words_app:metrics')
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 302)
+        self.assertIn(reverse('admin:login'), response['Location'])
+
+        self.user.is_staff = True
+        self.user.save()
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.json()),
+                         {'metrics', 'words_api_circuit_breaker',
+                          'words_api_concurrency_limit', 'jobs'})
+        self.assertEqual(response.json()['words_api_circuit_breaker'],
+                         words_api_breaker.status())
+
+
+class TracingMiddlewareTests(TestCase):
+    """Tests which requests are traced and the spans recorded"""
+
+    trace_id = '4bf92f3577b34da6a3ce929d0e0e4736'
+    parent_id = '00f067aa0ba902b7'
+
+    def setUp(self) -> None:
+        """Writes the spans to a temporary file and traces nothing"""
+
+        directory = Path(self.enterContext(tempfile.TemporaryDirectory()))
+        self.spans_file = directory / 'traces.jsonl'
+        self.enterContext(override_settings(TRACING={
+            'SAMPLE_RATE': 0,
+            'FILE': str(self.spans_file),
+            'TRUSTED_UPSTREAMS': ['10.0.0.0/8'],
+            }))
+        get_exporters.cache_clear()
+        self.addCleanup(get_exporters.cache_clear)
+
+    def get(self, **headers) -> HttpResponse:
+        """Sends a request that runs a query through the middleware"""
+
+        def view(request: HttpRequest) -> HttpResponse:
+            with span('words.count'):
+                User.objects.count()
+            return HttpResponse('Wizard')
+
+        request = RequestFactory().get('/', **headers)
+        return TracingMiddleware(view)(request)
+
+    def spans(self) -> list[dict]:
+        if not self.spans_file.exists():
+            return []
+        return [json.loads(line)
+                for line in self.spans_file.read_text().splitlines()]
+
+    def test_untrusted_traceparent_is_not_sampled(self) -> None:
+        response = self.get(
+            HTTP_TRACEPARENT=f'00-{self.trace_id}-{self.parent_id}-01',
+            REMOTE_ADDR='203.0.113.7'
+            )
+        self.assertEqual(response.content, b'Wizard')
+        self.assertTrue(response.has_header('X-Request-ID'))
+        self.assertEqual(self.spans(), [])
+
+    def test_trusted_traceparent_joins_the_trace(self) -> None:
+        self.get(HTTP_TRACEPARENT=f'00-{self.trace_id}-{self.parent_id}-01',
+                 HTTP_X_REQUEST_ID='wizard-1',
+                 REMOTE_ADDR='10.1.2.3')
+        spans = {trace_span['name']: trace_span
+                 for trace_span in self.spans()}
+        self.assertEqual(set(spans), {'http.request', 'words.count',
+                                      'db.query'})
+        self.assertTrue(all(trace_span['trace_id'] == self.trace_id
+                            and trace_span['request_id'] == 'wizard-1'
+                            for trace_span in spans.values()))
+        self.assertEqual(spans['http.request']['parent_id'], self.parent_id)
+        self.assertEqual(spans['words.count']['parent_id'],
+                         spans['http.request']['span_id'])
+        self.assertEqual(spans['db.query']['parent_id'],
+                         spans['words.count']['span_id'])
+
+    def test_trusted_traceparent_not_sampled(self) -> None:
+        self.get(HTTP_TRACEPARENT=f'00-{self.trace_id}-{self.parent_id}-00',
+                 REMOTE_ADDR='10.1.2.3')
+        self.assertEqual(self.spans(), [])
+
+    def test_sample_rate(self) -> None:
+        with override_settings(TRACING={**settings.TRACING,
+                                        'SAMPLE_RATE': 1}):
+            response = self.get(HTTP_X_REQUEST_ID='not a request id!')
+        spans = self.spans()
+        self.assertEqual(len(spans), 3)
+        self.assertNotEqual(spans[0]['trace_id'], self.trace_id)
+        self.assertNotEqual(response['X-Request-ID'], 'not a request id!')
+        self.assertEqual(spans[0]['request_id'], response['X-Request-ID'])
+
+    def test_span_outside_a_trace(self) -> None:
+        with span('words.count') as trace_span:
+            self.assertIs(trace_span, NOOP_SPAN)
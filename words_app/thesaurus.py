@@ -0,0 +1,432 @@
+"""
+Contains the thesaurus graph built from WordsAPI synonyms and antonyms
+
+The synonyms and antonyms of each word looked up are recorded in the
+database by the 'record_thesaurus' job, queued the first time the word
+is fetched (see 'queue_thesaurus_relations'), so a request does not
+write the relations itself. The graph is then loaded
+into compressed sparse row (CSR) arrays of integer word ids, so finding
+the words related to a word within a number of hops needs no further
+WordsAPI calls
+
+The graph is loaded again in a background thread every
+'constants.THESAURUS_GRAPH_MAX_AGE' seconds, so no request waits for it.
+The relations of words recorded since it was last loaded are read from
+the database and joined to the graph (see 'get_related_words'). Threads
+do not survive a fork, e.g., when gunicorn is run with '--preload', so
+a load still running when the process was forked is started again in
+the child
+"""
+# words_app/thesaurus.py
+
+import logging
+import os
+import threading
+import time
+from array import array
+from collections import deque
+from functools import lru_cache
+from typing import Iterable
+from django.db import connections, transaction
+from django.db.models import Q
+from .jobs import enqueue
+from .models import ThesaurusWord, ThesaurusRelation
+from . import constants
+
+logger = logging.getLogger(__name__)
+
+
+def record_thesaurus_relations(word_data: dict) -> None:
+    """
+    Records the synonyms and antonyms in the word data as relations of
+    the word, unless they were already recorded
+
+    Parameters
+    ----------
+    word_data: dict
+        Contains all the information about the word, if the WordsAPI
+        call was successful
+
+    Returns
+    ----------
+    None
+    """
+
+    if not word_data or 'word' not in word_data:
+        return
+
+    word = word_data['word'].strip().lower()
+    max_length = ThesaurusWord._meta.get_field('word').max_length
+    if not word or len(word) > max_length:
+        return
+
+    if ThesaurusWord.objects.filter(word=word, is_recorded=True).exists():
+        return
+
+    relations = set()
+    for result in word_data.get('results', []):
+        for key, relation_type in (
+                ('synonyms', ThesaurusRelation.RelationType.SYNONYM),
+                ('antonyms', ThesaurusRelation.RelationType.ANTONYM)):
+            for related_word in result.get(key) or []:
+                related_word = related_word.strip().lower()
+                if (related_word and related_word != word
+                        and len(related_word) <= max_length):
+                    relations.add((related_word, relation_type))
+
+    words = {word} | {related_word for related_word, _ in relations}
+
+    with transaction.atomic():
+        ThesaurusWord.objects.bulk_create(
+            [ThesaurusWord(word=new_word) for new_word in words],
+            ignore_conflicts=True
+            )
+        word_ids = dict(
+            ThesaurusWord.objects.filter(word__in=words).
+            values_list('word', 'id')
+            )
+        ThesaurusRelation.objects.bulk_create(
+            [ThesaurusRelation(source_id=word_ids[word],
+                               target_id=word_ids[related_word],
+                               relation_type=relation_type)
+             for related_word, relation_type in relations],
+            ignore_conflicts=True
+            )
+        ThesaurusWord.objects.filter(id=word_ids[word]).update(
+            is_recorded=True
+            )
+
+
+# The words this process has queued for recording since the graph was
+# last loaded
+_queued_words = set()
+
+
+def queue_thesaurus_relations(word_data: dict) -> None:
+    """
+    Queues the recording of the synonyms and antonyms in the word data
+    with the 'record_thesaurus' job, unless the word is recorded in the
+    loaded graph or this process has queued it already. Only the word,
+    synonyms and antonyms are kept in the job
+
+    Parameters
+    ----------
+    word_data: dict
+        Contains all the information about the word, if the WordsAPI
+        call was successful
+
+    Returns
+    ----------
+    None
+    """
+
+    if not word_data or 'word' not in word_data:
+        return
+
+    word = word_data['word'].strip().lower()
+    if (not word or word in _queued_words
+            or get_thesaurus_graph().is_recorded(word)):
+        return
+
+    if len(_queued_words) >= constants.THESAURUS_QUEUED_WORDS:
+        _queued_words.clear()
+    _queued_words.add(word)
+
+    enqueue('record_thesaurus', word_data={
+        'word': word,
+        'results': [
+            {key: result[key] for key in ('synonyms', 'antonyms')
+             if result.get(key)}
+            for result in word_data.get('results', [])
+            ],
+        })
+
+
+class ThesaurusGraph:
+    """
+    The thesaurus graph in compressed sparse row (CSR) form. The words
+    are numbered 0 to n - 1. The neighbours of word i are
+    'targets[offsets[i]:offsets[i + 1]]' and the relation type of each
+    edge is in 'relation_types' at the same position
+
+    Relations are stored in both directions, since a synonym of a word
+    has that word as a synonym too
+    """
+
+    def __init__(self,
+                 words: list[str],
+                 edges: list[tuple[int, int, int]],
+                 recorded: Iterable[int] = ()) -> None:
+        """
+        Builds the CSR arrays
+
+        Parameters
+        ----------
+        words: list[str]
+            The words in the graph, indexed by their number
+        edges: list[tuple[int, int, int]]
+            The (source, target, relation type) of each relation
+        recorded: Iterable[int]
+            The numbers of the words whose relations have been recorded
+        """
+
+        self.words = words
+        self._numbers = {word: number for number, word in enumerate(words)}
+        self._recorded = frozenset(recorded)
+
+        both_directions = sorted(
+            {(source, target, relation_type)
+             for source, target, relation_type in edges} |
+            {(target, source, relation_type)
+             for source, target, relation_type in edges}
+            )
+
+        self.offsets = array('I', [0] * (len(words) + 1))
+        for source, _, _ in both_directions:
+            self.offsets[source + 1] += 1
+        for number in range(len(words)):
+            self.offsets[number + 1] += self.offsets[number]
+
+        self.targets = array('I', [target for _, target, _
+                                   in both_directions])
+        self.relation_types = array('B', [relation_type for _, _, relation_type
+                                          in both_directions])
+
+        # Memoise searches, since the graph does not change once built
+        self.related_words = lru_cache(maxsize=1024)(self._related_words)
+
+    @classmethod
+    def from_database(cls) -> 'ThesaurusGraph':
+        """
+        Loads the graph from the thesaurus tables with two queries
+
+        Returns
+        ----------
+        ThesaurusGraph
+        """
+
+        ids_and_words = ThesaurusWord.objects.order_by('id').values_list(
+            'id', 'word', 'is_recorded'
+            )
+        words = []
+        numbers = {}
+        recorded = []
+        for word_id, word, is_recorded in ids_and_words.iterator():
+            numbers[word_id] = len(words)
+            if is_recorded:
+                recorded.append(len(words))
+            words.append(word)
+
+        edges = [
+            (numbers[source_id], numbers[target_id], relation_type)
+            for source_id, target_id, relation_type in
+            ThesaurusRelation.objects.values_list(
+                'source_id', 'target_id', 'relation_type'
+                ).iterator()
+            ]
+
+        return cls(words, edges, recorded)
+
+    def __len__(self) -> int:
+        """Returns the number of words in the graph"""
+        return len(self.words)
+
+    def __contains__(self, word: str) -> bool:
+        """Returns whether a word is in the graph"""
+        return word in self._numbers
+
+    def is_recorded(self, word: str) -> bool:
+        """Returns whether the relations of a word have been recorded"""
+        return self._numbers.get(word) in self._recorded
+
+    def _related_words(
+            self,
+            word: str,
+            max_hops: int = constants.THESAURUS_MAX_HOPS,
+            relation_type: int = ThesaurusRelation.RelationType.SYNONYM
+            ) -> tuple[tuple[str, int], ...]:
+        """
+        Finds the words connected to a word by up to 'max_hops'
+        relations of one type, using a breadth first search
+
+        Parameters
+        ----------
+        word: str
+            The word to start from
+        max_hops: int
+            The maximum number of relations between the words
+        relation_type: int
+            The type of relation to follow
+
+        Returns
+        ----------
+        Tuple of (word, number of hops) tuples, closest words first
+        """
+
+        start = self._numbers.get(word.strip().lower())
+        if start is None:
+            return ()
+
+        hops = {start: 0}
+        queue = deque([start])
+        while queue:
+            number = queue.popleft()
+            if hops[number] == max_hops:
+                continue
+            for position in range(self.offsets[number],
+                                  self.offsets[number + 1]):
+                neighbour = self.targets[position]
+                if (self.relation_types[position] == relation_type
+                        and neighbour not in hops):
+                    hops[neighbour] = hops[number] + 1
+                    queue.append(neighbour)
+
+        del hops[start]
+        return tuple(sorted(
+            ((self.words[number], hop) for number, hop in hops.items()),
+            key=lambda related: (related[1], related[0])
+            ))
+
+
+# The graph loaded by this process, when it was loaded and the thread
+# loading a new one
+_graph = ThesaurusGraph([], [])
+_graph_loaded_at = None
+_graph_thread = None
+_graph_lock = threading.Lock()
+
+
+def _load_thesaurus_graph() -> None:
+    """Loads the graph from the database. Run in a thread"""
+
+    global _graph, _graph_loaded_at, _graph_thread
+
+    try:
+        _graph = ThesaurusGraph.from_database()
+        # The words queued before are recorded in the new graph, unless
+        # their jobs have not run yet
+        _queued_words.clear()
+    except Exception:
+        logger.exception('Could not load the thesaurus graph')
+    finally:
+        _graph_loaded_at = time.monotonic()
+        _graph_thread = None
+        # Threads get their own database connections, which Django
+        # only closes at the end of a request
+        connections.close_all()
+
+
+def _after_fork() -> None:
+    """
+    Forgets the loading thread of the parent process, which does not
+    exist in the child
+    """
+
+    global _graph_loaded_at, _graph_thread, _graph_lock
+
+    _graph_lock = threading.Lock()
+    if _graph_thread is not None:
+        # Loaded again by the next request that needs the graph
+        _graph_thread = None
+        _graph_loaded_at = None
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork)
+
+
+def reload_thesaurus_graph() -> threading.Thread:
+    """
+    Starts loading the graph from the database in a background thread,
+    unless it is already being loaded
+
+    Parameters
+    ----------
+    None
+
+    Returns
+    ----------
+    threading.Thread
+        The thread loading the graph
+    """
+
+    global _graph_thread
+
+    with _graph_lock:
+        if _graph_thread is None:
+            _graph_thread = threading.Thread(target=_load_thesaurus_graph,
+                                             name='thesaurus-graph',
+                                             daemon=True)
+            _graph_thread.start()
+        return _graph_thread
+
+
+def get_thesaurus_graph() -> ThesaurusGraph:
+    """
+    Returns the thesaurus graph, starting to load it again in the
+    background when it is older than 'constants.THESAURUS_GRAPH_MAX_AGE'
+    seconds. The graph is empty until it is first loaded
+
+    Parameters
+    ----------
+    None
+
+    Returns
+    ----------
+    ThesaurusGraph
+    """
+
+    if (_graph_loaded_at is None or time.monotonic() - _graph_loaded_at
+            > constants.THESAURUS_GRAPH_MAX_AGE):
+        reload_thesaurus_graph()
+
+    return _graph
+
+
+def get_related_words(
+        word: str,
+        max_hops: int = constants.THESAURUS_MAX_HOPS
+        ) -> tuple[tuple[str, int], ...]:
+    """
+    Finds the synonyms of a word within 'max_hops' relations
+
+    Words in the loaded graph are searched in it. The relations of a
+    word recorded since the graph was loaded, e.g., because it was just
+    looked up for the first time, are read from the database with one
+    query and the search goes on in the graph from its synonyms
+
+    Parameters
+    ----------
+    word: str
+        The word to start from
+    max_hops: int
+        The maximum number of relations between the words
+
+    Returns
+    ----------
+    Tuple of (word, number of hops) tuples, closest words first
+    """
+
+    graph = get_thesaurus_graph()
+    word = word.strip().lower()
+    if word in graph:
+        return graph.related_words(word, max_hops)
+    if max_hops < 1:
+        return ()
+
+    relations = ThesaurusRelation.objects.filter(
+        Q(source__word=word) | Q(target__word=word),
+        relation_type=ThesaurusRelation.RelationType.SYNONYM
+        ).values_list('source__word', 'target__word')
+
+    hops = {}
+    for source, target in relations:
+        hops[target if source == word else source] = 1
+    for synonym in list(hops):
+        for related_word, hop in graph.related_words(synonym, max_hops - 1):
+            if related_word != word:
+                hops[related_word] = min(hops.get(related_word, hop + 1),
+                                         hop + 1)
+
+    return tuple(sorted(hops.items(),
+                        key=lambda related: (related[1], related[0])))
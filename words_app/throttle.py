@@ -0,0 +1,248 @@
+"""
+Contains the per-user throttle on WordsAPI calls
+
+Each WordsAPI call made for a user is counted against the rate of
+their account group (see 'constants.THROTTLE_RATES'). Only the calls
+actually sent to WordsAPI are counted: pages served from the cache or
+the local lexicon are never throttled, so a user browsing cached words
+is not slowed down while one sending many new lookups is
+
+The calls are counted with a sliding window kept in the database
+('ThrottleWindow'), so all the server processes share it. The window is
+approximated from the counts of the current and the previous fixed
+window, the previous one weighted by how much of it still overlaps the
+sliding window. This needs two rows per user whatever the rate. A call
+is counted with a single upsert that only adds one if the count is
+still under the limit, so parallel requests from one user cannot get
+past it. The rows of old windows are deleted by the
+'clean_throttle_windows' job
+
+A throttled view returns a 429 response with a 'Retry-After' header
+"""
+# words_app/throttle.py
+
+import math
+import time
+from contextvars import ContextVar
+from functools import wraps
+from typing import Callable
+from django.db import connections, router
+from django.http import HttpRequest, HttpResponse
+from .metrics import metrics
+from .models import ThrottleWindow
+from . import constants
+
+# The user id and account group of the throttled view being run, if any
+_current_user: ContextVar[tuple[int, str] | None] = ContextVar(
+    'throttled_user', default=None
+    )
+
+
+class Throttled(Exception):
+    """Raised when a user has made too many WordsAPI calls"""
+
+    def __init__(self, retry_after: float) -> None:
+        """
+        Parameters
+        ----------
+        retry_after: float
+            The number of seconds before the user may make a call again
+        """
+
+        super().__init__(f'Throttled, retry after {retry_after:.0f} s')
+        self.retry_after = retry_after
+
+
+def seconds_until_free(previous: float,
+                       current: float,
+                       limit: int,
+                       elapsed: float,
+                       window: float) -> float:
+    """
+    Returns the number of seconds before a sliding window that is full
+    has room for one more hit
+
+    Parameters
+    ----------
+    previous: float
+        The number of hits in the previous fixed window
+    current: float
+        The number of hits in the current fixed window
+    limit: int
+        The number of hits allowed in any window
+    elapsed: float
+        How far through the current fixed window we are, from 0 to 1
+    window: float
+        The length of the window in seconds
+
+    Returns
+    ----------
+    Float
+    """
+
+    # As time passes, the hits of the older window fall out of the
+    # sliding window until there is room for one more. If the current
+    # window is full, that is only in the next window
+    if current >= limit:
+        free_at = 1 + 1 - limit / current
+    else:
+        free_at = 1 - (limit - current) / previous
+    return max((free_at - elapsed) * window, 0.001)
+
+
+def sliding_window_hit(key: str, limit: int, window: float) -> float:
+    """
+    Counts a hit against a sliding window limit, with two queries
+
+    Parameters
+    ----------
+    key: str
+        Identifies who the hits are counted for
+    limit: int
+        The number of hits allowed in any window
+    window: float
+        The length of the window in seconds
+
+    Returns
+    ----------
+    Float
+        0 if the hit is allowed and counted, otherwise the number of
+        seconds before a hit would be allowed
+    """
+
+    now = time.time()
+    current_window = int(now // window)
+    # How far through the current fixed window we are, from 0 to 1
+    elapsed = now / window - current_window
+
+    counts = dict(
+        ThrottleWindow.objects.filter(
+            key=key, window__in=[current_window - 1, current_window]
+            ).values_list('window', 'count')
+        )
+    current = counts.get(current_window, 0)
+    previous = counts.get(current_window - 1, 0)
+
+    # The number of hits the current window may hold. The previous
+    # window is over, so its count cannot change
+    allowance = limit - previous * (1 - elapsed)
+    if current >= allowance:
+        return seconds_until_free(previous, current, limit, elapsed,
+                                  window)
+
+    # Adds one to the count in the database only if it is still under
+    # the allowance, so two requests cannot both take the last hit
+    database = router.db_for_write(ThrottleWindow)
+    connection = connections[database]
+    quote_name = connection.ops.quote_name
+    table = quote_name(ThrottleWindow._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {table} ({quote_name("key")}, '
+            f'{quote_name("window")}, {quote_name("count")})'
+            f' VALUES (%s, %s, 1)'
+            f' ON CONFLICT ({quote_name("key")}, {quote_name("window")})'
+            f' DO UPDATE SET {quote_name("count")} = '
+            f'{table}.{quote_name("count")} + 1'
+            f' WHERE {table}.{quote_name("count")} < %s',
+            [key, current_window, allowance]
+            )
+        counted = cursor.rowcount
+
+    if not counted:
+        # Another request took the last hit first
+        return seconds_until_free(previous, math.ceil(allowance), limit,
+                                  elapsed, window)
+
+    return 0
+
+
+def count_words_api_call() -> None:
+    """
+    Counts a WordsAPI call against the throttle of the user of the
+    current throttled view. Does nothing outside throttled views, e.g.,
+    in background jobs
+
+    Raises
+    ----------
+    Throttled
+        If the user has used up their calls for now
+    """
+
+    throttled_user = _current_user.get()
+    if throttled_user is None:
+        return
+
+    user_id, user_group = throttled_user
+    limit = constants.THROTTLE_RATES.get(user_group,
+                                         constants.THROTTLE_RATES['Starter'])
+    seconds = sliding_window_hit(f'user_{user_id}',
+                                 limit,
+                                 constants.THROTTLE_WINDOW)
+    if seconds:
+        metrics.add('throttle', user_group, throttled_calls=1)
+        raise Throttled(seconds)
+
+
+def delete_old_throttle_windows() -> int:
+    """
+    Deletes the counts of the windows that are no longer looked at,
+    i.e., those before the previous window
+
+    Parameters
+    ----------
+    None
+
+    Returns
+    ----------
+    Int
+        The number of counts deleted
+    """
+
+    current_window = int(time.time() // constants.THROTTLE_WINDOW)
+    deleted, _ = ThrottleWindow.objects.filter(
+        window__lt=current_window - 1
+        ).delete()
+
+    return deleted
+
+
+def throttle_words_api_calls(view: Callable) -> Callable:
+    """
+    Decorates a view so that the WordsAPI calls it makes are counted
+    against the user's throttle. Must be used after 'login_required'
+
+    The user's account group is looked up once and passed to the view
+    as 'request.user_group', so the view does not query it again
+
+    Parameters
+    ----------
+    view: Callable
+        The view
+
+    Returns
+    ----------
+    The decorated view, which returns a 429 response when throttled
+    """
+
+    @wraps(view)
+    def throttled_view(request: HttpRequest, *args, **kwargs
+                       ) -> HttpResponse:
+        request.user_group = request.user.groups.all()[0].name
+        token = _current_user.set((request.user.pk, request.user_group))
+        try:
+            return view(request, *args, **kwargs)
+        except Throttled as throttled:
+            retry_after = math.ceil(throttled.retry_after)
+            response = HttpResponse(
+                f'Too many word lookups. Please try again in '
+                f'{retry_after} seconds.',
+                content_type='text/plain; charset=utf-8',
+                status=429
+                )
+            response['Retry-After'] = str(retry_after)
+            return response
+        finally:
+            _current_user.reset(token)
+
+    return throttled_view
@@ -0,0 +1,602 @@
+"""
+Contains the request tracing of the words app
+
+A trace records where the time of a request went as a tree of spans:
+the request itself, and inside it the database queries, cache
+operations, template renders and WordsAPI calls it made, each with its
+start time, duration and a few attributes such as the SQL or the status
+code. The current trace and span are kept in context variables, so any
+code run for the request can add spans with:
+
+    with span('thesaurus.build', words=len(words)):
+        ...
+
+Every request gets a correlation ID, taken from its 'X-Request-ID'
+header or made up, which is sent back in the response, added to the
+log records and saved with each span. Only a share of the requests are
+traced ('settings.TRACING["SAMPLE_RATE"]'). A request with a W3C
+'traceparent' header joins the caller's trace, but the caller's
+'sampled' flag is only followed for the addresses in
+'settings.TRACING["TRUSTED_UPSTREAMS"]', e.g., a gateway that traces
+its own requests. Anyone else could trace every request they send
+
+The spans of a finished trace are written as JSON lines to
+'settings.TRACING["FILE"]' and/or posted in the OTLP/HTTP JSON format
+to the OpenTelemetry collector at 'settings.TRACING["OTLP_ENDPOINT"]',
+from a background thread so requests never wait for the collector
+"""
+# words_app/tracing.py
+
+import ipaddress
+import json
+import logging
+import queue
+import random
+import re
+import secrets
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+from functools import lru_cache
+from typing import Iterator
+import requests
+from django.conf import settings
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.core.cache.backends.db import DatabaseCache
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.http import HttpRequest, HttpResponse
+from django.template.backends.django import DjangoTemplates
+from .metrics import metrics
+from . import constants
+
+logger = logging.getLogger(__name__)
+
+# A W3C trace context header: version, trace ID, parent span ID, flags
+TRACEPARENT = re.compile(r'^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$')
+# Request IDs sent by clients are only trusted if they look like one
+REQUEST_ID = re.compile(r'^[A-Za-z0-9._-]{1,64}$')
+
+
+class Span:
+    """A timed operation within a trace"""
+
+    def __init__(self,
+                 trace: 'Trace',
+                 name: str,
+                 parent_id: str | None,
+                 attributes: dict) -> None:
+        """
+        Parameters
+        ----------
+        trace: Trace
+            The trace the span belongs to
+        name: str
+            What the span times, e.g., 'db.query'
+        parent_id: str | None
+            The ID of the enclosing span
+        attributes: dict
+            Details of the operation. Values should be JSON serialisable
+        """
+
+        self.trace = trace
+        self.name = name
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.attributes = attributes
+        self.error = None
+        self.start_time_ns = time.time_ns()
+        self._start = time.perf_counter_ns()
+        self.duration_ns = 0
+
+    def set(self, **attributes) -> None:
+        """Adds attributes to the span"""
+        self.attributes.update(attributes)
+
+    def finish(self) -> None:
+        """Records the duration of the span"""
+        self.duration_ns = time.perf_counter_ns() - self._start
+
+    def to_dict(self) -> dict:
+        """Returns the span as a dictionary, as written to the file"""
+
+        return {
+            'trace_id': self.trace.trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'request_id': self.trace.request_id,
+            'name': self.name,
+            'start_time_ns': self.start_time_ns,
+            'duration_ms': round(self.duration_ns / 1e6, 3),
+            'attributes': self.attributes,
+            'error': self.error,
+            }
+
+
+class NoopSpan:
+    """Stands in for a span when the request is not traced"""
+
+    def set(self, **attributes) -> None:
+        """Ignores the attributes"""
+
+
+NOOP_SPAN = NoopSpan()
+
+
+class Trace:
+    """The spans recorded for a request"""
+
+    def __init__(self,
+                 trace_id: str,
+                 request_id: str,
+                 parent_id: str | None = None,
+                 sampled: bool = True) -> None:
+        """
+        Parameters
+        ----------
+        trace_id: str
+            32 hexadecimal digits identifying the trace
+        request_id: str
+            The correlation ID of the request
+        parent_id: str | None
+            The ID of the caller's span, if the trace was started by
+            another service
+        sampled: bool
+            Whether spans are recorded
+        """
+
+        self.trace_id = trace_id
+        self.request_id = request_id
+        self.parent_id = parent_id
+        self.sampled = sampled
+        self.spans = []
+        self.dropped_spans = 0
+
+
+_current_trace: ContextVar[Trace | None] = ContextVar('trace', default=None)
+_current_span: ContextVar[Span | None] = ContextVar('span', default=None)
+
+
+def current_request_id() -> str | None:
+    """Returns the correlation ID of the request being handled"""
+
+    trace = _current_trace.get()
+    return trace.request_id if trace else None
+
+
+@contextmanager
+def span(name: str, **attributes) -> Iterator[Span | NoopSpan]:
+    """
+    Times the code run in the 'with' block as a span of the current
+    trace, nested in the current span. Does nothing if the request is
+    not traced
+
+    Parameters
+    ----------
+    name: str
+        What the span times, e.g., 'cache.get'
+    attributes: dict
+        Details of the operation
+
+    Returns
+    ----------
+    Iterator of the span, to which more attributes can be added
+    """
+
+    trace = _current_trace.get()
+    if trace is None or not trace.sampled:
+        yield NOOP_SPAN
+        return
+
+    parent = _current_span.get()
+    new_span = Span(trace,
+                    name,
+                    parent.span_id if parent else trace.parent_id,
+                    attributes)
+    token = _current_span.set(new_span)
+    try:
+        yield new_span
+    except BaseException as error:
+        new_span.error = f'{type(error).__name__}: {error}'[:200]
+        raise
+    finally:
+        new_span.finish()
+        _current_span.reset(token)
+        # Bounds the memory used by requests running many queries
+        if len(trace.spans) < constants.TRACE_MAX_SPANS:
+            trace.spans.append(new_span)
+        else:
+            trace.dropped_spans += 1
+
+
+@contextmanager
+def collect_spans() -> Iterator[Trace]:
+    """
+    Records the spans of the code run in the 'with' block in a trace of
+    its own, whether or not the request is sampled, e.g., to show them
+    in a profiling report. The spans are not exported
+
+    Returns
+    ----------
+    Iterator of the trace, whose 'spans' are filled in as they finish
+    """
+
+    outer_trace = _current_trace.get()
+    trace = Trace(secrets.token_hex(16),
+                  outer_trace.request_id if outer_trace
+                  else secrets.token_hex(16))
+    trace_token = _current_trace.set(trace)
+    span_token = _current_span.set(None)
+    try:
+        yield trace
+    finally:
+        _current_span.reset(span_token)
+        _current_trace.reset(trace_token)
+
+
+def trace_query(execute, sql, params, many, context):
+    """
+    Runs a query in a 'db.query' span. Follows the signature required
+    by 'connection.execute_wrapper'
+    """
+
+    with span('db.query',
+              db=context['connection'].alias,
+              sql=sql[:constants.TRACE_MAX_SQL_LENGTH]):
+        return execute(sql, params, many, context)
+
+
+class JsonLinesExporter:
+    """Appends the spans of each trace to a file, one JSON per line"""
+
+    def __init__(self, path: str) -> None:
+        """
+        Parameters
+        ----------
+        path: str
+            The file to write to
+        """
+
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, spans: list[Span]) -> None:
+        """Writes the spans of a trace"""
+
+        lines = ''.join(json.dumps(trace_span.to_dict(), default=str) + '\n'
+                        for trace_span in spans)
+        # One write per trace, so the lines of traces are not mixed
+        with self._lock, open(self.path, 'a', encoding='utf-8') as file:
+            file.write(lines)
+
+
+def otlp_value(value) -> dict:
+    """Returns an attribute value in the OTLP JSON format"""
+
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+
+class OtlpExporter:
+    """
+    Posts the spans to an OpenTelemetry collector in the OTLP/HTTP JSON
+    format. The spans are queued and posted by a background thread. If
+    the collector falls behind, new traces are dropped
+    """
+
+    # OTLP span kinds
+    KIND_INTERNAL = 1
+    KIND_SERVER = 2
+    KIND_CLIENT = 3
+
+    def __init__(self, endpoint: str, service_name: str) -> None:
+        """
+        Parameters
+        ----------
+        endpoint: str
+            The URL of the collector's traces endpoint, e.g.,
+            'http://localhost:4318/v1/traces'
+        service_name: str
+            The name the spans are reported under
+        """
+
+        self.endpoint = endpoint
+        self.service_name = service_name
+        self._queue = queue.Queue(maxsize=constants.TRACE_EXPORT_QUEUE_SIZE)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def export(self, spans: list[Span]) -> None:
+        """Queues the spans of a trace to be posted"""
+
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run,
+                                                name='otlp-exporter',
+                                                daemon=True)
+                self._thread.start()
+
+        try:
+            self._queue.put_nowait(spans)
+        except queue.Full:
+            metrics.add('tracing', 'otlp', dropped_traces=1)
+
+    def _run(self) -> None:
+        """Posts the queued traces, a batch at a time"""
+
+        while True:
+            batch = self._queue.get()
+            while len(batch) < constants.TRACE_MAX_SPANS:
+                try:
+                    batch = batch + self._queue.get_nowait()
+                except queue.Empty:
+                    break
+
+            try:
+                requests.post(self.endpoint,
+                              json=self.payload(batch),
+                              timeout=constants.TRACE_EXPORT_TIMEOUT
+                              ).raise_for_status()
+            except requests.RequestException as error:
+                metrics.add('tracing', 'otlp', failed_posts=1)
+                logger.warning('Could not post spans to %s: %s',
+                               self.endpoint, error)
+
+    def payload(self, spans: list[Span]) -> dict:
+        """Returns the spans in the OTLP JSON format"""
+
+        def kind(trace_span: Span) -> int:
+            if trace_span.name == 'http.request':
+                return self.KIND_SERVER
+            if trace_span.name == 'http.client':
+                return self.KIND_CLIENT
+            return self.KIND_INTERNAL
+
+        otlp_spans = []
+        for trace_span in spans:
+            attributes = {**trace_span.attributes,
+                          'request_id': trace_span.trace.request_id}
+            otlp_span = {
+                'traceId': trace_span.trace.trace_id,
+                'spanId': trace_span.span_id,
+                'name': trace_span.name,
+                'kind': kind(trace_span),
+                'startTimeUnixNano': str(trace_span.start_time_ns),
+                'endTimeUnixNano': str(trace_span.start_time_ns
+                                       + trace_span.duration_ns),
+                'attributes': [{'key': key, 'value': otlp_value(value)}
+                               for key, value in attributes.items()],
+                }
+            if trace_span.parent_id:
+                otlp_span['parentSpanId'] = trace_span.parent_id
+            if trace_span.error:
+                # 2 is the OTLP error status
+                otlp_span['status'] = {'code': 2,
+                                       'message': trace_span.error}
+            otlp_spans.append(otlp_span)
+
+        return {'resourceSpans': [{
+            'resource': {'attributes': [{
+                'key': 'service.name',
+                'value': {'stringValue': self.service_name},
+                }]},
+            'scopeSpans': [{'scope': {'name': __name__},
+                            'spans': otlp_spans}],
+            }]}
+
+
+@lru_cache(maxsize=1)
+def get_exporters() -> tuple:
+    """
+    Returns the exporters set up in 'settings.TRACING'
+
+    Returns
+    ----------
+    Tuple of exporters (empty if the spans are not exported)
+    """
+
+    tracing = settings.TRACING
+    exporters = []
+    if tracing.get('FILE'):
+        exporters.append(JsonLinesExporter(tracing['FILE']))
+    if tracing.get('OTLP_ENDPOINT'):
+        exporters.append(OtlpExporter(tracing['OTLP_ENDPOINT'],
+                                      tracing.get('SERVICE_NAME', 'words')))
+    return tuple(exporters)
+
+
+def export_trace(trace: Trace) -> None:
+    """Hands the spans of a finished trace to the exporters"""
+
+    if trace.dropped_spans:
+        metrics.add('tracing', 'spans', dropped_spans=trace.dropped_spans)
+    metrics.add('tracing', 'spans', exported_spans=len(trace.spans))
+
+    for exporter in get_exporters():
+        try:
+            exporter.export(trace.spans)
+        except Exception:
+            logger.exception('Could not export trace %s', trace.trace_id)
+
+
+class TracingMiddleware:
+    """
+    Gives every request a correlation ID and traces a share of them,
+    recording the database queries they run in 'db.query' spans
+    """
+
+    def __init__(self, get_response) -> None:
+        """
+        Parameters
+        ----------
+        get_response: Callable
+            The next middleware or the view
+        """
+
+        if not getattr(settings, 'TRACING', None):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        # Nothing is traced if the spans go nowhere
+        self.enabled = bool(get_exporters())
+        self.sample_rate = settings.TRACING.get('SAMPLE_RATE', 0)
+        self.trusted_upstreams = tuple(
+            ipaddress.ip_network(upstream.strip(), strict=False)
+            for upstream in settings.TRACING.get('TRUSTED_UPSTREAMS', ())
+            if upstream.strip()
+            )
+
+    def is_trusted_upstream(self, request: HttpRequest) -> bool:
+        """
+        Returns whether the request comes from an address whose
+        'traceparent' sampled flag is followed
+        """
+
+        try:
+            address = ipaddress.ip_address(request.META.get('REMOTE_ADDR',
+                                                            ''))
+        except ValueError:
+            return False
+        return any(address in upstream for upstream in self.trusted_upstreams)
+
+    def __call__(self, request: HttpRequest) -> HttpResponse:
+        """
+        Handles the request within its trace and exports the spans
+        """
+
+        request_id = request.headers.get('X-Request-ID', '')
+        if not REQUEST_ID.match(request_id):
+            request_id = secrets.token_hex(16)
+        request.request_id = request_id
+
+        traceparent = TRACEPARENT.match(request.headers.get('traceparent',
+                                                            ''))
+        sampled = self.enabled and random.random() < self.sample_rate
+        if traceparent:
+            trace_id, parent_id, flags = traceparent.groups()
+            # A trusted caller asks for the trace with the 'sampled' flag
+            if self.is_trusted_upstream(request):
+                sampled = self.enabled and bool(int(flags, 16) & 1)
+        else:
+            trace_id, parent_id = secrets.token_hex(16), None
+        trace = Trace(trace_id, request_id, parent_id, sampled)
+
+        token = _current_trace.set(trace)
+        try:
+            with ExitStack() as stack:
+                if sampled:
+                    for alias in connections:
+                        stack.enter_context(
+                            connections[alias].execute_wrapper(trace_query)
+                            )
+                with span('http.request',
+                          method=request.method,
+                          path=request.path) as request_span:
+                    response = self.get_response(request)
+                    request_span.set(
+                        status_code=response.status_code,
+                        view=(request.resolver_match.view_name
+                              if request.resolver_match else '')
+                        )
+        finally:
+            _current_trace.reset(token)
+
+        response['X-Request-ID'] = request_id
+        if sampled:
+            export_trace(trace)
+
+        return response
+
+
+class RequestIdFilter(logging.Filter):
+    """Adds the correlation ID of the request to each log record"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = current_request_id() or '-'
+        return True
+
+
+class TracedDatabaseCache(DatabaseCache):
+    """
+    The database cache backend, with its operations recorded in
+    'cache.*' spans. Operations made by another cache operation, e.g.,
+    the 'get_many' of a 'get', are not recorded again
+    """
+
+    @contextmanager
+    def _span(self, operation: str, key: str | None = None):
+        """Records a cache operation, unless within another one"""
+
+        current = _current_span.get()
+        if current is not None and current.name.startswith('cache.'):
+            yield NOOP_SPAN
+            return
+        with span(f'cache.{operation}', key=key) as cache_span:
+            yield cache_span
+
+    def get(self, key, default=None, version=None):
+        with self._span('get', key) as cache_span:
+            value = super().get(key, default, version)
+            cache_span.set(hit=value is not default)
+            return value
+
+    def get_many(self, keys, version=None):
+        keys = list(keys)
+        with self._span('get_many', ','.join(keys)) as cache_span:
+            values = super().get_many(keys, version)
+            cache_span.set(hits=len(values))
+            return values
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT,
+            version=None):
+        with self._span('set', key):
+            return super().set(key, value, timeout, version)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT,
+            version=None):
+        with self._span('add', key):
+            return super().add(key, value, timeout, version)
+
+    def incr(self, key, delta=1, version=None):
+        with self._span('incr', key):
+            return super().incr(key, delta, version)
+
+    def delete(self, key, version=None):
+        with self._span('delete', key):
+            return super().delete(key, version)
+
+
+class TracedTemplate:
+    """A Django template whose renders are recorded in spans"""
+
+    def __init__(self, template) -> None:
+        """
+        Parameters
+        ----------
+        template: django.template.backends.django.Template
+            The template to render
+        """
+
+        self.template = template
+
+    def __getattr__(self, name: str):
+        return getattr(self.template, name)
+
+    def render(self, context=None, request=None) -> str:
+        with span('template.render', template=self.template.origin.name):
+            return self.template.render(context, request)
+
+
+class TracedDjangoTemplates(DjangoTemplates):
+    """The Django template backend, with the renders recorded in spans"""
+
+    def from_string(self, template_code: str) -> TracedTemplate:
+        return TracedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name: str) -> TracedTemplate:
+        return TracedTemplate(super().get_template(template_name))
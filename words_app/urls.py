@@ -2,9 +2,11 @@
 Defines the URL patterns for the words app
 
 It includes routes for various functionalities such as viewing the
-index page, managing favourite words, upgrading user accounts, viewing
-specific words, generating random words, accessing games, and viewing
-user profiles
+index page, managing, toggling, exporting and importing favourite words,
+upgrading user accounts, viewing specific words, suggesting words,
+counting the words matching an advanced search, generating random
+words, accessing games, listing the most favourited words, viewing
+user profiles and viewing the app metrics
 """
 # words_app/urls.py
 
@@ -15,10 +17,26 @@ app_name = 'words_app'
 urlpatterns = [
     path('', views.index, name='index'),
     path('favourite_words/', views.favourite_words, name='favourite'),
+    path('favourite_words/toggle/',
+         views.toggle_favourite,
+         name='toggle_favourite'),
+    path('favourite_words/export/<str:file_format>/',
+         views.export_favourite_words,
+         name='export_favourites'),
+    path('favourite_words/import/',
+         views.import_favourite_words,
+         name='import_favourites'),
     path('upgrade_account/', views.upgrade_account, name='upgrade_account'),
     path('view_word/<str:word>/', views.view_word, name='view_word'),
+    path('suggest_words/', views.suggest_words, name='suggest_words'),
+    path('search_facets/', views.search_facets, name='search_facets'),
     path('random_word/', views.random_word, name='random_word'),
     path('games/', views.view_games, name='games'),
+    path('most_favourited/', views.most_favourited, name='most_favourited'),
+    path('most_favourited/api/',
+         views.most_favourited_api,
+         name='most_favourited_api'),
     path('profile/', views.user_profile, name='user_profile'),
     path('view_words/<str:querystring>/', views.view_words, name='view_words'),
+    path('metrics/', views.view_metrics, name='metrics'),
 ]
@@ -1,23 +1,133 @@
 """
 Contains utility functions for the words app
 
-It includes functions to fetch words from the WordsAPI, validate cache
-timestamps, get the word of the day, process word data results based
-on user groups, and extract and organise word data for display
+It includes functions to fetch words from the WordsAPI, get the word
+of the day, fill in the word of the day calendar, process word data
+results based on user groups, and extract and organise word data for
+display. It also includes functions to clean, export and import
+favourite words
 """
 # words_app/utils.py
 
+import codecs
+import csv
 import datetime
+import json
+import time
+from itertools import islice
+from typing import Iterable, Iterator
 import requests
 import pytz
 from django.conf import settings
 from django.core.cache import cache
+from django.core.files.uploadedfile import UploadedFile
+from django.db import connections, router, transaction
+from django.db.models import (Count, F, IntegerField, OuterRef, QuerySet,
+                              Subquery)
+from django.db.models.functions import Coalesce
+from .caching import cached_fetch, refresh_cached
+from .circuit_breaker import CircuitBreaker, CircuitOpenError
+from .concurrency import AdaptiveConcurrencyLimiter
+from .models import FavouriteWord, LexiconWord, WordOfDay
+from .thesaurus import record_thesaurus_relations
+from .throttle import Throttled, count_words_api_call
+from .tracing import span
+from . import constants
+
+# Stops calling WordsAPI for a while when it is failing or slow
+words_api_breaker = CircuitBreaker(
+    'words_api',
+    failure_threshold=settings.WORDS_API_CIRCUIT_BREAKER['FAILURE_THRESHOLD'],
+    slow_call_seconds=settings.WORDS_API_CIRCUIT_BREAKER['SLOW_CALL_SECONDS'],
+    window=settings.WORDS_API_CIRCUIT_BREAKER['WINDOW'],
+    reset_timeout=settings.WORDS_API_CIRCUIT_BREAKER['RESET_TIMEOUT'],
+    )
+
+# Limits the WordsAPI calls in flight, so they do not slow each other down
+words_api_limiter = AdaptiveConcurrencyLimiter(
+    'words_api',
+    initial_limit=settings.WORDS_API_CONCURRENCY_LIMIT['INITIAL_LIMIT'],
+    min_limit=settings.WORDS_API_CONCURRENCY_LIMIT['MIN_LIMIT'],
+    max_limit=settings.WORDS_API_CONCURRENCY_LIMIT['MAX_LIMIT'],
+    latency_tolerance=settings.WORDS_API_CONCURRENCY_LIMIT[
+        'LATENCY_TOLERANCE'
+        ],
+    backoff_ratio=settings.WORDS_API_CONCURRENCY_LIMIT['BACKOFF_RATIO'],
+    queue_timeout=settings.WORDS_API_CONCURRENCY_LIMIT['QUEUE_TIMEOUT'],
+    )
+
+
+def is_words_api_healthy(response: requests.Response) -> bool:
+    """
+    Returns whether a WordsAPI response shows the service is working.
+    A word that does not exist (404) is a valid answer, while server
+    errors and rate limiting are not
+    """
+
+    return response.status_code < 500 and response.status_code != 429
+
+
+def _get(url: str, **kwargs) -> requests.Response | None:
+    """
+    Sends a GET request to WordsAPI through the concurrency limiter and
+    the circuit breaker
+
+    Parameters
+    ----------
+    url: str
+        The URL to request
+    kwargs: dict
+        Passed to 'requests.get'
+
+    Returns
+    ----------
+    requests.Response | None
+        None if the request failed, was shed by the concurrency limiter
+        or the circuit breaker is open
+
+    Raises
+    ----------
+    Throttled
+        If the request is made for a user who has made too many
+    """
+
+    with span('http.client', service='words_api', url=url) as request_span:
+        if not words_api_limiter.acquire():
+            request_span.set(failure='shed')
+            return None
+
+        start = time.monotonic()
+        # Stays None if the call never reached WordsAPI
+        seconds = None
+
+        def counted_get():
+            # Only the calls the breaker lets out count against the user
+            count_words_api_call()
+            return requests.get(url, **kwargs)
+
+        try:
+            response = words_api_breaker.call(counted_get,
+                                              is_success=is_words_api_healthy,
+                                              ignore=(Throttled,))
+            seconds = time.monotonic() - start
+        except CircuitOpenError as error:
+            request_span.set(failure=type(error).__name__)
+            return None
+        except requests.RequestException as error:
+            seconds = time.monotonic() - start
+            request_span.set(failure=type(error).__name__)
+            return None
+        finally:
+            words_api_limiter.release(seconds)
+
+        request_span.set(status_code=response.status_code)
+        return response
 
 
 def fetch_word(word: str = None,
                get_random_word: bool = True,
                querystring: object = None
-               ) -> dict:
+               ) -> dict | None:
     """
     Fetches a word from WordsAPI and returns the results of this as a
     dictionary
@@ -35,7 +145,9 @@ def fetch_word(word: str = None,
 
     Returns
     ----------
-    Dictionary
+    Dictionary (empty if the call failed or WordsAPI is unavailable).
+    If WordsAPI is unavailable, a word is looked up in the local
+    lexicon instead, and None is returned if it is not there either
     """
 
     # The request should wait a maximum of 8 seconds for a response
@@ -49,65 +161,383 @@ def fetch_word(word: str = None,
 
     if get_random_word:
         querystring = {"random": "true"}
-        response = requests.get(url,
-                                headers=headers,
-                                params=querystring,
-                                timeout=timeout
-                                )
-        if response.status_code == 200:  # Check if call was a success
+        response = _get(url,
+                        headers=headers,
+                        params=querystring,
+                        timeout=timeout
+                        )
+        # Check if call was a success
+        if response is not None and response.status_code == 200:
             return response.json()
         return {}
 
     elif not get_random_word and word:  # Get word requested by the user
         # Add word to end of url
         word_url = f'{url}{word}'
-        response = requests.get(word_url,
-                                headers=headers,
-                                timeout=timeout
-                                )
-        if response.status_code == 200:
+        response = _get(word_url,
+                        headers=headers,
+                        timeout=timeout
+                        )
+        if response is not None and response.status_code == 200:
             return response.json()
+        if response is None:
+            # WordsAPI could not be called, so fall back to the word's
+            # record in the local lexicon, if it was ingested
+            return LexiconWord.objects.filter(
+                word=word.strip().lower()
+                ).values_list('payload', flat=True).first()
         return {}
 
     else:  # Get multiple words
-        response = requests.get(url,
-                                headers=headers,
-                                params=querystring,
-                                timeout=timeout
-                                )
-        if response.status_code == 200:
+        response = _get(url,
+                        headers=headers,
+                        params=querystring,
+                        timeout=timeout
+                        )
+        if response is not None and response.status_code == 200:
             return response.json()
         return {}
 
 
-def is_cache_valid(timestamp: str) -> bool:
+def seconds_until_midnight_uk() -> int:
+    """
+    Calculates the number of seconds until midnight UK time
+
+    Parameters
+    ----------
+    None
+
+    Returns
+    ----------
+    Int
+    """
+    now_utc = datetime.datetime.now(pytz.utc)
+    uk_timezone = pytz.timezone('Europe/London')
+    now_uk = now_utc.astimezone(uk_timezone)
+    midnight_uk = (
+        (now_uk + datetime.timedelta(days=1)).
+        replace(hour=0, minute=0, second=0, microsecond=0)
+        )
+
+    return int((midnight_uk - now_uk).total_seconds())
+
+
+def uk_today() -> datetime.date:
+    """
+    Returns today's date in the UK, which decides the word of the day
+
+    Parameters
+    ----------
+    None
+
+    Returns
+    ----------
+    Date
+    """
+
+    return datetime.datetime.now(pytz.timezone('Europe/London')).date()
+
+
+def process_word_of_day(word_data: dict) -> dict:
+    """
+    Processes the WordsAPI data of the word of the day into what the
+    index page shows. The index only shows the first result, which is
+    the same for every group, so it is processed once for all users
+
+    Parameters
+    ----------
+    word_data: dict
+        Contains all the information about the word, if the WordsAPI
+        call was successful
+
+    Returns
+    ----------
+    Dictionary (empty if the WordsAPI call failed)
+    """
+
+    if not word_data:
+        return {}
+
+    (usage_level,
+     word,
+     syllable_count,
+     results_data) = process_word_data(word_data, 'Pro')
+
+    return {
+        'usage_level': usage_level,
+        'word': word,
+        'syllable_count': syllable_count,
+        # As it is the index, keep only the first result
+        'results_data': (
+            results_data[:1] if results_data is not None else None
+            ),
+        }
+
+
+def fetch_word_of_day() -> dict:
+    """
+    Fetches a random word from WordsAPI to be the word of the day and
+    records its synonyms and antonyms in the thesaurus
+
+    Parameters
+    ----------
+    None
+
+    Returns
+    ----------
+    Dictionary
+        The processed word, see 'process_word_of_day'
+    """
+
+    word_of_today_data = fetch_word()
+    if word_of_today_data:
+        record_thesaurus_relations(word_of_today_data)
+
+    return process_word_of_day(word_of_today_data)
+
+
+def get_word_of_day(refresh: bool = False) -> dict:
     """
-    Checks if the cached timestamp is still within the valid period
-    (less than a day old)
+    Helper function to get the word of the day data, either from cache
+    or WordsAPI. It returns the data of this as a dictionary, processed
+    by 'process_word_of_day'
+
+    Today's word is taken from the word of the day calendar if it has
+    been filled in. Otherwise, the word is fetched and cached. It is
+    fresh until midnight UK time. After that the old word is still
+    shown while the new one is fetched in the background, for up to
+    'constants.WORD_OF_DAY_STALE_TIMEOUT' seconds
 
     Parameters
     ----------
-    timestamp: str
-        The timestamp string in '%Y-%m-%d %H:%M:%S' format
+    refresh: bool
+        Whether to fetch a new word even if the cached one is fresh,
+        e.g., from the job run at midnight
+
+    Returns
+    ----------
+    Dictionary
+    """
+
+    # Words filled in ahead by 'fill_word_of_day_calendar' are the same
+    # for every worker and need no WordsAPI call
+    if not refresh:
+        calendar_data = WordOfDay.objects.filter(
+            date=uk_today()
+            ).values_list('payload', flat=True).first()
+        if calendar_data:
+            return calendar_data
+
+    get = refresh_cached if refresh else cached_fetch
+
+    return get('word_of_day',
+               fetch_word_of_day,
+               fresh_for=seconds_until_midnight_uk(),
+               stale_for=constants.WORD_OF_DAY_STALE_TIMEOUT) or {}
+
+
+def fill_word_of_day_calendar(days: int) -> int:
+    """
+    Fills in the words of the day for the next days that do not have
+    one yet, saving them in one batch. Words already in the calendar
+    and words without definitions are skipped
+
+    Parameters
+    ----------
+    days: int
+        The number of days to fill in, starting from today
+
+    Returns
+    ----------
+    Int
+        The number of days filled in
+    """
+
+    today = uk_today()
+    dates = [today + datetime.timedelta(days=day) for day in range(days)]
+    filled_dates = set(
+        WordOfDay.objects.filter(date__in=dates).
+        values_list('date', flat=True)
+        )
+    used_words = set(WordOfDay.objects.values_list('word', flat=True))
+    max_length = WordOfDay._meta.get_field('word').max_length
+
+    new_days = []
+    for date in dates:
+        if date in filled_dates:
+            continue
+        for _ in range(constants.WORD_OF_DAY_FETCH_ATTEMPTS):
+            word_data = fetch_word()
+            word = word_data.get('word', '')
+            if (word_data.get('results') and word not in used_words
+                    and len(word) <= max_length):
+                break
+        else:
+            # WordsAPI is failing, the remaining days are filled later
+            break
+        used_words.add(word)
+        record_thesaurus_relations(word_data)
+        new_days.append(WordOfDay(date=date,
+                                  word=word,
+                                  payload=process_word_of_day(word_data)))
+
+    WordOfDay.objects.bulk_create(new_days, ignore_conflicts=True)
+
+    return len(new_days)
+
+
+def delete_orphaned_favourite_words() -> int:
+    """
+    Deletes every favourite word that is no longer favourited by any
+    user, using a single set-based query
+
+    Unfavouriting only removes the row linking a user to a word, so
+    this is run periodically to keep the database clean instead of
+    counting the remaining users inside each request
+
+    Parameters
+    ----------
+    None
+
+    Returns
+    ----------
+    Int
+        The number of favourite words deleted
+    """
+
+    deleted, _ = (
+        FavouriteWord.objects.filter(users__isnull=True).delete()
+        )
+
+    return deleted
+
+
+def toggle_favourite_word(user, word: str, favourite: bool | None = None
+                          ) -> bool:
+    """
+    Adds a word to a user's favourite words or removes it, keeping the
+    word's 'favourite_count' up to date
+
+    Neither the favourite word nor the link to the user is loaded.
+    Adding inserts the word and the link with inserts that ignore
+    existing rows, and removing deletes the link by user and word, so
+    concurrent toggles cannot fail or count a user twice. The count is
+    only changed when a link was inserted or deleted. That is at most
+    three statements to add a word and two to remove it. Toggling runs
+    the delete first, so it takes four statements to toggle a word on
+    and two to toggle it off
+
+    Parameters
+    ----------
+    user: User
+        The user favouriting or unfavouriting the word
+    word: str
+        The word
+    favourite: bool | None
+        True to add the word, False to remove it. Defaults to None,
+        which removes the word if it is a favourite and adds it
+        otherwise
 
     Returns
     ----------
     Boolean
+        Whether the word is a favourite of the user afterwards
+    """
+
+    user_favourite_word = FavouriteWord.users.through
+    database = router.db_for_write(FavouriteWord)
+
+    with transaction.atomic(using=database):
+        if favourite is not True:
+            deleted, _ = (
+                user_favourite_word.objects.using(database).
+                filter(user_id=user.id, favouriteword__word=word).
+                delete()
+                )
+            if deleted:
+                (FavouriteWord.objects.using(database).
+                 filter(word=word, favourite_count__gt=0).
+                 update(favourite_count=F('favourite_count') - 1))
+                return False
+            if favourite is False:
+                return False
+
+        FavouriteWord.objects.using(database).bulk_create(
+            [FavouriteWord(word=word)], ignore_conflicts=True
+            )
+        # Links the user to the word by its text, so the word's id does
+        # not have to be read first
+        connection = connections[database]
+        quote_name = connection.ops.quote_name
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {quote_name(user_favourite_word._meta.db_table)}'
+                f' ({quote_name("user_id")}, {quote_name("favouriteword_id")})'
+                f' SELECT %s, {quote_name("id")}'
+                f' FROM {quote_name(FavouriteWord._meta.db_table)}'
+                f' WHERE {quote_name("word")} = %s'
+                f' ON CONFLICT DO NOTHING',
+                [user.id, word]
+                )
+            inserted = cursor.rowcount
+        if inserted:
+            # Counted in the database, so concurrent favourites of the
+            # same word are not lost
+            (FavouriteWord.objects.using(database).
+             filter(word=word).
+             update(favourite_count=F('favourite_count') + 1))
+
+    return True
+
+
+def recount_favourite_words(favourite_words: QuerySet | None = None) -> int:
+    """
+    Sets the 'favourite_count' of favourite words to the number of
+    users who favourited them, with a single query
+
+    The counts are kept up to date as words are favourited and
+    unfavourited, so this only corrects counts left wrong by changes
+    made without the helpers, e.g., in the admin or a bulk import
+
+    Parameters
+    ----------
+    favourite_words: QuerySet | None
+        The favourite words to recount. Defaults to all of them
+
+    Returns
+    ----------
+    Int
+        The number of favourite words whose count was corrected
     """
 
-    last_updated = (
-        datetime.datetime.strptime(timestamp, '%Y-%m-%d %H:%M:%S')
+    if favourite_words is None:
+        favourite_words = FavouriteWord.objects.all()
+
+    user_count = Coalesce(
+        Subquery(
+            FavouriteWord.users.through.objects.
+            filter(favouriteword_id=OuterRef('id')).
+            order_by().values('favouriteword_id').
+            annotate(count=Count('id')).values('count'),
+            output_field=IntegerField()
+            ),
+        0
         )
 
     return (
-        datetime.datetime.now() -
-        last_updated < datetime.timedelta(days=1)
+        favourite_words.alias(user_count=user_count).
+        exclude(favourite_count=F('user_count')).
+        update(favourite_count=user_count)
         )
 
 
-def seconds_until_midnight_uk() -> int:
+def get_most_favourited_words() -> list[dict]:
     """
-    Calculates the number of seconds until midnight UK time
+    Helper function to get the most favourited words, from the cache if
+    they were read recently
+
+    The words are read in order from the 'favourite_count' index, so
+    the query does not depend on the number of favourites
 
     Parameters
     ----------
@@ -115,57 +545,181 @@ def seconds_until_midnight_uk() -> int:
 
     Returns
     ----------
-    Int
+    List of dictionaries with the 'word' and its 'favourite_count'
     """
-    now_utc = datetime.datetime.now(pytz.utc)
-    uk_timezone = pytz.timezone('Europe/London')
-    now_uk = now_utc.astimezone(uk_timezone)
-    midnight_uk = (
-        (now_uk + datetime.timedelta(days=1)).
-        replace(hour=0, minute=0, second=0, microsecond=0)
+
+    # 'cache.get_or_set' reads the cache again after filling it, so the
+    # cache is read and filled here instead
+    most_favourited_words = cache.get('most_favourited_words')
+    if most_favourited_words is None:
+        most_favourited_words = list(
+            FavouriteWord.objects.filter(favourite_count__gt=0).
+            order_by('-favourite_count', 'word').
+            values('word', 'favourite_count')
+            [:constants.NUM_OF_MOST_FAVOURITED]
+            )
+        cache.set('most_favourited_words',
+                  most_favourited_words,
+                  constants.MOST_FAVOURITED_CACHE_TIMEOUT)
+
+    return most_favourited_words
+
+
+class Echo:
+    """
+    A file-like object that returns what is written to it instead of
+    storing it. This lets 'csv.writer' produce rows one at a time for
+    streaming
+    """
+
+    def write(self, value: str) -> str:
+        """Returns the value that was written"""
+        return value
+
+
+def stream_favourite_words(favourite_words: QuerySet,
+                           file_format: str) -> Iterator[str]:
+    """
+    Generator that yields favourite words one line at a time, either as
+    CSV or as JSON Lines (one JSON object per line)
+
+    The words are read from the database in batches using a server-side
+    cursor, so only one batch is held in memory at a time
+
+    Parameters
+    ----------
+    favourite_words: QuerySet
+        The favourite words to export
+    file_format: str
+        Either 'csv' or 'json'
+
+    Returns
+    ----------
+    Iterator of strings
+    """
+
+    rows = (
+        favourite_words.order_by('word').
+        values_list('word', 'date_added').
+        iterator(chunk_size=constants.FAVOURITE_WORDS_BATCH_SIZE)
         )
 
-    return int((midnight_uk - now_uk).total_seconds())
+    if file_format == 'csv':
+        writer = csv.writer(Echo())
+        yield writer.writerow(['word', 'date_added'])
+        for word, date_added in rows:
+            yield writer.writerow([word, date_added.isoformat()])
+    else:
+        for word, date_added in rows:
+            yield json.dumps(
+                {'word': word, 'date_added': date_added.isoformat()}
+                ) + '\n'
 
 
-def get_word_of_day() -> dict:
+def read_favourite_words_file(uploaded_file: UploadedFile
+                              ) -> Iterator[str]:
     """
-    Helper function to get the word of the day data, either from cache
-    or WordsAPI. It returns the data of this as a dictionary
+    Generator that yields the words in an uploaded CSV or JSON Lines
+    file, parsing it one line at a time
 
     Parameters
     ----------
-    None
+    uploaded_file: UploadedFile
+        A file in the format produced by 'stream_favourite_words'
+
+    Raises
+    ----------
+    ValueError
+        If the file is not valid UTF-8 or contains invalid JSON
 
     Returns
     ----------
-    Dictionary
+    Iterator of strings. JSON values that are not strings, e.g.,
+    '{"word": null}', are skipped
     """
 
-    # For storing the random word data and its timestamp
-    cache_key = 'api_data_random_word'
-    cache_timestamp_key = 'api_data_timestamp_random_word'
-    # Retrieve cached data and timestamp
-    cached_data = cache.get(cache_key)
-    cached_timestamp = cache.get(cache_timestamp_key)
-
-    if (cached_data
-            and cached_timestamp
-            and is_cache_valid(cached_timestamp)):
-        return cached_data
-    else:  # If not, fetch new data and update cache
-        word_of_today_data = fetch_word()
-        if word_of_today_data:
-            now = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            timeout = seconds_until_midnight_uk()
-            cache.set(cache_key, word_of_today_data, timeout=timeout)
-            (cache.set(
-                cache_timestamp_key,
-                now,
-                timeout=timeout))
-            return word_of_today_data
-
-    return {}
+    lines = codecs.iterdecode(uploaded_file, 'utf-8-sig')
+
+    if uploaded_file.name.lower().endswith('.csv'):
+        for row in csv.reader(lines):
+            # Skip empty rows and the header row
+            if row and row[0] != 'word':
+                yield row[0]
+    else:
+        for line in lines:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            word = (
+                record.get('word') if isinstance(record, dict) else record
+                )
+            if isinstance(word, str):
+                yield word
+
+
+def save_favourite_words(user, words: Iterable[str]) -> int:
+    """
+    Adds words to a user's favourite words in fixed-size batches
+
+    Each batch inserts the missing favourite words and the links to
+    the user with two bulk inserts that ignore existing rows, so
+    importing the same file twice does not create duplicates. The
+    'favourite_count' of the words of the batch is then recounted. All
+    the batches are saved in one transaction, so nothing is saved if
+    reading the words fails part way
+
+    Parameters
+    ----------
+    user: User
+        The user to add the favourite words to
+    words: Iterable[str]
+        The words to add. Empty words and words that are too long are
+        skipped
+
+    Returns
+    ----------
+    Int
+        The number of words added that were not favourites already
+    """
+
+    max_length = FavouriteWord._meta.get_field('word').max_length
+    words = (
+        word.strip() for word in words
+        if word.strip() and len(word.strip()) <= max_length
+        )
+    user_favourite_word = FavouriteWord.users.through
+    saved = 0
+
+    with transaction.atomic():
+        while batch := list(
+                islice(words, constants.FAVOURITE_WORDS_BATCH_SIZE)):
+            # Remove duplicates while keeping the order
+            batch = list(dict.fromkeys(batch))
+            FavouriteWord.objects.bulk_create(
+                [FavouriteWord(word=word) for word in batch],
+                ignore_conflicts=True
+                )
+            word_ids = list(
+                FavouriteWord.objects.filter(word__in=batch).
+                values_list('id', flat=True)
+                )
+            already_saved = user_favourite_word.objects.filter(
+                user_id=user.id, favouriteword_id__in=word_ids
+                ).count()
+            user_favourite_word.objects.bulk_create(
+                [user_favourite_word(user_id=user.id,
+                                     favouriteword_id=word_id)
+                 for word_id in word_ids],
+                ignore_conflicts=True
+                )
+            # The inserts do not say which links were new, so the words
+            # of the batch are counted again
+            recount_favourite_words(
+                FavouriteWord.objects.filter(id__in=word_ids)
+                )
+            saved += len(word_ids) - already_saved
+
+    return saved
 
 
 def process_word_data_results(group_name: str,
@@ -1,10 +1,12 @@
 """
 Defines the views for the words app
 
-It includes functions to render the index page, manage favourite words,
-handle account upgrades, view specific words, display random words,
-access games, and view user profiles. Each view processes user requests
-and interacts with the WordsAPI and the database as needed
+It includes functions to render the index page, manage, toggle, export
+and import favourite words, handle account upgrades, view specific
+words, suggest words while typing, display random words, access games,
+view user profiles, list the most favourited words and show staff the
+app metrics. Each view processes user requests and interacts with the
+WordsAPI and the database as needed
 """
 # words_app/views.py
 
@@ -13,15 +15,48 @@ import datetime
 from django.conf import settings
 from django.shortcuts import render
 from django.contrib import messages
-from django.http import HttpRequest, HttpResponse, HttpResponseRedirect
+from django.http import (HttpRequest,
+                         HttpResponse,
+                         HttpResponseRedirect,
+                         StreamingHttpResponse,
+                         JsonResponse,
+                         Http404
+                         )
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import Group
-from django.shortcuts import redirect, get_object_or_404
+from django.shortcuts import redirect
+from django.db import transaction
+from django.db.models import F
+from django.views.decorators.http import require_POST
+from .circuit_breaker import CircuitBreaker
+from .metrics import metrics
 from .utils import (process_word_data,
                     get_word_of_day,
-                    fetch_word
+                    fetch_word,
+                    stream_favourite_words,
+                    read_favourite_words_file,
+                    save_favourite_words,
+                    toggle_favourite_word,
+                    get_most_favourited_words,
+                    words_api_breaker,
+                    words_api_limiter
                     )
-from .forms import BasicSearchForm, AdvancedSearchForm
+from .forms import (BasicSearchForm,
+                    AdvancedSearchForm,
+                    ImportFavouriteWordsForm,
+                    AnagramSolverForm,
+                    AnagramGuessForm,
+                    RhymeForm
+                    )
+from .facets import get_facet_index
+from .games import can_spell, get_anagram_index
+from .jobs import job_statistics
+from .rhymes import get_rhyme_index
+from .search import CanonicalQuery, advanced_search_params, search_words
+from .suggestions import get_prefix_index, get_spelling_index
+from .thesaurus import get_related_words, queue_thesaurus_relations
+from .throttle import throttle_words_api_calls
 from .models import FavouriteWord
 from . import constants
 
@@ -31,11 +66,12 @@ from . import constants
 def index(request: HttpRequest) -> HttpResponse | HttpResponseRedirect:
     """
     Fetches a random word from WordsAPI or retrieves it from cache if it
-    was fetched within the last 24 hours
+    was fetched today
 
-    It checks if the random word data is already in the cache and still
-    valid. If valid, it uses the cached data. Otherwise, it fetches new
-    data from WordsAPI and updates the cache
+    It checks if the random word data is already in the cache. If it is,
+    it uses the cached data, refreshing it in the background after
+    midnight. Otherwise, it fetches new data from WordsAPI and updates
+    the cache
 
     Takes in a HttpRequest and renders the index template
 
@@ -67,23 +103,16 @@ def index(request: HttpRequest) -> HttpResponse | HttpResponseRedirect:
         # Check if user wants to favourite a word
         if 'add' in request.POST:
             word = request.POST['add']
-            # Get favourite word or create a new one if it doesn't exist
-            favourite_word, _ = (
-                FavouriteWord.objects.get_or_create(word=word)
-                )
-            user.favourite_words.add(favourite_word)
+            # Creates the favourite word if it doesn't exist
+            toggle_favourite_word(user, word, favourite=True)
             return redirect('words_app:index')
 
         # Check if user wants to unfavourite a word
         elif 'remove' in request.POST:
             word = request.POST['remove']
-            favourite_word = FavouriteWord.objects.get(word=word)
-            user.favourite_words.remove(favourite_word)
-
-            # Check if word is no longer favourited by any user
-            # This keeps the database clean
-            if not favourite_word.users.count():
-                favourite_word.delete()
+            # Words no longer favourited by any user are deleted later
+            # by the 'clean_favourite_words' command
+            toggle_favourite_word(user, word, favourite=False)
             return redirect('words_app:index')
 
     if request.method == 'GET':
@@ -98,67 +127,18 @@ def index(request: HttpRequest) -> HttpResponse | HttpResponseRedirect:
         elif form_type == 'advanced_search':
             advanced_search_form = AdvancedSearchForm(request.GET)
             if advanced_search_form.is_valid():
-                letter_pattern = (
-                    advanced_search_form.cleaned_data.
-                    get('letter_pattern', '')
-                    )
-                letters_min = (
-                    advanced_search_form.cleaned_data.
-                    get('letters_min', '')
-                    )
-                letters_max = (
-                    advanced_search_form.cleaned_data.
-                    get('letters_max', '')
-                    )
-                letters = (
-                    advanced_search_form.cleaned_data.
-                    get('letters', '')
-                    )
-                syllables = (
-                    advanced_search_form.cleaned_data.
-                    get('syllables', '')
-                    )
-                syllables_min = (
-                    advanced_search_form.cleaned_data.
-                    get('syllables_min', '')
-                    )
-                syllables_max = (
-                    advanced_search_form.cleaned_data.
-                    get('syllables_max', '')
-                    )
-                frequency_min = (
-                    advanced_search_form.cleaned_data.
-                    get('frequency_min', '')
-                    )
-                frequency_max = (
-                    advanced_search_form.cleaned_data.
-                    get('frequency_max', '')
-                    )
-
-                querystring_dict = {
-                    "letterPattern": letter_pattern,
-                    "lettersmin": letters_min,
-                    "lettersMax": letters_max,
-                    "letters": letters,
-                    "syllables": syllables,
-                    "syllablesMin": syllables_min,
-                    "syllablesMax": syllables_max,
-                    "frequencymin": frequency_min,
-                    "frequencymax": frequency_max,
+                cleaned_data = advanced_search_form.cleaned_data
+                query = CanonicalQuery({
+                    **advanced_search_params(cleaned_data),
                     "limit": (constants.NUM_OF_PRO_RESULTS if
                               user_group == 'Pro'
                               else constants.NUM_OF_PLUS_RESULTS
                               ),
-                }
-
-                # Encode dictionary into a string
-                querystring = '&'.join(
-                    [f"{key}={value}"
-                     for key, value in querystring_dict.items()]
-                    )
+                })
 
+                # The same search always gets the same URL
                 return redirect("words_app:view_words",
-                                querystring=querystring
+                                querystring=query.querystring
                                 )
 
         else:
@@ -166,33 +146,25 @@ def index(request: HttpRequest) -> HttpResponse | HttpResponseRedirect:
 
     form = BasicSearchForm()
 
-    # Get word of the day data
+    # Get word of the day data, already processed for the index
     word_of_today_data = get_word_of_day()
-    # Process the word data to extract required fields
-    (usage_level,
-     word,
-     syllable_count,
-     results_data) = process_word_data(word_of_today_data, user_group)
+    word = word_of_today_data.get('word')
 
     # Check if word of today is in users favourites
     word_of_today_in_users_favourites = (
         bool(user_favourite_words.filter(word__contains=word))
     )
 
-    # As it is the index, get only the first result
-    results_data_list = (
-        results_data[:1] if results_data is not None else None
-        )
-    results_data_obj = results_data_list
-
     context = {
         'number_of_syllables_str': 'Number of syllables:',
-        'usage_level': usage_level,
+        'usage_level': word_of_today_data.get('usage_level'),
         'word_of_today_data': word_of_today_data,
         'word_of_today_word': word,
-        'word_of_today_syllable_count': syllable_count,
+        'word_of_today_syllable_count': (
+            word_of_today_data.get('syllable_count')
+            ),
         'form': form,
-        'results_data': results_data_obj,
+        'results_data': word_of_today_data.get('results_data'),
         'user_favourite_words': word_of_today_in_users_favourites,
         'user_group': user_group,
         'advanced_search_form': advanced_search_form,
@@ -226,22 +198,146 @@ def favourite_words(
 
     if request.method == 'POST':
         word = request.POST['remove']
-        favourite_word = get_object_or_404(FavouriteWord, word=word)
-        user.favourite_words.remove(favourite_word)
-
-        # Check if word is no longer favourited by any user
-        if not favourite_word.users.count():
-            favourite_word.delete()
+        toggle_favourite_word(user, word, favourite=False)
         return redirect('words_app:favourite')
 
     context = {
         'user_group': user_group,
         'user_favourite_words': user_favourite_words,
+        'import_form': ImportFavouriteWordsForm(),
     }
 
     return render(request, 'words_app/favourite.html', context=context)
 
 
+@login_required
+def export_favourite_words(
+        request: HttpRequest,
+        file_format: str) -> StreamingHttpResponse:
+    """
+    Streams all the favourite words associated with a user as a CSV or
+    JSON Lines file download
+
+    Takes in a HttpRequest and a file format and returns a
+    StreamingHttpResponse
+
+    Parameters
+    ----------
+    request: HttpRequest
+        Contains metadata about the request
+    file_format: str
+        Either 'csv' or 'json'
+
+    Returns
+    ----------
+    StreamingHttpResponse
+    """
+
+    if file_format not in ('csv', 'json'):
+        raise Http404("Unsupported file format")
+
+    user = request.user
+
+    content_type = (
+        'text/csv' if file_format == 'csv' else 'application/jsonl'
+        )
+    file_extension = 'csv' if file_format == 'csv' else 'jsonl'
+
+    response = StreamingHttpResponse(
+        stream_favourite_words(user.favourite_words.all(), file_format),
+        content_type=content_type
+        )
+    response['Content-Disposition'] = (
+        f'attachment; filename="favourite_words.{file_extension}"'
+        )
+
+    return response
+
+
+@login_required
+@require_POST
+def import_favourite_words(request: HttpRequest) -> HttpResponseRedirect:
+    """
+    Adds the words in an uploaded CSV or JSON Lines file to a user's
+    favourite words
+
+    Takes in a HttpRequest and redirects back to the favourite page
+
+    Parameters
+    ----------
+    request: HttpRequest
+        Contains metadata about the request
+
+    Returns
+    ----------
+    HttpResponseRedirect
+    """
+
+    user = request.user
+
+    form = ImportFavouriteWordsForm(request.POST, request.FILES)
+    if not form.is_valid():
+        messages.error(request, 'Please upload a CSV or JSON file')
+        return redirect('words_app:favourite')
+
+    uploaded_file = form.cleaned_data['favourite_words_file']
+    try:
+        saved = save_favourite_words(
+            user, read_favourite_words_file(uploaded_file)
+            )
+    except ValueError:
+        messages.error(request, 'The file could not be read')
+        return redirect('words_app:favourite')
+
+    messages.success(request, f'Imported {saved} new favourite words')
+    return redirect('words_app:favourite')
+
+
+@login_required
+@require_POST
+def toggle_favourite(request: HttpRequest) -> JsonResponse:
+    """
+    Adds a word to a user's favourite words or removes it
+
+    Takes in a HttpRequest with the 'word' and, optionally, 'favourite'
+    ('true' to add the word, 'false' to remove it) in the POST data and
+    returns a JsonResponse with whether the word is now a favourite.
+    Without 'favourite', the word is toggled
+
+    Parameters
+    ----------
+    request: HttpRequest
+        Contains metadata about the request
+
+    Returns
+    ----------
+    JsonResponse
+    """
+
+    user = request.user
+    user_group = user.groups.all()[0].name
+
+    if user_group == 'Starter':
+        return JsonResponse(
+            {'error': 'Upgrade to Plus or Pro to favourite words'},
+            status=403
+            )
+
+    word = request.POST.get('word', '').strip()
+    max_length = FavouriteWord._meta.get_field('word').max_length
+    if not word or len(word) > max_length:
+        return JsonResponse({'error': 'Invalid word'}, status=400)
+
+    favourite = {'true': True, 'false': False}.get(
+        request.POST.get('favourite', '').lower()
+        )
+
+    return JsonResponse({
+        'word': word,
+        'favourite': toggle_favourite_word(user, word, favourite),
+        })
+
+
 @login_required
 def upgrade_account(
         request: HttpRequest) -> HttpResponse | HttpResponseRedirect:
@@ -314,6 +410,7 @@ def upgrade_account(
 
 
 @login_required
+@throttle_words_api_calls
 def view_word(request: HttpRequest,
               word: str) -> HttpResponse | HttpResponseRedirect:
     """
@@ -339,7 +436,8 @@ def view_word(request: HttpRequest,
     decoded_word = unquote(word)
     get_word = fetch_word(word=decoded_word, get_random_word=False)
     user = request.user
-    user_group = user.groups.all()[0].name
+    # Looked up by 'throttle_words_api_calls'
+    user_group = request.user_group
     # Check if word is in users favourite words
     word_in_user_favourites = (
         user.favourite_words.filter(word=decoded_word).exists()
@@ -350,19 +448,12 @@ def view_word(request: HttpRequest,
         if 'add' in request.POST:
             # Grab value from input type hidden in HTML template
             value = request.POST['add']
-            # Get favourite word or create a new one if it doesn't exist
-            favourite_word, _ = (
-                FavouriteWord.objects.get_or_create(word=value)
-                )
-            user.favourite_words.add(favourite_word)
+            # Creates the favourite word if it doesn't exist
+            toggle_favourite_word(user, value, favourite=True)
             return redirect('words_app:view_word', word=value)
         elif 'remove' in request.POST:
             value = request.POST['remove']
-            favourite_word = FavouriteWord.objects.get(word=value)
-            user.favourite_words.remove(favourite_word)
-            # Check if word is no longer favourited by any user
-            if not favourite_word.users.count():
-                favourite_word.delete()
+            toggle_favourite_word(user, value, favourite=False)
             return redirect('words_app:view_word', word=value)
 
     if request.method == 'GET':
@@ -371,14 +462,40 @@ def view_word(request: HttpRequest,
             user_word = request.GET['search']
             return redirect('words_app:view_word', word=user_word)
 
+        # Keep the synonyms and antonyms for the thesaurus graph
+        queue_thesaurus_relations(get_word)
+
     form = BasicSearchForm()
 
+    # A word that could not be looked up, because the circuit breaker
+    # is open or the call was shed, is not a word that does not exist
+    words_api_unavailable = not get_word and (
+        get_word is None
+        or words_api_breaker.status()['state'] == CircuitBreaker.OPEN
+        )
+
+    # Suggest known words with a similar spelling if the word was not
+    # found. There are no suggestions while the index is being built
+    spelling_index = get_spelling_index()
+    spelling_suggestions = (
+        spelling_index.suggest(decoded_word)
+        if not get_word and not words_api_unavailable
+        and spelling_index is not None else []
+        )
+
     # Process the word data to extract required fields
     (usage_level,
      word,
      syllable_count,
      results_data) = process_word_data(get_word, user_group)
 
+    # Those with a pro account can explore the words related to the word
+    related_words = (
+        get_related_words(word)
+        [:constants.NUM_OF_RELATED_WORDS]
+        if user_group == 'Pro' and word else ()
+        )
+
     # Display the 'upgrade_account' container if there are results
     results_data_first_result = (
         results_data[:1][0]
@@ -397,12 +514,75 @@ def view_word(request: HttpRequest,
         'word_in_user_favourites': word_in_user_favourites,
         'results_data_first_result': results_data_first_result,
         'form': form,
+        'spelling_suggestions': spelling_suggestions,
+        'related_words': related_words,
+        'words_api_unavailable': words_api_unavailable,
     }
+    if words_api_unavailable:
+        # Shows the banner of 'base.html' even if the breaker is closed
+        context['words_api_degraded'] = True
 
     return render(request, 'words_app/view_word.html', context=context)
 
 
 @login_required
+def suggest_words(request: HttpRequest) -> JsonResponse:
+    """
+    Suggests words starting with what the user has typed in the search
+    box, most frequently used words first
+
+    Takes in a HttpRequest with the typed text in the 'q' parameter and
+    returns a JsonResponse
+
+    Parameters
+    ----------
+    request: HttpRequest
+        Contains metadata about the request
+
+    Returns
+    ----------
+    JsonResponse
+    """
+
+    prefix = request.GET.get('q', '')[:BasicSearchForm.max_search_length]
+    suggestions = get_prefix_index().complete(prefix)
+
+    return JsonResponse({'suggestions': suggestions})
+
+
+@login_required
+def search_facets(request: HttpRequest) -> JsonResponse:
+    """
+    Counts the words matching the advanced search form as filled in so
+    far, by number of letters, number of syllables and frequency score
+
+    Takes in a HttpRequest with the advanced search form fields in the
+    querystring and returns a JsonResponse. Fields that are empty or
+    not valid are ignored, so the counts can be shown while the user
+    is still typing
+
+    Parameters
+    ----------
+    request: HttpRequest
+        Contains metadata about the request
+
+    Returns
+    ----------
+    JsonResponse
+    """
+
+    advanced_search_form = AdvancedSearchForm(request.GET)
+    # Only the valid fields are kept in 'cleaned_data'
+    advanced_search_form.is_valid()
+    query = CanonicalQuery(
+        advanced_search_params(advanced_search_form.cleaned_data)
+        )
+
+    return JsonResponse(get_facet_index().counts(query.params))
+
+
+@login_required
+@throttle_words_api_calls
 def random_word(request: HttpRequest
                 ) -> HttpResponse | HttpResponseRedirect:
     """
@@ -421,28 +601,25 @@ def random_word(request: HttpRequest
     """
 
     user = request.user
-    user_group = user.groups.all()[0].name
+    # Looked up by 'throttle_words_api_calls'
+    user_group = request.user_group
 
     get_random_word = fetch_word()
 
     if request.method == 'POST':
         if 'add' in request.POST:
             value = request.POST['add']
-            # Get favourite word or create a new one if it doesn't exist
-            favourite_word, _ = (
-                FavouriteWord.objects.get_or_create(word=value)
-                )
-            user.favourite_words.add(favourite_word)
+            # Creates the favourite word if it doesn't exist
+            toggle_favourite_word(user, value, favourite=True)
             return redirect('words_app:random_word')
         elif 'remove' in request.POST:
             value = request.POST['remove']
-            favourite_word = FavouriteWord.objects.get(word=value)
-            user.favourite_words.remove(favourite_word)
-            # Check if word is no longer favourited by any user
-            if not favourite_word.users.count():
-                favourite_word.delete()
+            toggle_favourite_word(user, value, favourite=False)
             return redirect('words_app:random_word')
 
+    # Keep the synonyms and antonyms for the thesaurus graph
+    queue_thesaurus_relations(get_random_word)
+
     (usage_level,
      word,
      syllable_count,
@@ -470,10 +647,14 @@ def random_word(request: HttpRequest
 
 
 @login_required
-def view_games(request: HttpRequest) -> HttpResponse:
+def view_games(request: HttpRequest) -> HttpResponse | HttpResponseRedirect:
     """
     Displays the games section (available only for 'Pro' account type)
 
+    'Pro' users can play an anagram puzzle, where they find the words
+    hidden in a rack of scrambled letters, unscramble any rack of
+    letters using the anagram solver and find rhymes for a word
+
     Takes in a HttpRequest and renders the games template
 
     Parameters
@@ -483,7 +664,7 @@ def view_games(request: HttpRequest) -> HttpResponse:
 
     Returns
     ----------
-    HttpResponse
+    HttpResponse | HttpResponseRedirect
 
     """
 
@@ -494,9 +675,137 @@ def view_games(request: HttpRequest) -> HttpResponse:
         'user_group': user_group,
     }
 
+    if user_group != 'Pro':
+        return render(request, 'words_app/games.html', context=context)
+
+    # The indexes are built in the background when the server starts
+    # and are None until they are ready
+    anagram_index = get_anagram_index()
+    rhyme_index = get_rhyme_index()
+    context['games_loading'] = anagram_index is None or rhyme_index is None
+    # The puzzle letters and the words found so far
+    puzzle = request.session.get('anagram_puzzle')
+
+    if request.method == 'POST':
+
+        # Check if user wants a new puzzle
+        if 'new_puzzle' in request.POST:
+            request.session.pop('anagram_puzzle', None)
+
+        # Check if user has guessed a word
+        elif 'guess' in request.POST and puzzle and anagram_index is None:
+            messages.info(request, 'The games are still loading. '
+                                   'Please try again in a moment')
+
+        elif 'guess' in request.POST and puzzle:
+            guess_form = AnagramGuessForm(request.POST)
+            if guess_form.is_valid():
+                guess = guess_form.cleaned_data['guess'].strip().lower()
+                if guess in puzzle['found']:
+                    messages.info(request, f'{guess} was already found')
+                elif (len(guess) >= 3
+                      and can_spell(guess, puzzle['letters'])
+                      and guess in anagram_index.anagrams(guess)):
+                    puzzle['found'].append(guess)
+                    request.session['anagram_puzzle'] = puzzle
+                    messages.success(request, f'{guess} is correct!')
+                else:
+                    messages.error(request, f'{guess} is not in the puzzle')
+
+        return redirect('words_app:games')
+
+    if anagram_index is None:
+        puzzle = None
+
+    elif not puzzle:
+        new_puzzle = anagram_index.generate_puzzle()
+        if new_puzzle:
+            puzzle = {'letters': new_puzzle[0], 'found': []}
+            request.session['anagram_puzzle'] = puzzle
+
+    if puzzle:
+        context['puzzle_letters'] = puzzle['letters'].upper()
+        context['puzzle_found'] = puzzle['found']
+        context['puzzle_num_of_solutions'] = (
+            len(anagram_index.sub_anagrams(puzzle['letters']))
+            )
+
+    # Check if user wants to unscramble a rack of letters
+    solver_form = AnagramSolverForm(
+        request.GET if 'letters' in request.GET else None
+        )
+    if (anagram_index is not None
+            and solver_form.is_bound and solver_form.is_valid()):
+        context['solver_results'] = (
+            anagram_index.sub_anagrams(solver_form.cleaned_data['letters'])
+            )
+
+    # Check if user wants to find rhymes for a word
+    rhyme_form = RhymeForm(request.GET if 'rhyme' in request.GET else None)
+    if (rhyme_index is not None
+            and rhyme_form.is_bound and rhyme_form.is_valid()):
+        context['rhyme_results'] = (
+            rhyme_index.rhymes_with(rhyme_form.cleaned_data['rhyme'])
+            )
+
+    context['solver_form'] = solver_form
+    context['guess_form'] = AnagramGuessForm()
+    context['rhyme_form'] = rhyme_form
+
     return render(request, 'words_app/games.html', context=context)
 
 
+@login_required
+def most_favourited(request: HttpRequest) -> HttpResponse:
+    """
+    Lists the words favourited by the most users
+
+    Takes in a HttpRequest and renders the most favourited template.
+    The list is cached for 'constants.MOST_FAVOURITED_CACHE_TIMEOUT'
+    seconds
+
+    Parameters
+    ----------
+    request: HttpRequest
+        Contains metadata about the request
+
+    Returns
+    ----------
+    HttpResponse
+    """
+
+    user = request.user
+    user_group = user.groups.all()[0].name
+
+    context = {
+        'user_group': user_group,
+        'most_favourited_words': get_most_favourited_words(),
+    }
+
+    return render(request,
+                  'words_app/most_favourited.html',
+                  context=context)
+
+
+@login_required
+def most_favourited_api(request: HttpRequest) -> JsonResponse:
+    """
+    Returns the words favourited by the most users as JSON, from the
+    same cache as the most favourited page
+
+    Parameters
+    ----------
+    request: HttpRequest
+        Contains metadata about the request
+
+    Returns
+    ----------
+    JsonResponse
+    """
+
+    return JsonResponse({'words': get_most_favourited_words()})
+
+
 @login_required
 def user_profile(request: HttpRequest) -> HttpResponse:
     """
@@ -522,7 +831,13 @@ def user_profile(request: HttpRequest) -> HttpResponse:
 
     if request.method == 'POST':  # Delete user account
         if 'delete_account' in request.POST:
-            user.delete()
+            with transaction.atomic():
+                # Deleting the user deletes the links to their favourite
+                # words, so they are taken off the counts first
+                user.favourite_words.filter(favourite_count__gt=0).update(
+                    favourite_count=F('favourite_count') - 1
+                    )
+                user.delete()
             return redirect("authenticate:login")
 
     context = {
@@ -534,7 +849,9 @@ def user_profile(request: HttpRequest) -> HttpResponse:
 
 
 @login_required
-def view_words(request, querystring: str) -> HttpResponse:
+@throttle_words_api_calls
+def view_words(request: HttpRequest,
+               querystring: str) -> HttpResponse | HttpResponseRedirect:
     """
     Displays words based on what the user has requested
 
@@ -545,25 +862,34 @@ def view_words(request, querystring: str) -> HttpResponse:
     request: HttpRequest
         Contains metadata about the request
     querystring: str
-        A querystring dictionary converted into a string. This is the
-        data that was sent to the server
+        The search parameters sent to WordsAPI, as a querystring. Other
+        ways of writing the same search are redirected to the canonical
+        querystring
 
     Returns
     ----------
-    HttpResponse
+    HttpResponse | HttpResponseRedirect
 
     """
 
-    user = request.user
-    user_group = user.groups.all()[0].name
-
-    # Decode the dictionary
-    querystring_dict = dict(
-        map(lambda s: s.split('='), unquote(querystring).split('&'))
-        )
-
-    get_data = fetch_word(get_random_word=False,
-                          querystring=querystring_dict)
+    # Looked up by 'throttle_words_api_calls'
+    user_group = request.user_group
+
+    # Put the search in canonical form. The number of results
+    # depends on the user's group, not on the URL
+    query = CanonicalQuery.from_querystring(querystring)
+    query = CanonicalQuery({
+        **query.params,
+        'limit': (constants.NUM_OF_PRO_RESULTS if user_group == 'Pro'
+                  else constants.NUM_OF_PLUS_RESULTS),
+        })
+    if query.querystring != querystring:
+        return redirect('words_app:view_words',
+                        querystring=query.querystring)
+
+    # Word ending searches are answered from the local index and other
+    # searches are cached, so WordsAPI gets each search once
+    get_data = search_words(query)
 
     # Check if there is data
     if not get_data or 'results' not in get_data:
@@ -580,7 +906,7 @@ def view_words(request, querystring: str) -> HttpResponse:
             )
     context = {
         'num_of_results': num_of_results,
-        'querystring': querystring_dict,
+        'querystring': query.params,
         'user_group': user_group,
         'num_of_plus_results': constants.NUM_OF_PLUS_RESULTS,
         'num_of_pro_results': constants.NUM_OF_PRO_RESULTS,
@@ -588,3 +914,31 @@ def view_words(request, querystring: str) -> HttpResponse:
     }
 
     return render(request, 'words_app/view_words.html', context=context)
+
+
+@staff_member_required
+def view_metrics(request: HttpRequest) -> JsonResponse:
+    """
+    Shows staff the metrics recorded by this process, e.g., the bytes
+    saved and CPU time spent compressing the responses of each view,
+    the state of the WordsAPI circuit breaker and the runs of the
+    background jobs
+
+    Takes in a HttpRequest and returns a JsonResponse
+
+    Parameters
+    ----------
+    request: HttpRequest
+        Contains metadata about the request
+
+    Returns
+    ----------
+    JsonResponse
+    """
+
+    return JsonResponse({
+        'metrics': metrics.snapshot(),
+        'words_api_circuit_breaker': words_api_breaker.status(),
+        'words_api_concurrency_limit': words_api_limiter.status(),
+        'jobs': job_statistics(),
+        })
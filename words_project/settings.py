@@ -46,11 +46,21 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Gives each request a correlation ID and traces a share of them
+    'words_app.tracing.TracingMiddleware',
+    # Logs requests that run too many database queries
+    'words_app.middleware.QueryBudgetMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    # Serves the collected static files when DEBUG is off
+    'words_app.middleware.StaticFilesMiddleware',
+    # Compresses the pages with brotli or gzip
+    'words_app.middleware.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    # Profiles the requests of staff users that add '_profile' to the URL
+    'words_app.profiling.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -59,7 +69,9 @@ ROOT_URLCONF = 'words_project.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # My variable: The Django template backend, with the renders
+        # recorded in the request traces
+        'BACKEND': 'words_app.tracing.TracedDjangoTemplates',
         # My variable: Use BASE_DIR to define the templates directory
         'DIRS': [os.path.join(BASE_DIR, 'templates')],
         'APP_DIRS': True,
@@ -69,6 +81,8 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                # Tells the templates when WordsAPI is unavailable
+                'words_app.context_processors.words_api_status',
             ],
         },
     },
@@ -80,13 +94,64 @@ WSGI_APPLICATION = 'words_project.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
 
+# My variable: The tests use a database file rather than SQLite's
+# shared in-memory database, which fails writes from several threads
+# with 'database table is locked' instead of waiting for the lock
+TEST_DATABASE = {
+    'NAME': BASE_DIR / 'test_db.sqlite3',
+}
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'TEST': TEST_DATABASE,
     }
 }
 
+# My variable: Set WORDS_DB_PROFILE=production to use the production
+# database profile. It puts SQLite in WAL mode so readers are not
+# blocked by writers (e.g., favourite toggles and cache writes), tunes
+# the SQLite PRAGMAs, keeps connections open between requests and
+# sends read queries to a separate read-only connection
+# See words_app/database.py
+DB_PROFILE = os.getenv('WORDS_DB_PROFILE', 'development')
+
+if DB_PROFILE == 'production':
+    SQLITE_PRAGMAS = {
+        'journal_mode': 'wal',
+        # Safe in WAL mode: commits are only synced at checkpoints
+        'synchronous': 'normal',
+        # Negative values are in KiB, i.e., a 64 MB page cache
+        'cache_size': -64000,
+        # Read the database file through a 256 MB memory map
+        'mmap_size': 268435456,
+        'temp_store': 'memory',
+        # Wait up to 5 seconds for a write lock instead of failing
+        'busy_timeout': 5000,
+    }
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+            'CONN_MAX_AGE': 600,
+            'CONN_HEALTH_CHECKS': True,
+            'PRAGMAS': SQLITE_PRAGMAS,
+            'TEST': TEST_DATABASE,
+        },
+        'replica': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+            'CONN_MAX_AGE': 600,
+            'CONN_HEALTH_CHECKS': True,
+            'PRAGMAS': {**SQLITE_PRAGMAS, 'query_only': 'on'},
+            'TEST': {
+                'MIRROR': 'default',
+            },
+        },
+    }
+    DATABASE_ROUTERS = ['words_app.database.ReadReplicaRouter']
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
@@ -125,6 +190,24 @@ USE_TZ = True
 STATIC_URL = 'static/'
 # My variable: Include the static directory
 STATICFILES_DIRS = [BASE_DIR / "static"]
+# My variable: Folder 'python manage.py collectstatic' copies the static
+# files to
+STATIC_ROOT = BASE_DIR / 'staticfiles'
+
+# My variable: When DEBUG is off, collectstatic adds a content hash to
+# the name of each static file and writes gzip/brotli copies of the
+# text files, which are served with far-future cache headers
+# See words_app/storage.py
+if not DEBUG:
+    STORAGES = {
+        'default': {
+            'BACKEND': 'django.core.files.storage.FileSystemStorage',
+        },
+        'staticfiles': {
+            'BACKEND':
+                'words_app.storage.CompressedManifestStaticFilesStorage',
+        },
+    }
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field
@@ -139,6 +222,47 @@ LOGIN_REDIRECT_URL = 'words_app:index'
 
 WORDS_API_KEY = os.getenv('WORDS_API_KEY')  # Get environment variable
 
+# My variable: When WordsAPI fails or is slow this many times in its
+# recent calls, stop calling it for a while and show cached data
+# See words_app/circuit_breaker.py
+WORDS_API_CIRCUIT_BREAKER = {
+    # Failed or slow calls, out of the last WINDOW calls, that trip it
+    'FAILURE_THRESHOLD': 5,
+    'WINDOW': 20,
+    # Calls slower than this many seconds count as failed
+    'SLOW_CALL_SECONDS': 3,
+    # Seconds to wait before trying WordsAPI again
+    'RESET_TIMEOUT': 30,
+}
+
+# My variable: Limits the WordsAPI calls in flight in each process. The
+# limit grows while calls stay fast and shrinks when they slow down.
+# Calls over the limit wait up to QUEUE_TIMEOUT seconds, then fall back
+# to cached or local data. See words_app/concurrency.py
+WORDS_API_CONCURRENCY_LIMIT = {
+    'INITIAL_LIMIT': 8,
+    'MIN_LIMIT': 1,
+    'MAX_LIMIT': 32,
+    # Calls slower than this many times the fastest recent call are a
+    # sign WordsAPI is overloaded
+    'LATENCY_TOLERANCE': 2,
+    'BACKOFF_RATIO': 0.9,
+    'QUEUE_TIMEOUT': 2,
+}
+
+# My variable: Local word list used by the games page
+# See words_app/lexicon.py for the file format
+WORDS_LEXICON_PATH = os.getenv('WORDS_LEXICON_PATH',
+                               BASE_DIR / 'lexicon.tsv')
+# Binary copy of the lexicon shared by the server processes through
+# mmap. Build it with: python manage.py build_lexicon_snapshot
+WORDS_LEXICON_SNAPSHOT_PATH = os.getenv('WORDS_LEXICON_SNAPSHOT_PATH',
+                                        BASE_DIR / 'lexicon.snapshot')
+# Only the most frequent words are used for spelling suggestions, which
+# bounds the memory and start up time of the spelling index
+SPELLING_INDEX_MAX_WORDS = int(os.getenv('SPELLING_INDEX_MAX_WORDS',
+                                         100000))
+
 # My variable: Configure caching using database cache backend
 # Run python manage.py createcachetable
 # Creates 3 columns: cache_key, value, expires
@@ -148,7 +272,70 @@ CACHES = {
         # Cache is only valid for duration of the server process
         # 'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
         # 'word_of_today_cache_table' will store the cache data
-        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        # The database cache, with its operations recorded in the
+        # request traces
+        'BACKEND': 'words_app.tracing.TracedDatabaseCache',
         'LOCATION': 'word_of_today_cache_table',
     }
 }
+
+# My variable: Maximum number of database queries a request should run,
+# and how many times the same query may be run, before a warning is
+# logged by 'words_app.middleware.QueryBudgetMiddleware'. The most
+# measured is 18, by the index page when the word of the day is not
+# cached yet (see 'ViewQueryBudgetTests' in words_app/tests.py)
+QUERY_BUDGET = {
+    'MAX_QUERIES': 20,
+    'MAX_REPEATS': 1,
+}
+
+# My variable: Log warnings from the words app to the console, with
+# the correlation ID of the request they were logged for
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'filters': {
+        'request_id': {
+            '()': 'words_app.tracing.RequestIdFilter',
+        },
+    },
+    'formatters': {
+        'request_id': {
+            'format': '[{request_id}] {message}',
+            'style': '{',
+        },
+    },
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+            'filters': ['request_id'],
+            'formatter': 'request_id',
+        },
+    },
+    'loggers': {
+        'words_app': {
+            'handlers': ['console'],
+            'level': 'INFO',
+        },
+    },
+}
+
+# My variable: Share of the requests traced through the database, cache,
+# templates and WordsAPI calls, from 0 to 1. The spans are written as
+# JSON lines to 'FILE' and/or posted to an OpenTelemetry collector at
+# 'OTLP_ENDPOINT' (OTLP/HTTP JSON). Nothing is traced if neither is set.
+# The 'sampled' flag of a 'traceparent' header is only followed for the
+# addresses or networks in 'TRUSTED_UPSTREAMS', comma separated
+# See words_app/tracing.py
+TRACING = {
+    'SAMPLE_RATE': float(os.getenv('TRACING_SAMPLE_RATE', 0.01)),
+    'FILE': os.getenv('TRACING_FILE'),
+    'OTLP_ENDPOINT': os.getenv('TRACING_OTLP_ENDPOINT'),
+    'TRUSTED_UPSTREAMS': os.getenv('TRACING_TRUSTED_UPSTREAMS',
+                                   '').split(','),
+    'SERVICE_NAME': 'word-wizards',
+}
+
+# My variable: Folder the reports of requests profiled with
+# '?_profile=save' are saved to. See words_app/profiling.py
+PROFILING_DIRECTORY = os.getenv('PROFILING_DIRECTORY', BASE_DIR / 'profiles')
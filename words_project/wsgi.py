@@ -14,3 +14,17 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'words_project.settings')
 
 application = get_wsgi_application()
+
+# Build the spelling, anagram and rhyme indexes and load the thesaurus
+# graph before the first request needs them. When the workers are forked
+# from this process (gunicorn --preload), they use what was built before
+# the fork and start again what was still being built
+from words_app.games import warm_anagram_index  # noqa: E402
+from words_app.rhymes import warm_rhyme_index  # noqa: E402
+from words_app.suggestions import warm_spelling_index  # noqa: E402
+from words_app.thesaurus import reload_thesaurus_graph  # noqa: E402
+
+warm_spelling_index()
+warm_anagram_index()
+warm_rhyme_index()
+reload_thesaurus_graph()